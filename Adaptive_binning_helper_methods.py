@@ -0,0 +1,224 @@
+import numpy as np
+#Both distributions below answer the same two questions (how much is below x, and where is a given amount reached) in O(log n),
+#so a binning with nbins bins is found in O(nbins log n) without histogramming anything again
+
+
+class Sorted_sample(object):
+    def __init__(self, samples, areas=None, weights=None, lowerlim=-np.inf, upperlim=np.inf):
+        """The yield of one or more samples put together, sorted once so that any binning can be read off of it.
+        Each sample is scaled to its area the same way the template classes scale them, so the yields are the ones the templates will have.
+
+        Parameters
+        ----------
+        samples : list[array_like]
+            The samples (i.e. every background)
+        areas : list[float], optional
+            The area to scale each sample to, by default None (which leaves them unscaled)
+        weights : list[array_like], optional
+            The per-event weights of each sample (or None for an unweighted one), by default None
+        lowerlim : float, optional
+            The lower limit of the range, by default -inf
+        upperlim : float, optional
+            The upper limit of the range, by default inf
+
+        Raises
+        ------
+        ValueError
+            If any weight is negative, since the yield has to grow monotonically to be inverted
+        """
+        values = []
+        yields = []
+        for n, sample in enumerate(samples):
+            sample = np.asarray(sample, dtype=float)
+            sample_weights = np.ones(len(sample)) if weights is None or weights[n] is None else np.asarray(weights[n], dtype=float)
+            keep = (sample >= lowerlim) & (sample <= upperlim)
+            sample, sample_weights = sample[keep], sample_weights[keep]
+            if np.any(sample_weights < 0):
+                raise ValueError("Negative weights cannot be used to find a binning!")
+            if areas is not None and np.sum(sample_weights) > 0:
+                sample_weights = sample_weights*areas[n]/np.sum(sample_weights)
+            values.append(sample)
+            yields.append(sample_weights)
+
+        values = np.concatenate(values)
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        self.cumulative_yields = np.cumsum(np.concatenate(yields)[order]) #the yield up to and including each event
+        self.total = float(self.cumulative_yields[-1]) if len(self.values) else 0.0
+
+    def cumulative(self, x):
+        """The yield of every event below some values
+
+        Parameters
+        ----------
+        x : Union[float, array_like]
+            The values
+
+        Returns
+        -------
+        Union[float, numpy.ndarray]
+            The yield strictly below each value (i.e. what a bin starting at the lowest edge and ending there holds)
+        """
+        below = np.searchsorted(self.values, x, side='left')
+        return np.where(below > 0, self.cumulative_yields[np.maximum(below - 1, 0)], 0.0) if len(self.values) else np.zeros_like(x, dtype=float)
+
+    def quantile(self, y):
+        """Where some yields are reached. Each edge is put halfway between the event that reaches the yield and the next larger value,
+        so that a bin ending at the edge holds at least that yield. If no event has a larger value, the edge is at infinity.
+
+        Parameters
+        ----------
+        y : Union[float, array_like]
+            The yields
+
+        Returns
+        -------
+        Union[float, numpy.ndarray]
+            The edge for each yield
+        """
+        reached = np.minimum(np.searchsorted(self.cumulative_yields, y, side='left'), len(self.values) - 1)
+        after = np.searchsorted(self.values, self.values[reached], side='right') #skips past events that share the value
+        larger = self.values[np.minimum(after, len(self.values) - 1)]
+        return np.where(after < len(self.values), (self.values[reached] + larger)/2, np.inf) #an edge on the last value would leave it out of the bin
+
+
+class Quantile_sketch(object):
+    def __init__(self, counts, edges):
+        """A streaming stand-in for Sorted_sample when the samples do not fit in memory: a finely binned histogram of them
+        (i.e. one accumulated with Template_helper_methods.accumulate_branch_from_TTree), with the yield taken to be spread evenly inside each fine bin.
+        Edges found with it are accurate to the width of a fine bin.
+
+        Parameters
+        ----------
+        counts : array_like
+            The counts of the fine histogram
+        edges : array_like
+            The bin edges of the fine histogram
+        """
+        counts = np.asarray(counts, dtype=float)
+        if np.any(counts < 0):
+            raise ValueError("Negative weights cannot be used to find a binning!")
+        self.edges = np.asarray(edges, dtype=float)
+        self.cumulative_yields = np.concatenate([[0.0], np.cumsum(counts)]) #the yield up to each fine edge
+        self.total = float(self.cumulative_yields[-1])
+
+    @classmethod
+    def combine(cls, sketches, areas=None):
+        """Puts the sketches of several samples together, each scaled to its area a la Sorted_sample
+
+        Parameters
+        ----------
+        sketches : list[Quantile_sketch]
+            The sketches, which must share their fine binning
+        areas : list[float], optional
+            The area to scale each sketch to, by default None (which leaves them unscaled)
+
+        Returns
+        -------
+        Quantile_sketch
+            The sketch of all of them together
+        """
+        counts = np.zeros(len(sketches[0].edges) - 1, dtype=float)
+        for n, sketch in enumerate(sketches):
+            if not np.array_equal(sketch.edges, sketches[0].edges):
+                raise ValueError("Only sketches with the same binning can be combined!")
+            sketch_counts = np.diff(sketch.cumulative_yields)
+            if areas is not None and sketch.total > 0:
+                sketch_counts = sketch_counts*areas[n]/sketch.total
+            counts += sketch_counts
+        return cls(counts, sketches[0].edges)
+
+    def cumulative(self, x):
+        """The yield below some values
+
+        Parameters
+        ----------
+        x : Union[float, array_like]
+            The values
+
+        Returns
+        -------
+        Union[float, numpy.ndarray]
+            The yield below each value
+        """
+        return np.interp(x, self.edges, self.cumulative_yields)
+
+    def quantile(self, y):
+        """Where some yields are reached
+
+        Parameters
+        ----------
+        y : Union[float, array_like]
+            The yields
+
+        Returns
+        -------
+        Union[float, numpy.ndarray]
+            The value at which each yield is reached
+        """
+        fine_bin = np.clip(np.searchsorted(self.cumulative_yields, y, side='left'), 1, len(self.edges) - 1) #the fine bin each yield is reached in
+        below, above = self.cumulative_yields[fine_bin - 1], self.cumulative_yields[fine_bin]
+        fraction = np.divide(y - below, above - below, out=np.ones_like(above), where=above > below)
+        return self.edges[fine_bin - 1] + np.clip(fraction, 0, 1)*(self.edges[fine_bin] - self.edges[fine_bin - 1])
+
+
+def equal_yield_edges(distribution, nbins, lowerlim, upperlim):
+    """Finds the bin edges that split the yield of a distribution evenly
+
+    Parameters
+    ----------
+    distribution : Union[Sorted_sample, Quantile_sketch]
+        The yield to split up (i.e. every background put together)
+    nbins : int
+        The number of bins you want. There may be fewer if too many events share a value.
+    lowerlim : float
+        The lower limit of the range
+    upperlim : float
+        The upper limit of the range
+
+    Returns
+    -------
+    numpy.ndarray
+        The bin edges, starting at lowerlim and ending at upperlim
+    """
+    start, end = distribution.cumulative(lowerlim), distribution.cumulative(upperlim)
+    if end <= start:
+        return np.array([lowerlim, upperlim], dtype=float)
+    inner = distribution.quantile(start + (end - start)*np.arange(1, nbins)/nbins)
+    inner = inner[(inner > lowerlim) & (inner < upperlim)]
+    return np.unique(np.concatenate([[lowerlim], inner, [upperlim]]))
+
+def min_count_edges(distribution, min_count, lowerlim, upperlim):
+    """Finds the finest bin edges that give every bin at least some yield. Bins are made from lowerlim upwards,
+    and whatever is left at the end that is too little for a bin of its own is merged into the last bin.
+
+    Parameters
+    ----------
+    distribution : Union[Sorted_sample, Quantile_sketch]
+        The yield to bin (i.e. every background put together)
+    min_count : float
+        The least yield a bin can have
+    lowerlim : float
+        The lower limit of the range
+    upperlim : float
+        The upper limit of the range
+
+    Returns
+    -------
+    numpy.ndarray
+        The bin edges, starting at lowerlim and ending at upperlim
+    """
+    if min_count <= 0:
+        raise ValueError("The minimum count per bin should be positive!")
+    edges = [lowerlim]
+    reached = float(distribution.cumulative(lowerlim))
+    end = float(distribution.cumulative(upperlim))
+    while end - reached >= 2*min_count: #there is room for this bin and at least one more after it
+        edge = float(distribution.quantile(reached + min_count))
+        after = float(distribution.cumulative(edge)) #events can pile up on a value, so this may be more than min_count on
+        if edge <= edges[-1] or edge >= upperlim or end - after < min_count:
+            break
+        edges.append(edge)
+        reached = after
+    edges.append(upperlim)
+    return np.array(edges, dtype=float)
@@ -1,272 +1,311 @@
-def addhzzbr(lines,processes):
-    line = "hzz_br lnN"
-    for pr in processes :
-        if "back" not in pr : 
-            line =  line + " 1.02"
-        else :
-             line = line + " -"
-    
-    lines.append(line)    
-    
+import numpy as np
 
+# Every lnN (and friends) systematic lives in this table as (systematic, process pattern, category, value) rules.
+# A process takes the value of the first pattern it matches, in the order the patterns first appear for that systematic.
+# Patterns are substrings of the process name, "!pattern" matches processes that do not contain it, and "*" matches everything.
+# A rule with a category only applies to categories containing it (every one that does is written), and None applies to all.
+# A process that matches no pattern gets nothing written for it.
+SYSTEMATIC_RULES = [
+    ("hzz_br", "!back", None, "1.02"),
+    ("hzz_br", "*", None, "-"),
 
-def addlumi(lines,processes):
-    """_summary_
+    #taken from https://twiki.cern.ch/twiki/bin/view/CMS/TWikiLUM#SummaryTable
+    #inclusive lumi
+    ("lumi_13TeV", "*", None, "1.016/0.984"),
+    ("lumi_13TeV_2016", "*", None, "1.0082/0.9918"),
+    ("lumi_13TeV_2017", "*", None, "1.0088/0.9912"),
+    ("lumi_13TeV_2018", "*", None, "1.0106/0.9894"),
+
+    ("QCDscale_muR_ggH", "ggH", None, "1.07110716651/0.906525580474"),
+    ("QCDscale_muR_ggH", "*", None, "-"),
+    ("QCDscale_muR_qqH", "qqH", None, "0.990706673021/1.00745328795"),
+    ("QCDscale_muR_qqH", "*", None, "-"),
+    ("QCDscale_muF_ggH", "ggH", None, "0.980003776978/1.01624735028"),
+    ("QCDscale_muF_ggH", "*", None, "-"),
+    ("QCDscale_muF_qqH", "qqH", None, "1.003290476/1.00409718125"),
+    ("QCDscale_muF_qqH", "*", None, "-"),
+
+    ("CMS_eff_mu", "!back_qqZZ", None, "1.0191/0.9799"),
+    ("CMS_eff_mu", "*", None, "-"),
+    ("CMS_eff_e", "!back_qqZZ", None, "1.0584/0.9383"),
+    ("CMS_eff_e", "*", None, "-"),
+
+    ("EWcorr_qqZZ", "back_qqZZ", None, "0.99900110477/1.0009987799"),
+    ("EWcorr_qqZZ", "*", None, "-"),
+
+    ("kf_ggZZ_back", "back_ggZZ", None, "1.1/0.9"),
+    ("kf_ggZZ_back", "offggH_g11g21", None, "1.032/0.968"),
+    ("kf_ggZZ_back", "*", None, "-"),
+
+    ("CMS_pythia_tune", "offggH", "Untagged", "0.9985/1.0032"),
+    ("CMS_pythia_tune", "offggH", "VHtagged", "1.0075/0.9973"),
+    ("CMS_pythia_tune", "offggH", "VBFtagged", "1.0105/0.9967"),
+    ("CMS_pythia_tune", "offqqH_0PM", "Untagged", "0.9990/1.0004"),
+    ("CMS_pythia_tune", "offqqH_0PM", "VHtagged", "0.9875/1.0151"),
+    ("CMS_pythia_tune", "offqqH_0PM", "VBFtagged", "1.0021/0.9988"),
+    ("CMS_pythia_tune", "*", None, "-"),
+
+    #Derived here :
+    #/afs/cern.ch/work/s/skyriaco/Offshell_trees/TreeEditor/TempMaker_aug15/background/PythiaScaleTest/plots
+    ("CMS_pythia_scale", "back_qqZZ", "Untagged", "0.9985/1.0007"),
+    ("CMS_pythia_scale", "back_qqZZ", "VHtagged", "1.0405/0.9936"),
+    ("CMS_pythia_scale", "back_qqZZ", "VBFtagged", "1.0258/0.9603"),
+    #all vbf uncert derived here:
+    #/afs/cern.ch/work/s/skyriaco/Offshell_trees/TreeEditor/TempMaker_aug15/VBF_filebased/PythiaScale/plots
+    ("CMS_pythia_scale", "offqqH_0PM", "Untagged", "0.9914/1.0388"),
+    ("CMS_pythia_scale", "offqqH_0PM", "VHtagged", "1.0020/0.9489"),
+    ("CMS_pythia_scale", "offqqH_0PM", "VBFtagged", "1.011/0.9543"),
+    ("CMS_pythia_scale", "offqqH", "Untagged", "0.9921/1.0306"), #offqqH_0PM has already been caught above
+    ("CMS_pythia_scale", "offqqH", "VHtagged", "1.0103/0.9645"),
+    ("CMS_pythia_scale", "offqqH", "VBFtagged", "1.0082/0.9680"),
+    ("CMS_pythia_scale", "back_VVZZ", "Untagged", "0.9987/1.0046"),
+    ("CMS_pythia_scale", "back_VVZZ", "VHtagged", "1.0057/0.9180"),
+    ("CMS_pythia_scale", "back_VVZZ", "VBFtagged", "0.9910/1.00005"),
+    #derived using high mass samples here:
+    #/afs/cern.ch/work/s/skyriaco/Offshell_trees/TreeEditor/testCat/cat_jul20/PythiaScale/ggF/MC18/plots
+    ("CMS_pythia_scale", "offggH", "Untagged", "1.0075/0.9934"),
+    ("CMS_pythia_scale", "offggH", "VHtagged", "0.90276/1.0945"),
+    ("CMS_pythia_scale", "offggH", "VBFtagged", "0.8755/1.1328"),
+
+    ("kfas_ew", "offqqH", None, "1.0065/0.993500"),
+    ("kfas_ew", "*", None, "-"),
+    ("kfpdf_ew", "offqqH", None, "1.0189/0.9811"),
+    ("kfpdf_ew", "*", None, "-"),
+    ("kfqcd_ew", "offqqH", None, "1.0133/0.992"),
+    ("kfqcd_ew", "*", None, "-"),
+]
+# CMS_pythia_scale as a complete lnN line (the legacy one above leaves out the processes it has no value for, as add_pythiascale always has),
+# which is what category-dependent datacards use
+SYSTEMATIC_RULES += [("CMS_pythia_scale_lnN",) + rule[1:] for rule in SYSTEMATIC_RULES if rule[0] == "CMS_pythia_scale"]
+SYSTEMATIC_RULES.append(("CMS_pythia_scale_lnN", "*", None, "-"))
+
+# The start of each systematic's line in the datacard
+SYSTEMATIC_HEADERS = {
+    "hzz_br": "hzz_br lnN",
+    "lumi_13TeV": "lumi_13TeV lnN",
+    "lumi_13TeV_2016": "lumi_13TeV_2016 lnN",
+    "lumi_13TeV_2017": "lumi_13TeV_2017 lnN",
+    "lumi_13TeV_2018": "lumi_13TeV_2018 lnN",
+    "QCDscale_muR_ggH": "QCDscale_muF_qqH lnN", #this is what the line has always been called
+    "QCDscale_muR_qqH": "QCDscale_muR_qqH lnN",
+    "QCDscale_muF_ggH": "QCDscale_muF_ggH lnN",
+    "QCDscale_muF_qqH": "QCDscale_muF_qqH lnN",
+    "CMS_eff_mu": "CMS_eff_mu lnN",
+    "CMS_eff_e": "CMS_eff_e lnN",
+    "EWcorr_qqZZ": "EWcorr_qqZZ lnN",
+    "kf_ggZZ_back": "kf_ggZZ_back lnN",
+    "CMS_pythia_tune": "CMS_pythia_tune lnN",
+    "CMS_pythia_scale": "CMS_pythia_scale ?",
+    "CMS_pythia_scale_lnN": "CMS_pythia_scale lnN",
+    "kfas_ew": "kfas_ew lnN",
+    "kfpdf_ew": "kfpdf_ew lnN",
+    "kfqcd_ew": "kfqcd_ew lnN",
+}
+
+
+class Systematics_matcher(object):
+    def __init__(self, rules=SYSTEMATIC_RULES, headers=SYSTEMATIC_HEADERS):
+        """Compiles a table of systematic rules once, so that whole blocks of datacard lines can be made from it for any list of processes
+
+        Parameters
+        ----------
+        rules : list[tuple[str, str, Union[str, None], str]]
+            (systematic, process pattern, category, value) rules, a la SYSTEMATIC_RULES
+        headers : dict[str, str]
+            The start of each systematic's line, a la SYSTEMATIC_HEADERS
+        """
+        self.headers = dict(headers)
+        self.systematics = {} #systematic -> [(pattern, [(category, value), ...]), ...] with the patterns in order
+        for systematic, pattern, category, value in rules:
+            patterns = self.systematics.setdefault(systematic, [])
+            for existing, values in patterns:
+                if existing == pattern:
+                    values.append((category, value))
+                    break
+            else:
+                patterns.append((pattern, [(category, value)]))
+
+        self.patterns = list(dict.fromkeys(pattern.lstrip('!') for patterns in self.systematics.values() for pattern, _ in patterns if pattern != "*"))
+        self._tokens = {} #(systematic, category) -> the text each pattern writes, with the text for no match at the end
+
+    def tokens(self, systematic, category=""):
+        """Works out what each of a systematic's patterns writes for a process in a category
+
+        Parameters
+        ----------
+        systematic : str
+            The name of the systematic
+        category : str, optional
+            The category of the datacard, by default ""
+
+        Returns
+        -------
+        numpy.ndarray
+            The text written for each pattern, followed by "" for processes that match none of them
+        """
+        key = (systematic, category)
+        if key not in self._tokens:
+            tokens = ["".join(" " + value for rule_category, value in values if rule_category is None or rule_category in category)
+                      for _, values in self.systematics[systematic]]
+            self._tokens[key] = np.array(tokens + [""], dtype=object)
+        return self._tokens[key]
+
+    def match(self, processes, patterns=None):
+        """Checks every process against every pattern in the table
+
+        Parameters
+        ----------
+        processes : Iterable[str]
+            The processes in the datacard, in order
+        patterns : Iterable[str], optional
+            The patterns to check, by default None (which checks all of them)
+
+        Returns
+        -------
+        dict[str, numpy.ndarray]
+            For each pattern, whether each process contains it
+        """
+        processes = list(processes)
+        if patterns is None:
+            patterns = self.patterns
+        return {pattern: np.fromiter((pattern in process for process in processes), dtype=bool, count=len(processes)) for pattern in patterns}
+
+    def lines(self, processes, systematics, category=""):
+        """Makes the datacard lines for a block of systematics
+
+        Parameters
+        ----------
+        processes : Iterable[str]
+            The processes in the datacard, in order
+        systematics : Iterable[str]
+            The names of the systematics you want lines for
+        category : str, optional
+            The category of the datacard (i.e. "Untagged", "VBFtagged" or "VHtagged"), by default ""
+
+        Returns
+        -------
+        list[str]
+            One line per systematic, in the order they were asked for
+        """
+        processes = list(processes)
+        systematics = list(systematics)
+        patterns = dict.fromkeys(pattern.lstrip('!') for systematic in systematics for pattern, _ in self.systematics[systematic] if pattern != "*")
+        matches = self.match(processes, patterns) #each pattern is only checked once, however many systematics use it
+        everything = np.ones(len(processes), dtype=bool)
+
+        lines = []
+        for systematic in systematics:
+            conditions = []
+            for pattern, _ in self.systematics[systematic]:
+                if pattern == "*":
+                    conditions.append(everything)
+                elif pattern[0] == '!':
+                    conditions.append(~matches[pattern[1:]])
+                else:
+                    conditions.append(matches[pattern])
+            tokens = self.tokens(systematic, category)
+            choice = np.select(conditions, np.arange(len(conditions)), default=len(conditions)) #the first pattern each process matches
+            lines.append(self.headers[systematic] + "".join(tokens[choice]))
+        return lines
+
+    def line(self, systematic, processes, category=""):
+        """Makes the datacard line for a single systematic
+
+        Parameters
+        ----------
+        systematic : str
+            The name of the systematic
+        processes : Iterable[str]
+            The processes in the datacard, in order
+        category : str, optional
+            The category of the datacard, by default ""
+
+        Returns
+        -------
+        str
+            The line
+        """
+        return self.lines(processes, [systematic], category)[0]
+
+
+SYSTEMATICS = Systematics_matcher()
+
+
+def add_systematics(lines, processes, systematics, category=""):
+    """Appends the lines for a whole block of systematics in one pass
 
     Parameters
     ----------
     lines : list
-        _description_
+        The lines of the datacard to append to
     processes : iterable
-        _description_
+        The processes in the datacard, in order
+    systematics : iterable
+        The names of the systematics in SYSTEMATIC_RULES that you want
+    category : str, optional
+        The category of the datacard, by default ""
     """
-    line = "lumi_13TeV lnN"
-    for pr in processes :
-        line =  line + " 1.016/0.984" 
-    #line = line + " \n"
-    #taken from https://twiki.cern.ch/twiki/bin/view/CMS/TWikiLUM#SummaryTable
-    #inclusive lumi
-    lines.append(line)    
+    lines.extend(SYSTEMATICS.lines(processes, systematics, category))
 
+def addhzzbr(lines,processes):
+    add_systematics(lines, processes, ["hzz_br"])
 
+def addlumi(lines,processes):
+    """Appends the inclusive luminosity line
+
+    Parameters
+    ----------
+    lines : list
+        The lines of the datacard to append to
+    processes : iterable
+        The processes in the datacard, in order
+    """
+    add_systematics(lines, processes, ["lumi_13TeV"])
 
 def addlumi16(lines,processes):
-    line = "lumi_13TeV_2016 lnN"
-    for pr in processes :
-        line =  line + " 1.0082/0.9918" 
-    #line = line + " \n"
-    #taken from https://twiki.cern.ch/twiki/bin/view/CMS/TWikiLUM#SummaryTable
-    #inclusive lumi
-    lines.append(line)    
+    add_systematics(lines, processes, ["lumi_13TeV_2016"])
 
 def addlumi17(lines,processes):
-    line = "lumi_13TeV_2017 lnN"
-    for pr in processes :
-        line =  line + " 1.0088/0.9912" 
-    #line = line + " \n"
-    #taken from https://twiki.cern.ch/twiki/bin/view/CMS/TWikiLUM#SummaryTable
-    #inclusive lumi
-    lines.append(line)    
+    add_systematics(lines, processes, ["lumi_13TeV_2017"])
 
 def addlumi18(lines,processes):
-    line = "lumi_13TeV_2018 lnN"
-    for pr in processes :
-        line =  line + " 1.0106/0.9894" 
-    #line = line + " \n"
-    #taken from https://twiki.cern.ch/twiki/bin/view/CMS/TWikiLUM#SummaryTable
-    #inclusive lumi
-    lines.append(line)    
+    add_systematics(lines, processes, ["lumi_13TeV_2018"])
 
-
-
-    
 def addQCDscale_muR_ggH(lines,processes):
-    line = "QCDscale_muF_qqH lnN"
-    for pr in processes :
-        if "ggH" in pr : 
-            line =  line + " 1.07110716651/0.906525580474"
-        else :
-             line = line + " -"
-    #line = line + " \n"    
-    lines.append(line)
-
+    add_systematics(lines, processes, ["QCDscale_muR_ggH"])
 
-    
 def addQCDscale_muR_qqH(lines,processes):
-    line = "QCDscale_muR_qqH lnN"
-    for pr in processes :
-        if "qqH" in pr : 
-            line =  line + " 0.990706673021/1.00745328795"
-        else :
-             line = line + " -"
-    #line = line + " \n"    
-    lines.append(line)
+    add_systematics(lines, processes, ["QCDscale_muR_qqH"])
 
 def addQCDscale_muF_ggH(lines,processes):
-    line = "QCDscale_muF_ggH lnN"
-    for pr in processes :
-        if "ggH" in pr : 
-            line =  line + " 0.980003776978/1.01624735028"
-        else :
-             line = line + " -"
-    #line = line + " \n"    
-    lines.append(line)
+    add_systematics(lines, processes, ["QCDscale_muF_ggH"])
 
-
-    
 def addQCDscale_muF_qqH(lines,processes):
-    line = "QCDscale_muF_qqH lnN"
-    for pr in processes :
-        if "qqH" in pr : 
-            line =  line + " 1.003290476/1.00409718125"
-        else :
-             line = line + " -"
-    #line = line + " \n"    
-    lines.append(line)
-
+    add_systematics(lines, processes, ["QCDscale_muF_qqH"])
 
 def addCMS_EFF_mu(lines,processes):
-    line = "CMS_eff_mu lnN"
-    
-    for pr in processes :
-        if "back_qqZZ" not in pr:  
-            line = line + " 1.0191/0.9799"
-        else :
-            line = line + " -"
-    lines.append(line)
-        
-def addCMS_EFF_e(lines,processes):
-    line = "CMS_eff_e lnN"
-    
-    for pr in processes :
-        if "back_qqZZ" not in pr:  
-            line = line + " 1.0584/0.9383"
-        else :
-            line = line + " -"    
-    lines.append(line)
-        
+    add_systematics(lines, processes, ["CMS_eff_mu"])
 
+def addCMS_EFF_e(lines,processes):
+    add_systematics(lines, processes, ["CMS_eff_e"])
 
 def addEWcorr_qqZZ(lines,processes):
-    line = "EWcorr_qqZZ lnN"
-    for pr in processes :
-        if "back_qqZZ" in pr : 
-            line =  line + " 0.99900110477/1.0009987799"
-        else :
-            line = line + " -"
-    #line = line + " \n"    
-    lines.append(line)
-
+    add_systematics(lines, processes, ["EWcorr_qqZZ"])
 
 def addkf_ggZZ_background(lines,processes):
-    line = "kf_ggZZ_back lnN"
-    for pr in processes :
-        if "back_ggZZ" in pr : 
-            line =  line + " 1.1/0.9"
-        elif  "offggH_g11g21" in pr:
-
-            line =  line + " 1.032/0.968"
-        else:     
-            line = line + " -"
-    #line = line + " \n"    
-    lines.append(line)
+    add_systematics(lines, processes, ["kf_ggZZ_back"])
 
 def add_pythiatune(lines,processes,category):
-    line = "CMS_pythia_tune lnN"
-    for pr in processes :
-        if "offggH" in pr: 
-            if "Untagged" in category :
-                line =  line + " 0.9985/1.0032"
-            if "VHtagged" in category :
-                line = line + " 1.0075/0.9973"
-            if "VBFtagged" in category :
-                line = line + " 1.0105/0.9967"
-        elif "offqqH_0PM" in pr : 
-            if "Untagged" in category :
-                line =  line + " 0.9990/1.0004"
-            if "VHtagged" in category :
-                line = line + " 0.9875/1.0151"
-            if "VBFtagged" in category :
-                line = line + " 1.0021/0.9988"
-        else:     
-            line = line + " -"
-
-    lines.append(line)
-
+    add_systematics(lines, processes, ["CMS_pythia_tune"], category)
 
 def add_pythiascale(lines,processes,category):
-    line = "CMS_pythia_scale ?"
-    for pr in processes :
-
-
-        if "back_qqZZ" in pr: 
-            #Derived here : 
-            #/afs/cern.ch/work/s/skyriaco/Offshell_trees/TreeEditor/TempMaker_aug15/background/PythiaScaleTest/plots
-
-            if "Untagged" in category :
-                line =  line + " 0.9985/1.0007"
-            if "VHtagged" in category :
-                line = line + " 1.0405/0.9936"
-            if "VBFtagged" in category :
-                line = line + " 1.0258/0.9603"
-        elif "offqqH_0PM" in pr :
-            #all vbf uncert derived here: 
-            #/afs/cern.ch/work/s/skyriaco/Offshell_trees/TreeEditor/TempMaker_aug15/VBF_filebased/PythiaScale/plots
-
-            if "Untagged" in category :
-                line =  line + " 0.9914/1.0388"
-            if "VHtagged" in category :
-                line = line + " 1.0020/0.9489"
-            if "VBFtagged" in category :
-                line = line + " 1.011/0.9543"
-
-        elif "offqqH" in pr and "offqqH_0PM" not in pr :
-            if "Untagged" in category :
-                line =  line + " 0.9921/1.0306"
-            if "VHtagged" in category :
-                line = line + " 1.0103/0.9645"
-            if "VBFtagged" in category :
-                line = line + " 1.0082/0.9680"
-        elif "back_VVZZ" in pr : 
-            if "Untagged" in category :
-                line =  line + " 0.9987/1.0046"
-            if "VHtagged" in category :
-                line = line + " 1.0057/0.9180"
-            if "VBFtagged" in category :
-                line = line + " 0.9910/1.00005"
-        elif "offggH" in pr:
-            #derived using high mass samples here: 
-            #/afs/cern.ch/work/s/skyriaco/Offshell_trees/TreeEditor/testCat/cat_jul20/PythiaScale/ggF/MC18/plots
-            if "Untagged" in category :
-                line =  line + " 1.0075/0.9934"
-            if "VHtagged" in category :
-                line = line + " 0.90276/1.0945"
-            if "VBFtagged" in category :
-                line = line + " 0.8755/1.1328"
-
-
-    lines.append(line)
-
-
-
-
-
-
-
+    add_systematics(lines, processes, ["CMS_pythia_scale"], category)
 
 def addkfew_as(lines,processes):
-    line = "kfas_ew lnN"
-    for pr in processes :
-        if "offqqH" in pr: 
-            line =  line + " 1.0065/0.993500"
-        else:     
-            line = line + " -"
-
-    lines.append(line)
-    
+    add_systematics(lines, processes, ["kfas_ew"])
 
 def addkfew_pdf(lines,processes):
-    line = "kfpdf_ew lnN"
-    for pr in processes :
-        if "offqqH" in pr: 
-            line =  line + " 1.0189/0.9811"
-        else:     
-            line = line + " -"
-
-    lines.append(line)
-    
-def addkfew_qcdscale(lines,processes):
-    line = "kfqcd_ew lnN"
-    for pr in processes :
-        if "offqqH" in pr: 
-            line =  line + " 1.0133/0.992"
-        else:      
-            line = line + " -"
-
-    lines.append(line)
-
-
-
-    
-
+    add_systematics(lines, processes, ["kfpdf_ew"])
 
+def addkfew_qcdscale(lines,processes):
+    add_systematics(lines, processes, ["kfqcd_ew"])
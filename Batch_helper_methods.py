@@ -0,0 +1,333 @@
+import os
+import warnings
+import numpy as np
+import concurrent.futures
+import Template_creator
+import DatacardMaker_OnShell
+import Binning_helper_methods
+#Every (category, era) pair is its own channel with its own template file and datacard,
+#but the samples of an era are loaded and split into their categories only once, and the channels are then made independently of each other
+
+CATEGORIES = ["Untagged", "VBFtagged", "VHtagged"] #the categories Addsyst_functions has category-dependent systematics (DatacardMaker_OnShell.CATEGORY_SYSTEMATICS) for
+ERAS = ["2016", "2017", "2018"] #the years Addsyst_functions has a luminosity for
+
+
+class Category_index(object):
+    def __init__(self, category, ncategories):
+        """Routes the events of a sample to their categories. The events are grouped by category once (with a stable counting sort),
+        after which any branch of the sample is split into every category with a single gather, each category being a contiguous slice of it.
+
+        Parameters
+        ----------
+        category : array_like
+            The category number of every event (its place in the list of categories). Events with any other number are dropped.
+            Floats are accepted as long as they hold whole numbers.
+        ncategories : int
+            The number of categories
+
+        Raises
+        ------
+        ValueError
+            If any category number is not a whole number (i.e. 1.5 or NaN)
+        """
+        category = np.asarray(category)
+        if category.dtype.kind == 'f':
+            if not np.all(np.isfinite(category) & (category == np.round(category))): #these would otherwise be truncated into a category
+                raise ValueError("Category numbers should be whole numbers!")
+            category = category.astype(np.intp)
+        elif category.dtype.kind not in 'iu':
+            raise ValueError("Category numbers should be integers, not " + str(category.dtype) + "!")
+        dropped = (category < 0) | (category >= ncategories)
+        codes = np.where(dropped, ncategories, category).astype(np.min_scalar_type(ncategories)) #dropped events all go past the last category
+
+        self.ncategories = ncategories
+        self.order = np.argsort(codes, kind='stable') #numpy sorts small integers stably with a radix sort, so this is linear in the events
+        self.bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=ncategories + 1))])
+
+    @classmethod
+    def from_labels(cls, labels, categories=CATEGORIES):
+        """Makes the index from the name of the category of every event
+
+        Parameters
+        ----------
+        labels : array_like
+            The category name of every event. Events whose category is not in categories are dropped.
+        categories : list[str], optional
+            The categories, by default CATEGORIES
+
+        Returns
+        -------
+        Category_index
+            The index
+        """
+        names, inverse = np.unique(np.asarray(labels), return_inverse=True) #each distinct label is only looked up once
+        codes = np.array([categories.index(name) if name in categories else len(categories) for name in names.tolist()], dtype=np.intp)
+        return cls(codes[inverse.ravel()], len(categories))
+
+    @property
+    def counts(self):
+        """The number of events in each category
+
+        Returns
+        -------
+        numpy.ndarray
+            The count of every category, in order
+        """
+        return np.diff(self.bounds)[:self.ncategories]
+
+    def split(self, array):
+        """Splits a branch of the sample into its categories
+
+        Parameters
+        ----------
+        array : array_like
+            One value for every event of the sample
+
+        Returns
+        -------
+        list[numpy.ndarray]
+            The values of the events in each category, in order. These are views of one array holding the kept events grouped by category.
+        """
+        array = np.asarray(array)
+        if len(array) != len(self.order):
+            raise ValueError("There should be one value for every event!")
+        grouped = array[self.order[:self.bounds[self.ncategories]]]
+        return [grouped[self.bounds[c]:self.bounds[c + 1]] for c in range(self.ncategories)]
+
+
+class Batch_producer(object):
+    def __init__(self, output_directory, fname, lowerlim, upperlim, bins=40, categories=CATEGORIES, sample_dtype=None):
+        """Produces the templates and datacard of every (category, era) channel in one run.
+        Samples are added once per era alongside the category of every event, and are split into their categories right away.
+
+        Parameters
+        ----------
+        output_directory : str
+            The directory you would like to output to. Each channel goes in a directory of its own inside it.
+        fname : str
+            The filenames contained in all your outputs. Each channel's files are named <fname>_<category>_<era>, which is also its bin in the datacard.
+        lowerlim : float
+            The lower limit of your attribute's range
+        upperlim : float
+            The upper limit of your attribute's range
+        bins : Union[int, array_like, Binning_helper_methods.Binning], optional
+            The binning every channel uses, by default 40
+        categories : list[str], optional
+            The categories, by default CATEGORIES
+        sample_dtype : numpy.dtype, optional
+            The dtype to store every sample and its weights as, by default None (see Binning_helper_methods.as_sample)
+        """
+        self.output_directory = os.path.abspath(output_directory)
+        self.fname = fname.split('.')[0]
+        self.lowerlim = lowerlim
+        self.upperlim = upperlim
+        self.binning = bins if isinstance(bins, Binning_helper_methods.Binning) else Binning_helper_methods.Binning(bins, lowerlim, upperlim)
+        self.categories = list(categories)
+        self.sample_dtype = sample_dtype
+
+        self.eras = [] #in the order they were first added
+        self.samples = {} #(era, name) -> (<is background>, <events per category>, <weights per category>, <area per category>)
+
+    def add_sample(self, era, name, values, category, area, weights=None, bkg=False):
+        """Adds a sample for an era, splitting it into its categories.
+        The area is the yield of the whole sample, and each category gets the share of it that its events (or their weights) make up,
+        so events that are in none of the categories take their share with them.
+
+        Parameters
+        ----------
+        era : str
+            The era of the sample (i.e. "2016")
+        name : str
+            The name of the sample. Backgrounds are written as bkg_<name>.
+        values : array_like
+            The value of every event (i.e. M4L)
+        category : Union[array_like, Category_index]
+            Either the category number of every event, or an index already made for this sample (i.e. shared by every branch read from the same file)
+        area : float
+            The yield of the whole sample
+        weights : array_like, optional
+            A weight for every event, by default None
+        bkg : bool, optional
+            Whether the sample is a background, by default False
+        """
+        index = category if isinstance(category, Category_index) else Category_index(category, len(self.categories))
+        values = index.split(Binning_helper_methods.as_sample(values, self.sample_dtype))
+        if weights is None:
+            yields = index.counts.astype(float)
+            total = float(len(index.order))
+        else:
+            weights = Binning_helper_methods.as_weights(weights, self.sample_dtype)
+            total = np.sum(weights, dtype=float)
+            weights = index.split(weights)
+            yields = np.array([np.sum(category_weights, dtype=float) for category_weights in weights])
+        areas = area*yields/total if total else np.zeros(len(yields))
+
+        if era not in self.eras:
+            self.eras.append(era)
+        self.samples[(era, name)] = (bkg, values, weights, areas)
+
+    def channels(self):
+        """Lists every channel that has any events in it
+
+        Returns
+        -------
+        list[tuple[str, str]]
+            (category, era) for every channel, era by era
+        """
+        filled = {(self.categories[c], era) for (era, _), (_, values, _, _) in self.samples.items() for c in range(len(self.categories)) if len(values[c])}
+        return [(category, era) for era in self.eras for category in self.categories if (category, era) in filled]
+
+    def channel_name(self, category, era):
+        """The name of a channel, which names its directory, its files and its bin in the datacard
+
+        Parameters
+        ----------
+        category : str
+            The category
+        era : str
+            The era
+
+        Returns
+        -------
+        str
+            <fname>_<category>_<era>
+        """
+        return self.fname + "_" + category + "_" + str(era)
+
+    def _channel_arguments(self, category, era):
+        """Gathers everything produce_channel needs for one channel, and nothing more, so that only that channel's events are sent to its worker
+
+        Parameters
+        ----------
+        category : str
+            The category
+        era : str
+            The era
+
+        Returns
+        -------
+        tuple
+            The arguments of produce_channel
+        """
+        c = self.categories.index(category)
+        signals = []
+        bkgs = []
+        for (sample_era, name), (bkg, values, weights, areas) in self.samples.items():
+            if sample_era != era:
+                continue
+            (bkgs if bkg else signals).append((name, values[c], None if weights is None else weights[c], float(areas[c])))
+        name = self.channel_name(category, era)
+        return (os.path.join(self.output_directory, name), name, category, era, signals, bkgs, self.binning, self.lowerlim, self.upperlim)
+
+    def produce(self, jobs=None, executor="process", create_datacards=True):
+        """Makes the templates (and datacard) of every channel through a pool of workers, since the channels are independent of each other
+
+        Parameters
+        ----------
+        jobs : int, optional
+            The number of workers, by default None (which uses one per CPU). 1 makes every channel in this process.
+        executor : str, optional
+            Either "thread" or "process", by default "process"
+        create_datacards : bool, optional
+            Whether to make the input ROOT file and datacard of each channel as well, by default True
+
+        Returns
+        -------
+        dict[tuple[str, str], str]
+            The datacard (or template file, if no datacards were made) of every (category, era) channel.
+            Channels in which every sample is empty are left out (see produce_channel).
+        """
+        channels = self.channels()
+        arguments = [self._channel_arguments(category, era) + (create_datacards,) for category, era in channels]
+        if jobs is None:
+            jobs = min(len(arguments), os.cpu_count() or 1)
+
+        if jobs <= 1:
+            outputs = {channel: produce_channel(*argument) for channel, argument in zip(channels, arguments)}
+            return {channel: output for channel, output in outputs.items() if output is not None}
+
+        if executor == "process":
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        else:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        with pool:
+            futures = {channel: pool.submit(produce_channel, *argument) for channel, argument in zip(channels, arguments)}
+            outputs = {channel: future.result() for channel, future in futures.items()}
+            return {channel: output for channel, output in outputs.items() if output is not None}
+
+
+def produce_channel(output_directory, fname, category, era, signals, bkgs, bins, lowerlim, upperlim, create_datacards=True):
+    """Makes the templates of one channel with a Template_Creator_1D, and its datacard with the systematics of its category and era
+
+    Parameters
+    ----------
+    output_directory : str
+        The directory to output the channel to
+    fname : str
+        The filenames of the channel's outputs
+    category : str
+        The category of the channel, whose CMS_pythia_tune and CMS_pythia_scale values go in the datacard
+    era : str
+        The era of the channel, whose luminosity replaces the inclusive one in the datacard
+    signals : list[tuple[str, numpy.ndarray, Union[numpy.ndarray, None], float]]
+        (name, events, weights, area) for every signal in the channel
+    bkgs : list[tuple[str, numpy.ndarray, Union[numpy.ndarray, None], float]]
+        (name, events, weights, area) for every background in the channel
+    bins : Binning_helper_methods.Binning
+        The binning to use
+    lowerlim : float
+        The lower limit of your attribute's range
+    upperlim : float
+        The upper limit of your attribute's range
+    create_datacards : bool, optional
+        Whether to make the input ROOT file and datacard as well, by default True
+
+    Returns
+    -------
+    Union[str, None]
+        The datacard, or the template file if no datacard was made. None if every sample is empty (within the range, or with no area),
+        in which case nothing is written and a warning is given.
+    """
+    creator = Template_creator.Template_Creator_1D(output_directory, fname, [events for _, events, _, _ in bkgs], ["bkg_" + name for name, _, _, _ in bkgs],
+                                                  [area for _, _, _, area in bkgs], lowerlim, upperlim, bkg_weights=[weights for _, _, weights, _ in bkgs])
+    creator.binning = bins
+    creator.category = category
+    creator.scale_systematics = DatacardMaker_OnShell.channel_systematics(era, category)
+    for name, events, weights, area in signals:
+        creator.signals[name] = (events, area)
+        if weights is not None:
+            creator.signal_weights[name] = weights
+
+    for name in list(creator.signals) + list(creator.bkgs):
+        events, area = creator._sample_and_area(name)
+        if area and np.any(creator.histogram(name, events, bins, creator._event_weights(name))[0]): #empty samples are left out of the channel
+            creator.templates[name] = creator.scaled_template(name)
+            creator.template_variances[name] = creator.scaled_variances(name)
+    if not creator.templates: #there is nothing to make a datacard out of
+        warnings.warn("Every sample in " + fname + " is empty, so the channel is skipped!")
+        return None
+    os.makedirs(output_directory, exist_ok=True)
+    creator.write_templates()
+
+    if not create_datacards:
+        return creator.output_directory + creator.fname + ".root"
+    creator.create_datacards()
+    return creator.output_directory + creator.fname + "_out/" + creator.fname + ".onshell.txt"
+
+def combine_cards_command(datacards, output="combined.txt"):
+    """Writes out the combineCards.py command that puts every channel's datacard together
+
+    Parameters
+    ----------
+    datacards : dict[tuple[str, str], str]
+        The datacard of every (category, era) channel, a la Batch_producer.produce. Channels whose datacard is None are left out.
+    output : str, optional
+        The combined datacard, by default "combined.txt"
+
+    Returns
+    -------
+    str
+        The command
+    """
+    cards = [os.path.basename(card).replace(".onshell.txt", "") + "=" + card for card in datacards.values() if card is not None]
+    return "combineCards.py " + " ".join(cards) + " > " + output
@@ -0,0 +1,196 @@
+import os
+import sys
+import time
+import json
+import uproot
+import platform
+import subprocess
+import numpy as np
+
+
+def breit_wigner(mass, width, n, lowerlim, upperlim, rng=None):
+    """Generates masses from a (non-relativistic) Breit-Wigner truncated to a range, by inverting its CDF
+
+    Parameters
+    ----------
+    mass : float
+        The mass of the resonance
+    width : float
+        The width of the resonance
+    n : int
+        The number of events you want
+    lowerlim : float
+        The lower limit of the range
+    upperlim : float
+        The upper limit of the range
+    rng : numpy.random.Generator, optional
+        The random number generator to use, by default None (which makes a fresh one)
+
+    Returns
+    -------
+    numpy.ndarray
+        n masses, all inside (lowerlim, upperlim)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    gamma = width/2
+    lower_cdf = np.arctan((lowerlim - mass)/gamma)/np.pi + 0.5
+    upper_cdf = np.arctan((upperlim - mass)/gamma)/np.pi + 0.5
+    u = rng.uniform(lower_cdf, upper_cdf, int(n))
+    return mass + gamma*np.tan(np.pi*(u - 0.5))
+
+def three_resonance_spectrum(n, lowerlim=6, upperlim=9, masses=(7, 7.5, 8), widths=(0.3, 0.3, 0.3), fractions=(1/3, 1/3, 1/3), rng=None):
+    """Generates an M4L spectrum made of three Breit-Wigner resonances
+
+    Parameters
+    ----------
+    n : int
+        The number of events you want
+    lowerlim : float, optional
+        The lower limit of the range, by default 6
+    upperlim : float, optional
+        The upper limit of the range, by default 9
+    masses : tuple[float], optional
+        The mass of each resonance, by default (7, 7.5, 8)
+    widths : tuple[float], optional
+        The width of each resonance, by default (0.3, 0.3, 0.3)
+    fractions : tuple[float], optional
+        The fraction of events from each resonance, by default an even split
+    rng : numpy.random.Generator, optional
+        The random number generator to use, by default None (which makes a fresh one)
+
+    Returns
+    -------
+    numpy.ndarray
+        n masses, shuffled
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    counts = rng.multinomial(int(n), np.array(fractions)/np.sum(fractions))
+    spectrum = np.concatenate([breit_wigner(mass, width, count, lowerlim, upperlim, rng) for mass, width, count in zip(masses, widths, counts)])
+    rng.shuffle(spectrum)
+    return spectrum
+
+def flat_background(n, lowerlim=6, upperlim=9, rng=None):
+    """Generates a flat background
+
+    Parameters
+    ----------
+    n : int
+        The number of events you want
+    lowerlim : float, optional
+        The lower limit of the range, by default 6
+    upperlim : float, optional
+        The upper limit of the range, by default 9
+    rng : numpy.random.Generator, optional
+        The random number generator to use, by default None (which makes a fresh one)
+
+    Returns
+    -------
+    numpy.ndarray
+        n values spread evenly over the range
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    return rng.uniform(lowerlim, upperlim, int(n))
+
+def time_stage(stage, function, setup=None, repeat=3, events=0, **info):
+    """Times one stage on its own. Whatever setup does is not timed, and is redone before every repetition.
+
+    Parameters
+    ----------
+    stage : str
+        The name of the stage
+    function : Callable
+        The stage itself. It is called with whatever setup returns, or with nothing if there is no setup.
+    setup : Callable, optional
+        Prepares the inputs of the stage, by default None
+    repeat : int, optional
+        How many times the stage is timed, by default 3
+    events : int, optional
+        The number of events the stage handles, used for the throughput, by default 0
+    **info
+        Anything else worth recording alongside the timings (i.e. the number of bins)
+
+    Returns
+    -------
+    dict
+        The wall and CPU times of every repetition, along with the best wall time and the throughput it gives in events per second
+    """
+    wall = []
+    cpu = []
+    for _ in range(repeat):
+        arguments = setup() if setup is not None else ()
+        if not isinstance(arguments, tuple):
+            arguments = (arguments,)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        function(*arguments)
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+
+    result = {"stage": stage, "events": int(events), **info, "repeat": repeat, "wall": wall, "cpu": cpu, "best_wall": min(wall)}
+    result["throughput"] = events/min(wall) if events and min(wall) > 0 else None
+    return result
+
+def time_import(module, repeat=3, heavy_modules=("ROOT", "matplotlib", "mplhep", "pandas", "uproot", "tqdm")):
+    """Times how long a module takes to import in a fresh interpreter, a la a worker process starting up
+
+    Parameters
+    ----------
+    module : str
+        The module to import
+    repeat : int, optional
+        How many fresh interpreters to time it in, by default 3
+    heavy_modules : Iterable[str], optional
+        The heavy dependencies to check for afterwards, by default ("ROOT", "matplotlib", "mplhep", "pandas", "uproot", "tqdm")
+
+    Returns
+    -------
+    dict
+        The wall time of every import, the best of them, and which of the heavy dependencies the import pulled in
+    """
+    code = ("import sys, time; start = time.perf_counter(); import " + module + "; print(time.perf_counter() - start); "
+            "print(','.join(name for name in " + repr(tuple(heavy_modules)) + " if name in sys.modules))")
+    wall = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.splitlines()
+        wall.append(float(output[-2]))
+    loaded = [name for name in output[-1].split(',') if name]
+    return {"stage": "import", "module": module, "repeat": repeat, "wall": wall, "best_wall": min(wall), "heavy_modules": loaded}
+
+def environment():
+    """Describes the machine and software the benchmarks ran on
+
+    Returns
+    -------
+    dict
+        The versions of python, numpy and uproot, the platform, the number of CPUs and when this ran
+    """
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "uproot": uproot.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def write_report(filename, results, **metadata):
+    """Writes benchmark results out as JSON
+
+    Parameters
+    ----------
+    filename : str
+        The JSON file to write, or "-" to print it
+    results : list[dict]
+        The output of time_stage for every stage that ran
+    **metadata
+        Anything else worth recording about the run (i.e. the arguments it was given)
+    """
+    report = {"environment": environment(), "metadata": metadata, "results": results}
+    if filename == "-":
+        print(json.dumps(report, indent=1))
+        return
+    with open(filename, "w") as f:
+        json.dump(report, f, indent=1)
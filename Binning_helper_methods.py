@@ -0,0 +1,475 @@
+import numpy as np
+
+
+def _fill_with_variances(index, weights, nbins, block_size):
+    """Fills the sum of weights and the sum of weights squared of every bin from flat bin indices in one pass, a block of events at a time
+
+    Parameters
+    ----------
+    index : numpy.ndarray
+        The bin index of every event, with out-of-range events given the index nbins
+    weights : array_like
+        A weight for every event
+    nbins : int
+        The number of (in-range) bins
+    block_size : int
+        The number of events to handle at a time
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        (sumw, sumw2) for every in-range bin
+    """
+    weights = np.asarray(weights)
+    if len(weights) != len(index):
+        raise ValueError("There should be one weight for every event!")
+    sumw = np.zeros(nbins + 1, dtype=float)
+    sumw2 = np.zeros(nbins + 1, dtype=float)
+    for start in range(0, len(index), block_size):
+        block_index = index[start:start + block_size]
+        block_weights = weights[start:start + block_size].astype(float, copy=False) #float32 weights are only widened a block at a time
+        sumw += np.bincount(block_index, weights=block_weights, minlength=nbins + 1)
+        sumw2 += np.bincount(block_index, weights=block_weights*block_weights, minlength=nbins + 1)
+    return sumw[:nbins], sumw2[:nbins]
+
+
+class Binning(object):
+    BLOCK_SIZE = 1 << 16 #the number of events fill_with_variances handles at a time
+    
+    def __init__(self, bins, lowerlim, upperlim):
+        """A 1-dimensional binning that turns every event into a single integer bin index.
+        Once the indices of a sample are known, any number of histograms can be filled from them with numpy.bincount,
+        and the results are identical to those of numpy.histogram for float64 samples.
+        The edges are always float64, and samples of any other dtype are binned as if they were cast to float64 first, so a sample bins the same way whatever it is stored as.
+        numpy.histogram (under numpy 2) bins a float32 sample against float32 edges instead, so the two can differ for an event that sits right on an edge.
+
+        Parameters
+        ----------
+        bins : Union[int, array_like]
+            Either the number of bins you want, or a list of the bin edges you want
+        lowerlim : float
+            The lower limit of your attribute's range. Ignored if bin edges are given.
+        upperlim : float
+            The upper limit of your attribute's range. Ignored if bin edges are given.
+        """
+        if np.ndim(bins) == 0:
+            self.nbins = int(bins)
+            self.edges = np.linspace(lowerlim, upperlim, self.nbins + 1)
+            self.uniform = True
+        else:
+            self.edges = np.asarray(bins, dtype=float)
+            self.nbins = len(self.edges) - 1
+            self.uniform = bool(np.allclose(np.diff(self.edges), self.edges[1] - self.edges[0], rtol=1e-12, atol=0))
+
+        self.shape = (self.nbins,)
+        self.lowerlim = self.edges[0]
+        self.upperlim = self.edges[-1]
+        self.overflow = self.nbins #events outside of the range are given this index, which is dropped when filling
+        self.index_dtype = np.min_scalar_type(self.nbins) #the smallest integer that can hold every index (uint8 for 40 bins!)
+
+    @property
+    def key(self):
+        """A hashable key that identifies this binning, for use in caches
+
+        Returns
+        -------
+        tuple
+            (number of bins, edges as bytes)
+        """
+        return (self.nbins, self.edges.tobytes())
+    
+    @property
+    def edges_per_axis(self):
+        """The bin edges along every axis, which follow the counts in a numpy-style histogram tuple
+
+        Returns
+        -------
+        Tuple[numpy.ndarray]
+            (edges,)
+        """
+        return (self.edges,)
+
+    def index(self, sample):
+        """Computes the bin index of every event in a sample. Bins are closed on the left, except the last one which is closed on both sides.
+
+        Parameters
+        ----------
+        sample : array_like
+            An iterable of values
+
+        Returns
+        -------
+        numpy.ndarray
+            The bin index of every event, with out-of-range events (and NaNs) given the index self.overflow
+        """
+        sample = np.asarray(sample)
+        keep = (sample >= self.lowerlim) & (sample <= self.upperlim)
+        values = sample[keep].astype(self.edges.dtype, copy=False)
+
+        if self.uniform:
+            #this is the same fast path that numpy.histogram takes for uniform bins:
+            #compute the index arithmetically, then correct the off-by-one cases that floating point rounding creates
+            indices = ((values - self.lowerlim)*(self.nbins/(self.upperlim - self.lowerlim))).astype(np.intp)
+            indices[indices == self.nbins] -= 1
+
+            decrement = values < self.edges[indices]
+            indices[decrement] -= 1
+            increment = (values >= self.edges[indices + 1]) & (indices != self.nbins - 1)
+            indices[increment] += 1
+        else:
+            indices = np.searchsorted(self.edges, values, side='right') - 1
+            indices[values == self.upperlim] = self.nbins - 1
+
+        index = np.full(sample.shape, self.overflow, dtype=self.index_dtype)
+        index[keep] = indices
+        return index
+
+    def fill(self, index, weights=None):
+        """Fills a histogram from precomputed bin indices
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            The output of Binning.index
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        numpy.ndarray
+            The bin counts (integers if there are no weights)
+        """
+        return np.bincount(index, weights=weights, minlength=self.nbins + 1)[:self.nbins]
+
+    def fill_with_variances(self, index, weights=None):
+        """Fills the sum of weights and the sum of weights squared of every bin in one pass over the events.
+        The events are gone through in blocks small enough to stay in cache, and the squared weights are never held for the whole sample.
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            The output of Binning.index
+        weights : array_like, optional
+            A weight for every event, by default None (which gives Poisson variances equal to the counts)
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray]
+            (sumw, sumw2) for every bin, both as floats
+        """
+        if weights is None:
+            counts = self.fill(index).astype(float)
+            return counts, counts.copy()
+        return _fill_with_variances(index, weights, self.nbins, self.BLOCK_SIZE)
+
+    def histogram(self, sample, weights=None):
+        """A drop-in replacement for numpy.histogram with this binning
+
+        Parameters
+        ----------
+        sample : array_like
+            An iterable of values
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray]
+            (counts, bins) a la a numpy histogram
+        """
+        return self.fill(self.index(sample), weights), self.edges
+
+
+class Binning_2D(object):
+    BLOCK_SIZE = Binning.BLOCK_SIZE
+    
+    def __init__(self, xbinning, ybinning):
+        """A 2-dimensional binning made of two 1-dimensional ones. Every event is turned into a single flattened bin index (its x index times the number of y bins plus its y index),
+        so that 2D histograms are filled with numpy.bincount exactly like 1D ones are. The results are identical to those of numpy.histogram2d for float64 samples
+        (other dtypes are binned against the float64 edges, see Binning).
+
+        Parameters
+        ----------
+        xbinning : Binning
+            The binning along x (i.e. the mass)
+        ybinning : Binning
+            The binning along y (i.e. a discriminant)
+        """
+        self.x = xbinning
+        self.y = ybinning
+        self.shape = (xbinning.nbins, ybinning.nbins)
+        self.nbins = xbinning.nbins*ybinning.nbins
+        self.overflow = self.nbins #events outside of the range along either axis are given this index, which is dropped when filling
+        self.index_dtype = np.min_scalar_type(self.nbins)
+    
+    @classmethod
+    def from_bins(cls, bins, xrange, yrange):
+        """Makes a 2D binning out of anything numpy.histogram2d accepts as its bins
+
+        Parameters
+        ----------
+        bins : Union[int, array_like, list[Union[int, array_like]]]
+            The number of bins along both axes, the bin edges along both axes, or [x bins, y bins] where each is a number of bins or a list of bin edges
+        xrange : Tuple[float, float]
+            The range along x, used when a number of bins is given
+        yrange : Tuple[float, float]
+            The range along y, used when a number of bins is given
+
+        Returns
+        -------
+        Binning_2D
+            The binning
+        """
+        if np.isscalar(bins) or len(bins) != 2: #a la numpy.histogram2d, anything but a pair is used for both axes
+            xbins = ybins = bins
+        else:
+            xbins, ybins = bins
+        return cls(Binning(xbins, *xrange), Binning(ybins, *yrange))
+    
+    @property
+    def key(self):
+        """A hashable key that identifies this binning, for use in caches
+
+        Returns
+        -------
+        tuple
+            The keys of both axes
+        """
+        return (self.x.key, self.y.key)
+    
+    @property
+    def edges_per_axis(self):
+        """The bin edges along every axis, which follow the counts in a numpy-style histogram tuple
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray]
+            (x edges, y edges)
+        """
+        return (self.x.edges, self.y.edges)
+    
+    def index(self, xsample, ysample):
+        """Computes the flattened bin index of every event
+
+        Parameters
+        ----------
+        xsample : array_like
+            The x value of every event
+        ysample : array_like
+            The y value of every event
+
+        Returns
+        -------
+        numpy.ndarray
+            The flattened bin index of every event, with events outside of either range given the index self.overflow
+        """
+        if len(xsample) != len(ysample):
+            raise ValueError("There should be a y value for every x value!")
+        xindex = self.x.index(xsample)
+        yindex = self.y.index(ysample)
+        index = xindex.astype(np.intp)*self.y.nbins + yindex
+        index[(xindex == self.x.overflow) | (yindex == self.y.overflow)] = self.overflow
+        return index.astype(self.index_dtype)
+    
+    def fill(self, index, weights=None):
+        """Fills a 2D histogram from precomputed flattened bin indices
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            The output of Binning_2D.index
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        numpy.ndarray
+            The (x bins, y bins) counts (integers if there are no weights)
+        """
+        return np.bincount(index, weights=weights, minlength=self.nbins + 1)[:self.nbins].reshape(self.shape)
+    
+    def fill_with_variances(self, index, weights=None):
+        """Fills the sum of weights and the sum of weights squared of every bin in one pass over the events, a la Binning.fill_with_variances
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            The output of Binning_2D.index
+        weights : array_like, optional
+            A weight for every event, by default None (which gives Poisson variances equal to the counts)
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray]
+            (sumw, sumw2) for every bin, both as (x bins, y bins) floats
+        """
+        if weights is None:
+            counts = self.fill(index).astype(float)
+            return counts, counts.copy()
+        sumw, sumw2 = _fill_with_variances(index, weights, self.nbins, self.BLOCK_SIZE)
+        return sumw.reshape(self.shape), sumw2.reshape(self.shape)
+    
+    def histogram(self, xsample, ysample, weights=None):
+        """A drop-in replacement for numpy.histogram2d with this binning
+
+        Parameters
+        ----------
+        xsample : array_like
+            The x value of every event
+        ysample : array_like
+            The y value of every event
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+            (counts, xbins, ybins) a la a numpy 2D histogram
+        """
+        return (self.fill(self.index(xsample, ysample), weights),) + self.edges_per_axis
+
+
+class HistogramAccumulator(object):
+    def __init__(self, binning):
+        """Builds up a histogram chunk by chunk, so that a sample never has to be held in memory all at once.
+        Template classes accept these in place of raw event arrays.
+
+        Parameters
+        ----------
+        binning : Union[Binning, Binning_2D]
+            The binning to accumulate with. Templates made from this accumulator must use the same binning.
+            Chunks can only be filled with a (1D) Binning, but a Binning_2D can hold what from_index gives it.
+        """
+        self.binning = binning
+        self.counts = np.zeros(binning.shape, dtype=np.int64)
+        self.sumw2 = np.zeros(binning.shape, dtype=float) #the sum of the weights squared in every bin, which is the counts for unweighted fills
+        self.entries = 0 #the number of events seen, including those out of range
+
+    @classmethod
+    def from_index(cls, binning, index, weights=None):
+        """Makes an accumulator holding the histogram of a whole sample from the bin indices it already has,
+        so that the events themselves (and their indices and weights) can be let go of
+
+        Parameters
+        ----------
+        binning : Union[Binning, Binning_2D]
+            The binning the indices were made with
+        index : numpy.ndarray
+            The output of Binning.index or Binning_2D.index
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        HistogramAccumulator
+            The accumulated histogram of the sample
+        """
+        return cls(binning)._add(index, weights)
+
+    def fill(self, chunk, weights=None):
+        """Adds a chunk of events to the histogram
+
+        Parameters
+        ----------
+        chunk : array_like
+            An iterable of values
+        weights : array_like, optional
+            A weight for every event in the chunk, by default None
+
+        Returns
+        -------
+        HistogramAccumulator
+            itself, so that fills can be chained
+        """
+        return self._add(self.binning.index(chunk), weights)
+
+    def _add(self, index, weights=None):
+        """Adds events to the histogram by their bin indices
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            The bin index of every event
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        HistogramAccumulator
+            itself
+        """
+        if weights is None:
+            counts = self.binning.fill(index)
+            sumw2 = counts
+        else:
+            counts, sumw2 = self.binning.fill_with_variances(index, weights)
+            self.counts = self.counts.astype(float, copy=False) #weighted fills turn the counts into floats
+        self.counts += counts
+        self.sumw2 += sumw2
+        self.entries += len(index)
+        return self
+
+    def histogram(self):
+        """Returns what has been accumulated so far
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, ...]
+            (counts, bins) a la a numpy histogram, or (counts, binsx, binsy) with a Binning_2D
+        """
+        return (self.counts.copy(),) + self.binning.edges_per_axis
+
+    def variances(self):
+        """Returns the variance of every bin accumulated so far
+
+        Returns
+        -------
+        numpy.ndarray
+            The sum of the weights squared in every bin
+        """
+        return self.sumw2.copy()
+
+
+def as_sample(sample, dtype=None):
+    """Prepares a sample to be stored by a template class. Accumulators are kept as they are, anything else becomes a read-only numpy array.
+    Arrays that already have the dtype asked for, including the memory maps Branch_cache hands back, are stored without being copied,
+    so they should not be changed in place afterwards.
+
+    Parameters
+    ----------
+    sample : Union[array_like, HistogramAccumulator]
+        Either an iterable of values or a HistogramAccumulator
+    dtype : numpy.dtype, optional
+        The dtype to store the values as, by default None (which keeps the dtype they come in).
+        numpy.float32 takes half the memory of float64, at the cost of rounding each value to 7 significant digits before it is binned
+        (against the float64 edges, so a value that rounds past an edge moves with it).
+
+    Returns
+    -------
+    Union[numpy.ndarray, HistogramAccumulator]
+        The sample, ready to be stored
+    """
+    if isinstance(sample, HistogramAccumulator):
+        return sample
+    sample = np.asarray(sample, dtype=dtype)
+    if sample.flags.writeable:
+        sample = sample.view() #a read-only view leaves whoever passed the array in free to keep writing to their own
+        sample.setflags(write=False)
+    return sample
+
+def as_weights(weights, dtype=None):
+    """Prepares per-event weights to be stored by a template class, a la as_sample
+
+    Parameters
+    ----------
+    weights : array_like
+        A weight for every event
+    dtype : numpy.dtype, optional
+        The dtype to store the weights as, by default None (which is float64)
+
+    Returns
+    -------
+    numpy.ndarray
+        The weights as a read-only floating point array
+    """
+    return as_sample(weights, float if dtype is None else dtype)
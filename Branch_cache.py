@@ -0,0 +1,242 @@
+import os
+import glob
+import time
+import uuid
+import uproot
+import hashlib
+import numpy as np
+
+
+class Branch_cache(object):
+    STALE_SECONDS = 24*60*60 #temporary files older than this were left behind by writers that died, rather than being written right now
+    
+    def __init__(self, cache_directory, max_bytes=20*1024**3, chunk_entries=10_000_000):
+        """An on-disk cache of branches extracted from ROOT files. Each branch is stored as a .npy file that is memory-mapped on the way back out,
+        so a repeat run maps the arrays instead of decompressing the ROOT file again.
+
+        Entries are keyed by the absolute path, size and modification time of the ROOT file alongside the branch name,
+        so editing or replacing an input invalidates its entries. Once the cache grows past max_bytes the least recently used entries are removed.
+
+        Parameters
+        ----------
+        cache_directory : str
+            The directory you would like to keep the cache in. It is created if it does not exist.
+        max_bytes : int, optional
+            The most space the cache may take up on disk, by default 20 GiB
+        chunk_entries : int, optional
+            How many entries each chunk holds when a cached branch is iterated over, by default 10 million
+        """
+        self.cache_directory = os.path.abspath(cache_directory)
+        if self.cache_directory[-1] != '/':
+            self.cache_directory += '/'
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.chunk_entries = chunk_entries
+
+    def _path(self, ROOT_file, branch):
+        """Works out where a branch of a ROOT file lives in the cache
+
+        Parameters
+        ----------
+        ROOT_file : str
+            The ROOT file the branch comes from
+        branch : str
+            The name of the branch
+
+        Returns
+        -------
+        str
+            The path of the .npy file for this entry
+        """
+        ROOT_file = os.path.abspath(ROOT_file)
+        stat = os.stat(ROOT_file)
+        key = "\0".join([ROOT_file, str(stat.st_size), str(stat.st_mtime_ns), branch])
+        return self.cache_directory + hashlib.sha1(key.encode()).hexdigest() + ".npy"
+
+    def get(self, ROOT_file, branch):
+        """Maps a cached branch back into memory
+
+        Parameters
+        ----------
+        ROOT_file : str
+            The ROOT file the branch comes from
+        branch : str
+            The name of the branch
+
+        Returns
+        -------
+        Union[numpy.memmap, None]
+            A read-only memory map of the branch, or None if it is not cached
+        """
+        path = self._path(ROOT_file, branch)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError): #ValueError covers a file that was being evicted as it was read
+            return None
+        os.utime(path) #the modification time doubles as the last time this entry was used
+        return array
+
+    def put(self, ROOT_file, branch, array):
+        """Stores a branch in the cache. Branches that are not flat numeric arrays cannot be memory-mapped, and are not stored.
+
+        Parameters
+        ----------
+        ROOT_file : str
+            The ROOT file the branch comes from
+        branch : str
+            The name of the branch
+        array : numpy.ndarray
+            The contents of the branch
+
+        Returns
+        -------
+        numpy.ndarray
+            A read-only memory map of what was stored, or the array itself if it could not be stored
+        """
+        if array.dtype == object:
+            return array
+
+        path = self._path(ROOT_file, branch)
+        temp = path + "." + uuid.uuid4().hex + ".tmp" #writing elsewhere first means no one ever maps a half-written entry
+        np.save(temp, array)
+        os.replace(temp + ".npy", path)
+
+        array = np.load(path, mmap_mode='r')
+        self.evict()
+        return array
+
+    def load(self, ROOT_file, *branches):
+        """Loads branches from the first TTree in a ROOT file, only decompressing the ones that are not already cached
+
+        Parameters
+        ----------
+        ROOT_file : str
+            The ROOT file to read from
+        *branches : str
+            The names of the branches you want
+
+        Returns
+        -------
+        list[numpy.ndarray]
+            Each branch, in the order they were asked for
+        """
+        arrays = [self.get(ROOT_file, branch) for branch in branches]
+        missing = [branch for branch, array in zip(branches, arrays) if array is None]
+        if not missing:
+            return arrays
+
+        with uproot.open(ROOT_file) as f:
+            f = f[f.keys()[0]]
+            for n, branch in enumerate(branches):
+                if arrays[n] is None:
+                    arrays[n] = self.put(ROOT_file, branch, f[branch].array(library='np'))
+        return arrays
+
+    def iterate(self, ROOT_file, *branches, step_size="100 MB"):
+        """Streams branches from the first TTree in a ROOT file in chunks.
+        Cached branches are served from their memory maps; otherwise the file is streamed with uproot and written through to the cache as it goes.
+
+        Parameters
+        ----------
+        ROOT_file : str
+            The ROOT file to read from
+        *branches : str
+            The names of the branches you want
+        step_size : Union[int, str], optional
+            The size of each chunk when streaming from the ROOT file, by default "100 MB".
+            Cached branches use chunks of step_size entries if it is an integer, and chunk_entries entries otherwise.
+
+        Yields
+        ------
+        list[numpy.ndarray]
+            One chunk of each branch, in the order they were asked for
+        """
+        arrays = [self.get(ROOT_file, branch) for branch in branches]
+        if all(array is not None for array in arrays):
+            entries = step_size if isinstance(step_size, int) else self.chunk_entries
+            for start in range(0, len(arrays[0]), entries):
+                yield [array[start:start + entries] for array in arrays]
+            return
+
+        paths = [self._path(ROOT_file, branch) for branch in branches]
+        temps = [path + "." + uuid.uuid4().hex + ".tmp.npy" for path in paths]
+        outputs = [None]*len(branches)
+        complete = False
+        try:
+            with uproot.open(ROOT_file) as f:
+                f = f[f.keys()[0]]
+                start = 0
+                for chunk in f.iterate(list(branches), step_size=step_size, library='np'):
+                    chunk = [chunk[branch] for branch in branches]
+                    for n, array in enumerate(chunk):
+                        if array.dtype == object: #jagged branches cannot be memory-mapped
+                            continue
+                        if outputs[n] is None:
+                            outputs[n] = np.lib.format.open_memmap(temps[n], mode='w+', dtype=array.dtype, shape=(f.num_entries,))
+                        outputs[n][start:start + len(array)] = array
+                    start += len(chunk[0])
+                    yield chunk
+            complete = True
+        finally:
+            for n, output in enumerate(outputs):
+                if output is None:
+                    continue
+                output.flush()
+                if complete:
+                    os.replace(temps[n], paths[n])
+                elif os.path.exists(temps[n]): #a stream that was abandoned partway through is not cached
+                    os.remove(temps[n])
+        self.evict()
+
+    def entries(self):
+        """Lists every entry in the cache, least recently used first
+
+        Returns
+        -------
+        list[str]
+            The paths of the .npy files in the cache
+        """
+        paths = [path for path in glob.glob(self.cache_directory + "*.npy") if not path.endswith(".tmp.npy")]
+        modified = {}
+        for path in paths:
+            try:
+                modified[path] = os.path.getmtime(path)
+            except FileNotFoundError: #someone else evicted it in the meantime
+                pass
+        return sorted(modified, key=modified.get)
+
+    def size(self):
+        """How much space the cache takes up
+
+        Returns
+        -------
+        int
+            The total size of every entry, in bytes
+        """
+        return sum(os.path.getsize(path) for path in self.entries() if os.path.exists(path))
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits inside max_bytes
+        """
+        entries = self.entries()
+        sizes = {path: os.path.getsize(path) for path in entries if os.path.exists(path)}
+        total = sum(sizes.values())
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path in sizes and os.path.exists(path):
+                os.remove(path)
+                total -= sizes[path]
+
+    def clear(self):
+        """Removes every entry in the cache. Temporary files that put and iterate (maybe in another process) are still writing are left alone,
+        but ones older than STALE_SECONDS are removed too.
+        """
+        cutoff = time.time() - self.STALE_SECONDS
+        for path in self.entries() + glob.glob(self.cache_directory + "*.tmp.npy"):
+            try:
+                if not path.endswith(".tmp.npy") or os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError: #someone else removed it (or finished writing it) in the meantime
+                pass
@@ -2,170 +2,209 @@
 
 import os,glob
 import sys
-import ROOT
 import copy
+import numpy as np
+import concurrent.futures
 from Addsyst_functions import *
 
 # Expected input is a root file with the extension .input.root #
-# This script will parse out the histograms in this root file 
-# The output we expect is a text file for input into combine 
-
-Input_Dir = sys.argv[1]
-output_dir = sys.argv[1]
-
-if not os.path.exists(output_dir):
-  os.mkdir(output_dir)
-
-for filename in glob.iglob(Input_Dir+'/**', recursive=True):
-  if os.path.isfile(filename) and ('.root' in filename):
-    nm = filename
-    filename_no_path = nm
-    if "/" in filename:
-      filename_no_path = nm.split("/")[-1]
-    # Remove the any potential filepath #
-    fin = ROOT.TFile.Open(nm)
-    
-    # For right now we do not apply shape systematics 
-    # I need to of couse fix the systematics at some point 
-    
+# This script will parse out the histograms in this root file
+# The output we expect is a text file for input into combine
+
+# The lnN systematics in Addsyst_functions that every datacard gets
+SCALE_SYSTEMATICS = ["lumi_13TeV", "hzz_br", "CMS_eff_e", "CMS_eff_mu"] #"EWcorr_qqZZ"
+# The lnN systematics in Addsyst_functions whose values depend on the category, which datacards for a single category get on top
+CATEGORY_SYSTEMATICS = ["CMS_pythia_tune", "CMS_pythia_scale_lnN"]
+
+def sort_histograms(integrals, verbose=True):
+    # integrals = iterable of (histogram name, histogram integral) pairs, in the order they appear in the file
+    # Returns the processes, their rates, the observation, the shape systematics, and the process systematics
+
+    # For right now we do not apply shape systematics
+    # I need to of couse fix the systematics at some point
+
     processes      =[]
     rate           =[]
     shapesyst      =[]
     applyshapesyst =[]
     procsyst       =[]
-    fin = ROOT.TFile.Open(nm)
     obs = 0
-    
-    for key in fin.GetListOfKeys():
-        if "TH1" in key.GetClassName():
-            h_name = key.GetName()
-            print(h_name)
-            if "Up" not in h_name and "Down" not in h_name and "data" not in h_name: #Up and Down are for tune up tune down QCD stuff
-                hist = fin.Get(h_name)
-                
-                hrate = hist.Integral()
-                processes.append(h_name)
-                rate.append(hrate)
-                h_temp = fin.Get(h_name)
-                print ("this:",h_name , hrate)
-            elif "data" not in h_name:
-                hnml = h_name.split("_")
-                syst_name = hnml[2]
-                for iel,el  in enumerate(hnml):
-                    if iel> 2: 
-                        syst_name = syst_name +"_"+el 
-                syst_name = syst_name.replace("Down","")        
-                syst_name = syst_name.replace("Up","")        
-                syst_name = syst_name.replace("positive_","")        
-                syst_name = syst_name.replace("negative_","")        
-                print (syst_name)
-                if syst_name not in applyshapesyst : applyshapesyst.append(syst_name)
-                psyst = h_name.replace("Down","")
-                psyst = psyst.replace("Up","")
-                if psyst not in procsyst : procsyst.append(psyst)
-                #print (h_name)
-            else :
-                hist = fin.Get(h_name)
-                hrate = hist.Integral()
-                obs = hrate
-                print ("data :",obs)
-    
-                
-    '''
-    
-    '''
-    
-    #Write output datacard
-    
+
+    for h_name, hrate in integrals:
+        if verbose: print(h_name)
+        if "Up" not in h_name and "Down" not in h_name and "data" not in h_name: #Up and Down are for tune up tune down QCD stuff
+            processes.append(h_name)
+            rate.append(hrate)
+            if verbose: print ("this:",h_name , hrate)
+        elif "data" not in h_name:
+            hnml = h_name.split("_")
+            syst_name = "_".join(hnml[2:])
+            syst_name = syst_name.replace("Down","")
+            syst_name = syst_name.replace("Up","")
+            syst_name = syst_name.replace("positive_","")
+            syst_name = syst_name.replace("negative_","")
+            if verbose: print (syst_name)
+            if syst_name not in applyshapesyst : applyshapesyst.append(syst_name)
+            psyst = h_name.replace("Down","")
+            psyst = psyst.replace("Up","")
+            if psyst not in procsyst : procsyst.append(psyst)
+            #print (h_name)
+        else :
+            obs = hrate
+            if verbose: print ("data :",obs)
+
+    return processes, rate, obs, applyshapesyst, procsyst
+
+def shape_syst_lines(processes, applyshapesyst, procsyst):
+    # processes = The processes in the datacard, in order
+    # applyshapesyst, procsyst = The shape systematics and the process systematics that sort_histograms found
+    # Returns one "<syst> shape1 ..." line per shape systematic, with a 1 for every process that has that systematic and a - otherwise
+
+    # procsyst holds "<process>_<syst>" names, so a set of them is an index of every (process, systematic) pair that exists
+    shaped = set(procsyst)
+
+    lineSHsyst = []
+    for syst in applyshapesyst:
+        entries = ["1" if proc+"_"+syst in shaped else "-" for proc in processes]
+        lineSHsyst.append(syst + " shape1 " + "".join(" "+entry for entry in entries))
+    return lineSHsyst
+
+def era_systematics(era=None):
+    # era = The data-taking year of the datacard (i.e. "2016"), by default None for a datacard covering every year
+    # Returns SCALE_SYSTEMATICS with the inclusive luminosity swapped for that year's (lumi_13TeV_<era>, a la addlumi16/17/18)
+
+    if era is None:
+        return list(SCALE_SYSTEMATICS)
+    return ["lumi_13TeV_"+str(era) if syst == "lumi_13TeV" else syst for syst in SCALE_SYSTEMATICS]
+
+def channel_systematics(era=None, category=""):
+    # era = The data-taking year of the datacard, a la era_systematics
+    # category = The category of the datacard (i.e. "Untagged"), by default "" for a datacard covering every category
+    # Returns the lnN systematics for a datacard of one (category, era) channel: era_systematics, plus CATEGORY_SYSTEMATICS if there is a category
+
+    return era_systematics(era) + (list(CATEGORY_SYSTEMATICS) if category else [])
+
+def systematics_configuration(scale_systematics=SCALE_SYSTEMATICS, category=""):
+    # scale_systematics, category = What write_datacard is given
+    # Returns everything about the systematics that goes into a datacard besides the histograms, so that a change to any of it can be spotted
+    return {"rules": SYSTEMATIC_RULES, "headers": SYSTEMATIC_HEADERS, "scale_systematics": list(scale_systematics), "category": category}
+
+def write_datacard(output_dir, filename_no_path, processes, rate, obs, applyshapesyst, procsyst, verbose=True, scale_systematics=SCALE_SYSTEMATICS, category=""):
+    # output_dir = Directory to write the datacard into
+    # filename_no_path = Name of the .input.root file the datacard points to (no filepath)
+    # The rest are the outputs of sort_histograms
+    # scale_systematics = The lnN systematics to write, by default SCALE_SYSTEMATICS (see channel_systematics for a single category and year)
+    # category = The category of the datacard (i.e. "Untagged"), which picks out the category-dependent values of the systematics
+    # The datacard is built in memory and written to disk in one go
+
     proc = len(processes)
-    category = filename_no_path.replace("input.root","onshell.txt")
-    chanel = category.replace(".onshell.txt","")
-    print("here",category)
-    f = open(output_dir+"/"+category, "w")
-    
-    f.write("imax 1\n")
-    f.write("jmax "+str(proc -1)+"\n")
-    f.write("kmax *\n")
-    f.write("------------\n")
-    f.write("shapes * * $CHANNEL.input.root $PROCESS $PROCESS_$SYSTEMATIC\n")
-    f.write("------------\n")
-    f.write("bin "+str(chanel)+"\n")
-    f.write("observation "+ str(obs)+"\n")
-    f.write("------------\n")
-    
-    line= "bin"
-    line_p = "process"
-    line_rate = "rate"
-    line_indx = "process"
-    
+    card_name = filename_no_path.replace("input.root","onshell.txt")
+    chanel = card_name.replace(".onshell.txt","")
+    if verbose: print("here",card_name)
+
+    card = []
+    card.append("imax 1\n")
+    card.append("jmax "+str(proc -1)+"\n")
+    card.append("kmax *\n")
+    card.append("------------\n")
+    card.append("shapes * * $CHANNEL.input.root $PROCESS $PROCESS_$SYSTEMATIC\n")
+    card.append("------------\n")
+    card.append("bin "+str(chanel)+"\n")
+    card.append("observation "+ str(obs)+"\n")
+    card.append("------------\n")
+
     #construct shapy syst lines
-    lineSHsyst= []
-    print (procsyst)
-    for isyst,syst in enumerate(applyshapesyst):
-        lineSHsyst.append(syst)
-        print(syst)
-        lineSHsyst[isyst] = lineSHsyst[isyst] + " shape1 "
-        for proc in processes :
-          pas = False
-          for procs in procsyst :
-              if syst in procs :
-                  if proc+"_"+syst == procs:
-                    pas = True
-                    print (proc,syst,procs)
-                    break
-                  else:
-                    pas =  False  
-          if pas :
-              lineSHsyst[isyst] = lineSHsyst[isyst] + " 1"
-          else :     
-              lineSHsyst[isyst] = lineSHsyst[isyst] + " -"
-    
+    if verbose: print (procsyst)
+    lineSHsyst = shape_syst_lines(processes, applyshapesyst, procsyst)
+
     scale_syst = []
-    addlumi(scale_syst,processes)
-    addhzzbr(scale_syst,processes)
-    addCMS_EFF_e(scale_syst,processes)
-    addCMS_EFF_mu(scale_syst,processes)
-    #addEWcorr_qqZZ(scale_syst,processes)
-    
-    
-              
-    ibkg = 0 
+    add_systematics(scale_syst, processes, scale_systematics, category)
+
+    # each row is built as a list and joined once, so it takes time linear in its length
+    line = ["bin"]
+    line_p = ["process"]
+    line_indx = ["process"]
+    line_rate = ["rate"]
+
+    ibkg = 0
     for i,procc in enumerate(processes):
-        line =line +" "+chanel
-        line_p = line_p + " " +procc
+        line.append(chanel)
+        line_p.append(procc)
         if "bkg_" in procc :
-            
-            line_indx = line_indx +" "+str(ibkg+1)
-            #lineQCDsyst = lineQCDsyst + " 1.1"
+            line_indx.append(str(ibkg+1))
             ibkg += 1
         else :
-            line_indx = line_indx +" -"+ str(i+1)
-            #lineQCDsyst = lineQCDsyst + " -"
-        #if ("0PM" in procc[0] ) :
-        #print chanell,procc[0]  , procc[1] 
-        #if ("bkg" in procc[0] ) :
-        #  print chanell,procc[0]  , procc[1] 
-        
-        line_rate = line_rate+ " "+str(rate[i])
-    line = line+"\n"
-    line_p = line_p + "\n"
-    line_indx = line_indx + "\n"
-    line_rate = line_rate+"\n"            
-    #lineQCDsyst = lineQCDsyst +"\n"        
-    f.write(line)
-    f.write(line_p)
-    f.write(line_indx)
-    f.write(line_rate)
-    f.write("------------\n")
+            line_indx.append("-"+ str(i+1))
+        line_rate.append(str(rate[i]))
+
+    card.append(" ".join(line)+"\n")
+    card.append(" ".join(line_p)+"\n")
+    card.append(" ".join(line_indx)+"\n")
+    card.append(" ".join(line_rate)+"\n")
+    card.append("------------\n")
     for scalesyst in scale_syst :
         payload = scalesyst+"\n"
-        f.write(payload)
+        card.append(payload)
     for shapsyst in lineSHsyst :
         payload = shapsyst+"\n"
-        f.write(payload)
-    
-    
-    f.close()
-    print (applyshapesyst)
+        card.append(payload)
+
+    with open(output_dir+"/"+card_name, "w") as f:
+        f.write("".join(card))
+
+    if verbose: print (applyshapesyst)
     #print "written datacard"
-    
+    return output_dir+"/"+card_name
+
+def read_integrals(filename):
+    # filename = A ROOT file full of TH1s
+    # Returns (histogram name, histogram integral) pairs in the order they appear in the file, a la TH1::Integral (no under/overflow)
+    # The file is opened once and closed straight after
+
+    import uproot # imported here so that importing this module stays light
+    integrals = []
+    with uproot.open(filename) as fin:
+        for h_name, classname in fin.classnames(recursive=False, cycle=False).items():
+            if "TH1" in classname:
+                integrals.append((h_name, float(np.sum(fin[h_name].values(flow=False), dtype=np.float64))))
+    return integrals
+
+def make_datacard(filename, output_dir, verbose=False):
+    # filename = The .input.root file to make a datacard for
+    # output_dir = Directory to write the datacard into
+    # Returns the path of the datacard
+
+    filename_no_path = os.path.basename(filename)
+    return write_datacard(output_dir, filename_no_path, *sort_histograms(read_integrals(filename), verbose), verbose=verbose)
+
+def make_datacards(Input_Dir, output_dir=None, jobs=None, verbose=False):
+    # Input_Dir = Directory to look for .root files in (recursively)
+    # output_dir = Directory to write the datacards into, by default Input_Dir
+    # jobs = Number of processes to make the datacards with, by default one per CPU. 1 makes them all in this process
+    # Returns the paths of the datacards, in the order the files were found
+
+    if output_dir is None:
+        output_dir = Input_Dir
+    if not os.path.exists(output_dir):
+        os.mkdir(output_dir)
+
+    filenames = [filename for filename in glob.iglob(Input_Dir+'/**', recursive=True) if os.path.isfile(filename) and ('.root' in filename)]
+    if jobs is None:
+        jobs = min(len(filenames), os.cpu_count() or 1)
+
+    if jobs <= 1:
+        return [make_datacard(filename, output_dir, verbose) for filename in filenames]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(make_datacard, filenames, [output_dir]*len(filenames), [verbose]*len(filenames)))
+
+def main():
+  Input_Dir = sys.argv[1]
+  output_dir = sys.argv[1]
+  jobs = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+  #Write output datacards
+  make_datacards(Input_Dir, output_dir, jobs, verbose=True)
+
+if __name__ == "__main__":
+    main()
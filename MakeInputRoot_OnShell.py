@@ -2,7 +2,10 @@
 
 import os, glob
 import sys
-import ROOT
+import numpy as np
+import concurrent.futures
+import Template_helper_methods
+# uproot is imported inside the functions that read and write files, so importing this module stays light
 
 # What this script does is trim and rename the template files and prepare them for the datacards.
 # The expected input is a list of templates that would belong to the sample datacard.
@@ -11,53 +14,138 @@ import ROOT
 # 1. First argument is the name of the template you want to create
 
 # 2. The next arguments are all of the input root files with the histrograms needed
-def Make_Template_With_Fake_Data(OutName,names):
+def Make_Template_With_Fake_Data(OutName,names,verbose=True):
   # OutName = Output Root File Name
   # names = Input Root Files 
+  # Every file is read once with uproot, data_obs is summed as arrays, and the output file is written in one go
+  # Returns the names of the histograms that were written (in order, starting with data_obs)
 
-  hists = [] # Holds the histograms to add to the final TFile
-  used_names = [] # Stores the names of the histrograms 
+  import uproot
+  hists = {} # Holds the histograms to add to the final file, keyed by name so the first one of each name wins
 
   for nm in names:
-    fin = ROOT.TFile.Open(nm)
-    for key in fin.GetListOfKeys():
-      if "TH1" in key.GetClassName():
-        h_name = key.GetName()
-        h_temp = fin.Get(h_name)
-        h_temp.SetDirectory(0)
-        if h_name not in used_names:
-          print(h_name)
-          hists.append(h_temp)
-          used_names.append(h_name)
-    fin.Close()
+    with uproot.open(nm) as fin:
+      for h_name, classname in fin.classnames(recursive=False, cycle=False).items():
+        if "TH1" in classname and h_name not in hists:
+          if verbose:
+            print(h_name)
+          hists[h_name] = fin[h_name]
 
   # Make a fake data histogram #
 
-  Fake_Data = []
-  for hist in hists:
-    h_name = hist.GetName()
-    if "0PM" in h_name:
-      Fake_Data.append(hist)
-    if "bkg" in h_name:
-      Fake_Data.append(hist)
+  Fake_Data = [hist for h_name, hist in hists.items() if ("0PM" in h_name or "bkg" in h_name)]
+  if not Fake_Data:
+    raise ValueError("No 0PM or bkg histograms found to build data_obs from!")
+
+  # a la TH1::Add, the contents and errors of every match (flow bins too) are summed, and the rest comes from the first match
+  counts = np.sum([hist.values(flow=True) for hist in Fake_Data], axis=0, dtype=float)
+  variances = np.sum([hist.variances(flow=True) for hist in Fake_Data], axis=0, dtype=float)
+  first = Fake_Data[0]
+  output = {"data_obs": Template_helper_methods.to_TH1(counts.astype(first.values().dtype), first.axis().edges(), variances, 
+                                                        first.member("fTitle"), flow=True)}
+
+  for h_name, hist in hists.items():
+    if ("bkg_ew_negative" not in h_name):
+      if ("bkg_ew_positive" in h_name):
+        output["bkg_ew"] = hist
+      else:
+        output[h_name] = hist
 
-  Fake_Data_Hist = Fake_Data[0].Clone("data_obs")
-  for i in range(1,len(Fake_Data)):
-    Fake_Data_Hist.Add(Fake_Data[i])
+  with uproot.recreate(OutName) as fout:
+    for h_name, hist in output.items():
+      fout[h_name] = hist
 
-  fout =  ROOT.TFile.Open(OutName,"recreate")
-  fout.cd()
+  if verbose:
+    print(OutName)
+  return list(output.keys())
 
-  Fake_Data_Hist.Write("data_obs")
+def fake_data_templates(hists):
+  # hists = Dictionary of histogram name -> (counts, bins) pairs a la numpy, in the order they should be written
+  # Returns the dictionary of histograms that go into the input ROOT file (in order, starting with data_obs)
+  # data_obs is the sum of the 0PM and bkg histograms, bkg_ew_negative is dropped, and bkg_ew_positive becomes bkg_ew
 
-  for hist in hists:
-    if ("bkg_ew_negative" not in hist.GetName()):
-      if ("bkg_ew_positive" in hist.GetName()):
-        hist.Write("bkg_ew")
-      else:
-        hist.Write()
+  Fake_Data = [counts for h_name, (counts, _) in hists.items() if ("0PM" in h_name or "bkg" in h_name)]
+  if not Fake_Data:
+    raise ValueError("No 0PM or bkg histograms found to build data_obs from!")
 
-  print(OutName)
+  bins = next(iter(hists.values()))[1]
+  output = {"data_obs": (np.sum(Fake_Data, axis=0, dtype=float), bins)}
+
+  for h_name, hist in hists.items():
+    if ("bkg_ew_negative" not in h_name):
+      if ("bkg_ew_positive" in h_name):
+        output["bkg_ew"] = hist
+      else:
+        output[h_name] = hist
+  return output
+
+def fake_data_variances(hists, variances):
+  # hists = Dictionary of histogram name -> (counts, bins) pairs a la numpy
+  # variances = Dictionary of histogram name -> per-bin variances, for whichever histograms have them
+  # Returns the variances of the histograms that go into the input ROOT file, renamed the same way fake_data_templates renames them
+  # data_obs only gets variances if every histogram that goes into it has them
+
+  output = {}
+  Fake_Data = [h_name for h_name in hists if ("0PM" in h_name or "bkg" in h_name)]
+  if Fake_Data and all(h_name in variances for h_name in Fake_Data):
+    output["data_obs"] = np.sum([variances[h_name] for h_name in Fake_Data], axis=0, dtype=float)
+
+  for h_name in hists:
+    if ("bkg_ew_negative" not in h_name) and h_name in variances:
+      output["bkg_ew" if "bkg_ew_positive" in h_name else h_name] = variances[h_name]
+  return output
+
+def Make_Template_With_Fake_Data_From_Arrays(OutName, hists, verbose=True, variances=None):
+  # OutName = Output Root File Name
+  # hists = Dictionary of histogram name -> (counts, bins) pairs a la numpy, in the order they should be written
+  # variances = Dictionary of histogram name -> per-bin variances, written out as the bin errors (optional)
+  # This does the same as Make_Template_With_Fake_Data, but straight from histograms already held in memory
+  # so that there is no need to reopen the template file with ROOT. The output file is written exactly once.
+  # Returns the dictionary of histograms that were written (in order, starting with data_obs)
+
+  import uproot
+  output = fake_data_templates(hists)
+  output_variances = fake_data_variances(hists, variances) if variances else {}
+  if verbose:
+    for h_name in hists:
+      print(h_name)
+
+  with uproot.recreate(OutName) as fout:
+    for h_name, hist in output.items():
+      if h_name in output_variances:
+        fout[h_name] = Template_helper_methods.to_TH1(*hist, output_variances[h_name])
+      else:
+        fout[h_name] = hist
+
+  if verbose:
+    print(OutName)
+  return output
+
+def input_name(filename):
+  # filename = A template ROOT file
+  # Returns the name of the .input.root file made from it (no filepath)
+  out_ext = filename.split("/")[-1]
+  return out_ext.split(".")[0]+".input."+out_ext.split(".")[1]
+
+def make_input_roots(Input_Dir, output_dir, jobs=None, verbose=True):
+  # Input_Dir = Directory to look for template .root files in (recursively)
+  # output_dir = Directory to write the .input.root files into
+  # jobs = Number of processes to work with, by default one per CPU. 1 does every file in this process
+  # Returns the paths of the .input.root files, in the order the templates were found
+
+  filenames = [filename for filename in glob.iglob(Input_Dir+'/**', recursive=True) if os.path.isfile(filename) and (".root" in filename)]
+  outnames = [output_dir+"/"+input_name(filename) for filename in filenames]
+  if jobs is None:
+    jobs = min(len(filenames), os.cpu_count() or 1)
+
+  if jobs <= 1:
+    for outname, filename in zip(outnames, filenames):
+      Make_Template_With_Fake_Data(outname, [filename], verbose)
+    return outnames
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+    list(pool.map(Make_Template_With_Fake_Data, outnames, [[filename] for filename in filenames], [verbose]*len(filenames)))
+  return outnames
 
 def main():
   output_dir = sys.argv[2]
@@ -70,14 +158,8 @@ def main():
       output_dir = output_dir.strip("/")
 
   Input_Dir = sys.argv[1]
-  for filename in glob.iglob(Input_Dir+'/**', recursive=True):
-    if os.path.isfile(filename) and (".root" in filename):
-      out_ext=filename
-      if "/" in filename:
-        out_ext = filename.split("/")[-1]
-        out_ext = out_ext.split(".")[0]+".input."+out_ext.split(".")[1]
-      Make_Template_With_Fake_Data(output_dir+"/"+out_ext,[filename]) 
+  jobs = int(sys.argv[3]) if len(sys.argv) > 3 else None
+  make_input_roots(Input_Dir, output_dir, jobs)
 
 if __name__ == "__main__":
     main()
-
@@ -1,11 +1,108 @@
+import os
 import numpy as np
-import mplhep as hep
-import matplotlib.pyplot as plt
-plt.style.use(hep.style.ROOT)
+import concurrent.futures
+#matplotlib, mplhep and tqdm are only imported once something is plotted, so that the sums here can be done without them
 
+_figure = None #every worker process draws on one figure and clears it in between plots
+_hep = None
+
+
+def _mplhep():
+    """Imports mplhep and applies its ROOT style the first time something is plotted
+
+    Returns
+    -------
+    module
+        mplhep
+    """
+    global _hep
+    if _hep is None:
+        import matplotlib
+        import mplhep
+        matplotlib.style.use(mplhep.style.ROOT)
+        _hep = mplhep
+    return _hep
+
+def _get_axes():
+    """Hands back the axes of this process' figure, cleared and ready to draw on. The figure is only made once per process.
+
+    Returns
+    -------
+    matplotlib.axes.Axes
+        The cleared axes
+    """
+    global _figure
+    if _figure is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        _mplhep()
+        _figure = Figure()
+        FigureCanvasAgg(_figure) #attaches the Agg renderer without touching pyplot
+        _figure.add_subplot()
+    ax = _figure.axes[0]
+    ax.cla()
+    return ax
+
+def stack_terms(terms):
+    """Stacks a list of numpy histograms that share their bins into a single matrix
+
+    Parameters
+    ----------
+    terms : list[tuple[numpy.ndarray, numpy.ndarray]]
+        A list of (count, bin) pairs (i.e. numpy histograms)
+
+    Returns
+    -------
+    tuple[numpy.ndarray, numpy.ndarray]
+        The (n_terms, nbins) matrix of counts, and the bins
+    """
+    bins = terms[0][1]
+    return np.array([term[0] for term in terms], dtype=float), bins
+
+def selection_matrix(names, combinations):
+    """Builds the matrix that picks which terms go into each combination
+
+    Parameters
+    ----------
+    names : list[str]
+        The names of every term, in the order they are stacked
+    combinations : list[list[str]]
+        The names of the terms that make up each combination
+
+    Returns
+    -------
+    numpy.ndarray
+        An (n_combinations, n_terms) matrix with a 1 wherever a term belongs to a combination
+    """
+    index = {name: n for n, name in enumerate(names)}
+    selection = np.zeros((len(combinations), len(names)), dtype=float)
+    for c, combination in enumerate(combinations):
+        for name in combination:
+            selection[c, index[name]] += 1
+    return selection
+
+def overall_interferences(terms, names, combinations):
+    """Computes the overall distribution of every combination at once with a single matrix product. Nothing is drawn.
+
+    Parameters
+    ----------
+    terms : list[tuple[numpy.ndarray, numpy.ndarray]]
+        A list of all the pure sample and interference terms. This should be a list of (count, bin) pairs (i.e. numpy histograms)
+    names : list[str]
+        A list of the names for all of these terms
+    combinations : list[list[str]]
+        The names of the terms that make up each combination
+
+    Returns
+    -------
+    tuple[numpy.ndarray, numpy.ndarray]
+        The (n_combinations, nbins) array of overall counts, and the bins
+    """
+    counts, bins = stack_terms(terms)
+    return selection_matrix(names, combinations) @ counts, bins
 
 def plot_overall_interference(terms, names,
-                              output_directory, output_filename):
+                              output_directory, output_filename, formats=("png", "pdf"), ax=None):
     """This function plots the overall plot of both interference and pure terms to plot everything
 
     Parameters
@@ -18,28 +115,80 @@ def plot_overall_interference(terms, names,
         The directory you would like to output to
     output_filename : str
         The filename you want to name the plots
+    formats : Iterable[str], optional
+        The file formats to save the plot as, by default ("png", "pdf")
+    ax : matplotlib.axes.Axes, optional
+        The axes to draw on, by default None (which reuses this process' figure)
 
     Returns
     -------
     tuple[numpy.ndarray, numpy.ndarray]
         the numpy histogram object of the overall sample
     """
-    
+
     if output_directory[-1] != '/':
         output_directory += '/'
-    
-    plt.cla()
-    plt.gca().axhline(zorder=-1, color='black', lw=2)
-    
-    bins = terms[0][1]
-    overall = np.zeros(len(bins) - 1, dtype=float)
+
+    hep = _mplhep()
+    if ax is None:
+        ax = _get_axes()
+    ax.axhline(zorder=-1, color='black', lw=2)
+
+    overall, bins = overall_interferences(terms, names, [names])
+    overall = overall[0]
     for n, term in enumerate(terms):
-        overall += term[0]
-        hep.histplot(term, label=names[n], lw=2)
-        
-    hep.histplot(overall, bins, label="Overall", lw=3)
-    plt.legend(loc="upper right")
-    plt.savefig(output_directory + output_filename + "overall_interference_plot.png")
-    plt.savefig(output_directory + output_filename + "overall_interference_plot.pdf")
-    
-    return overall, bins
\ No newline at end of file
+        hep.histplot(term, label=names[n], lw=2, ax=ax)
+
+    hep.histplot(overall, bins, label="Overall", lw=3, ax=ax)
+    ax.legend(loc="upper right")
+    for extension in formats:
+        ax.figure.savefig(output_directory + output_filename + "overall_interference_plot." + extension)
+
+    return overall, bins
+
+def _plot_overall_interference(arguments):
+    """Unpacks one plot's worth of arguments for plot_overall_interference so that it can be mapped over a pool
+
+    Parameters
+    ----------
+    arguments : tuple
+        (terms, names, output_directory, output_filename, formats)
+
+    Returns
+    -------
+    tuple[numpy.ndarray, numpy.ndarray]
+        the numpy histogram object of the overall sample
+    """
+    return plot_overall_interference(*arguments)
+
+def plot_overall_interferences(plots, output_directory, formats=("png", "pdf"), jobs=None):
+    """Draws a batch of overall interference plots across a pool of processes. Each process keeps one figure around and reuses it for every plot it draws.
+
+    Parameters
+    ----------
+    plots : list[tuple[list[tuple[numpy.ndarray, numpy.ndarray]], list[str], str]]
+        A list of (terms, names, output_filename) for every plot, where terms and names are as in plot_overall_interference
+    output_directory : str
+        The directory you would like to output to
+    formats : Iterable[str], optional
+        The file formats to save each plot as, by default ("png", "pdf")
+    jobs : int, optional
+        The number of processes to draw with, by default None (which uses one per CPU). 1 draws everything in this process.
+
+    Returns
+    -------
+    list[tuple[numpy.ndarray, numpy.ndarray]]
+        The overall sample of each plot, in the same order as plots
+    """
+    import tqdm
+    formats = tuple(formats)
+    arguments = [(terms, names, output_directory, output_filename, formats) for terms, names, output_filename in plots]
+    if jobs is None:
+        jobs = min(len(arguments), os.cpu_count() or 1)
+
+    if jobs <= 1:
+        return [_plot_overall_interference(argument) for argument in tqdm.tqdm(arguments, desc="Plotting interference")]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunksize = max(1, len(arguments)//(4*jobs)) #keeps the workers busy without shipping every plot separately
+        return list(tqdm.tqdm(pool.map(_plot_overall_interference, arguments, chunksize=chunksize), total=len(arguments), desc="Plotting interference"))
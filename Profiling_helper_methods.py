@@ -0,0 +1,126 @@
+import time
+import json
+import cProfile
+import contextlib
+import tracemalloc
+
+
+class Stage_profiler(object):
+    def __init__(self, memory=True, cprofile=False):
+        """Records how long each stage of the pipeline takes, how much memory it needs and how much it gets through.
+        Hand one of these to a template class (or wrap your own code with Stage_profiler.stage) and write out the report at the end.
+
+        Stages can nest (i.e. scaling a template bins the sample if it has not been binned yet), in which case the time and memory of the inner stage
+        count towards the outer one as well.
+
+        Parameters
+        ----------
+        memory : bool, optional
+            If true, the peak memory of each stage is traced with tracemalloc, by default True. This slows python allocations down a little.
+        cprofile : bool, optional
+            If true, everything from now until the report is written is also run under cProfile, by default False
+        """
+        self.memory = memory
+        self.stages = {} #stage name -> the totals for that stage
+        self._memory_stack = [] #[<traced memory when the stage began>, <highest traced memory seen so far>] for each stage that is running
+
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.cprofile = cProfile.Profile() if cprofile else None
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    @contextlib.contextmanager
+    def stage(self, name, events=0, nbytes=0):
+        """Times whatever runs inside the with block as part of a stage
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage (i.e. "load", "bin", "scale", "write", "plot" or "datacard")
+        events : int, optional
+            The number of events handled, by default 0
+        nbytes : int, optional
+            The number of bytes handled, by default 0
+
+        Yields
+        ------
+        dict
+            The record for this run of the stage. Set its "events" and "bytes" if they are only known once the stage has run.
+        """
+        record = {"events": events, "bytes": nbytes}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._memory_stack:
+                self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._memory_stack.append([current, current])
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+
+            peak_memory = 0
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                start, highest = self._memory_stack.pop()
+                highest = max(highest, peak)
+                peak_memory = highest - start
+                if self._memory_stack: #the outer stage saw this peak too
+                    self._memory_stack[-1][1] = max(self._memory_stack[-1][1], highest)
+
+            totals = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_memory": 0, "events": 0, "bytes": 0})
+            totals["calls"] += 1
+            totals["wall"] += wall
+            totals["cpu"] += cpu
+            totals["peak_memory"] = max(totals["peak_memory"], peak_memory)
+            totals["events"] += int(record["events"])
+            totals["bytes"] += int(record["bytes"])
+
+    def report(self):
+        """Summarizes every stage
+
+        Returns
+        -------
+        dict[str, dict]
+            For each stage: the number of calls, the total wall and CPU time (seconds), the largest peak memory of a single call (bytes),
+            the events and bytes handled, and the throughput in events and bytes per second of wall time
+        """
+        report = {}
+        for name, totals in self.stages.items():
+            report[name] = dict(totals)
+            report[name]["events_per_second"] = totals["events"]/totals["wall"] if totals["events"] and totals["wall"] > 0 else None
+            report[name]["bytes_per_second"] = totals["bytes"]/totals["wall"] if totals["bytes"] and totals["wall"] > 0 else None
+            report[name]["cpu_fraction"] = totals["cpu"]/totals["wall"] if totals["wall"] > 0 else None #well below 1 means waiting on I/O
+        return report
+
+    def write_report(self, filename, cprofile_filename=None):
+        """Writes the report out as JSON, and the cProfile statistics too if they were being collected
+
+        Parameters
+        ----------
+        filename : str
+            The JSON file to write
+        cprofile_filename : str, optional
+            The file to dump the cProfile statistics in (readable with pstats or snakeviz), by default None (which is <filename>.prof)
+        """
+        with open(filename, "w") as f:
+            json.dump({"stages": self.report()}, f, indent=1)
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            if cprofile_filename is None:
+                cprofile_filename = filename.rsplit('.', 1)[0] + ".prof"
+            self.cprofile.dump_stats(cprofile_filename)
+            self.cprofile.enable() #keeps collecting in case another report is written later
+
+    def stop(self):
+        """Stops tracing memory and profiling
+        """
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
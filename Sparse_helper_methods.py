@@ -0,0 +1,249 @@
+import numpy as np
+
+
+class Sparse_histogram(object):
+    def __init__(self, index, values, variances, shape, edges, fill_value=0.0, fill_variance=0.0):
+        """A histogram that only stores its non-empty bins, in COO form (the flattened index of every stored bin alongside its value and variance).
+        Every bin that is not stored holds fill_value. Fine 2D binnings are mostly empty, so this takes a fraction of the memory of the dense arrays,
+        and it can be scaled, added and unrolled without ever becoming dense. Call to_dense or histogram when writing it out.
+
+        Parameters
+        ----------
+        index : array_like
+            The flattened (C order) index of every stored bin, sorted and without repeats
+        values : array_like
+            The content of every stored bin
+        variances : array_like
+            The variance of every stored bin
+        shape : tuple[int]
+            The shape of the dense histogram (i.e. (xbins, ybins))
+        edges : tuple[numpy.ndarray]
+            The bin edges along every axis
+        fill_value : float, optional
+            The content of every bin that is not stored, by default 0.0
+        fill_variance : float, optional
+            The variance of every bin that is not stored, by default 0.0
+        """
+        self.index = np.asarray(index, dtype=np.intp)
+        self.values = np.asarray(values)
+        self.variances = np.asarray(variances, dtype=float)
+        self.shape = tuple(shape)
+        self.edges = tuple(np.asarray(edge, dtype=float) for edge in edges)
+        self.fill_value = fill_value
+        self.fill_variance = fill_variance
+
+    @classmethod
+    def from_dense(cls, counts, edges, variances=None):
+        """Makes a sparse histogram out of a dense one, keeping only the non-zero bins
+
+        Parameters
+        ----------
+        counts : numpy.ndarray
+            The dense counts
+        edges : tuple[numpy.ndarray]
+            The bin edges along every axis
+        variances : numpy.ndarray, optional
+            The variance of every bin, by default None (which takes the counts as the variances)
+
+        Returns
+        -------
+        Sparse_histogram
+            The sparse histogram
+        """
+        counts = np.asarray(counts)
+        index = np.flatnonzero(counts)
+        variances = counts if variances is None else np.asarray(variances)
+        return cls(index, counts.ravel()[index], variances.ravel()[index], counts.shape, edges)
+
+    @classmethod
+    def from_index(cls, index, binning, weights=None):
+        """Fills a sparse histogram straight from the bin indices of a sample, without ever making the dense array
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            The output of Binning.index or Binning_2D.index
+        binning : Union[Binning_helper_methods.Binning, Binning_helper_methods.Binning_2D]
+            The binning the indices were made with
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        Sparse_histogram
+            The sum of the weights (or the counts) and the sum of the weights squared of every bin that was filled
+        """
+        keep = index != binning.overflow
+        filled, inverse = np.unique(index[keep], return_inverse=True)
+        if weights is None:
+            sumw = np.bincount(inverse, minlength=len(filled)).astype(float)
+            sumw2 = sumw.copy()
+        else:
+            weights = np.asarray(weights, dtype=float)[keep]
+            sumw = np.bincount(inverse, weights=weights, minlength=len(filled))
+            sumw2 = np.bincount(inverse, weights=weights*weights, minlength=len(filled))
+        return cls(filled, sumw, sumw2, binning.shape, binning.edges_per_axis)
+
+    @property
+    def nbins(self):
+        """The number of bins of the dense histogram
+
+        Returns
+        -------
+        int
+            The product of the shape
+        """
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        """The memory the stored bins take up
+
+        Returns
+        -------
+        int
+            The number of bytes of the index, values and variances
+        """
+        return self.index.nbytes + self.values.nbytes + self.variances.nbytes
+
+    def _empty_bins(self):
+        """The number of bins that are not stored
+
+        Returns
+        -------
+        int
+            The number of bins that hold fill_value
+        """
+        return self.nbins - len(self.index)
+
+    def sum(self):
+        """The sum of every bin, stored or not
+
+        Returns
+        -------
+        float
+            The integral of the histogram
+        """
+        return float(np.sum(self.values, dtype=float)) + self.fill_value*self._empty_bins()
+
+    def scaled(self, scaleto):
+        """Scales the histogram according to its absolute area, a la Template_helper_methods.scale, with the variances scaled along with it
+
+        Parameters
+        ----------
+        scaleto : float
+            The absolute area to scale to
+
+        Returns
+        -------
+        Sparse_histogram
+            The scaled histogram
+        """
+        area = float(np.sum(np.abs(self.values), dtype=float)) + abs(self.fill_value)*self._empty_bins()
+        factor = scaleto/area
+        return Sparse_histogram(self.index, self.values.astype(float)*factor, self.variances*factor**2, self.shape, self.edges,
+                                self.fill_value*factor, self.fill_variance*factor**2)
+
+    def __add__(self, other):
+        return add([self, other])
+
+    def to_dense(self):
+        """Turns the histogram into dense arrays. This should only be needed when writing it out.
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray]
+            The dense counts and variances
+        """
+        counts = np.full(self.nbins, self.fill_value, dtype=self.values.dtype)
+        counts[self.index] = self.values
+        variances = np.full(self.nbins, self.fill_variance, dtype=float)
+        variances[self.index] = self.variances
+        return counts.reshape(self.shape), variances.reshape(self.shape)
+
+    def histogram(self):
+        """Turns the histogram into a dense numpy-style histogram
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, ...]
+            (counts, bins) or (counts, binsx, binsy) a la a numpy histogram
+        """
+        return (self.to_dense()[0],) + self.edges
+
+    def unroll(self, name):
+        """Unrolls a 2D histogram into its positive and negative 1D parts a la Template_helper_methods.unroll_2D, without making it dense.
+        The unrolled index runs over x first, then y. Empty background bins are given 10% of the average bin content through the fill value.
+
+        Parameters
+        ----------
+        name : str
+            The name of the histogram
+
+        Returns
+        -------
+        list[tuple[str, Sparse_histogram]]
+            (name, histogram) for each of the positive and negative parts that are worth writing
+        """
+        import Template_helper_methods #imported here since Template_helper_methods imports this module
+        xbins, ybins = self.shape
+        unrolled_index = (self.index % ybins)*xbins + self.index//ybins
+        order = np.argsort(unrolled_index)
+        index = unrolled_index[order]
+        cont = self.values.astype(float)[order]
+        fill = self.fill_value
+
+        has_negative = bool(np.any(cont < 0) or (fill < 0 and self._empty_bins()))
+        if "bkg" in name:
+            average = 0.1*self.sum()/self.nbins
+            cont = np.where(cont == 0, average, cont) #put small values in empty background bins
+            if fill == 0:
+                fill = average
+
+        pos = np.where(cont < 0, 0, cont).astype(np.float32)
+        neg = np.where(cont < 0, -cont, 0).astype(np.float32)
+        pos_fill = np.float32(max(fill, 0))
+        neg_fill = np.float32(max(-fill, 0))
+
+        tpname, tnname = Template_helper_methods._unrolled_names(name, has_negative)
+        edges = (np.arange(self.nbins + 1, dtype=float),)
+        empty_bins = self._empty_bins()
+
+        unrolled = []
+        if np.sum(pos) + pos_fill*empty_bins > 0:
+            unrolled.append((tpname, Sparse_histogram(index, pos, pos.astype(float), (self.nbins,), edges, pos_fill, float(pos_fill))))
+        if np.sum(neg) + neg_fill*empty_bins > 0:
+            unrolled.append((tnname, Sparse_histogram(index, neg, neg.astype(float)**2, (self.nbins,), edges, neg_fill, float(neg_fill)**2)))
+        return unrolled
+
+
+def add(histograms):
+    """Adds sparse histograms that share their binning, without making any of them dense
+
+    Parameters
+    ----------
+    histograms : list[Sparse_histogram]
+        The histograms to add
+
+    Returns
+    -------
+    Sparse_histogram
+        Their sum, storing every bin that any of them stores
+
+    Raises
+    ------
+    ValueError
+        If the histograms do not share their binning
+    """
+    first = histograms[0]
+    for hist in histograms[1:]:
+        if hist.shape != first.shape or not all(np.array_equal(a, b) for a, b in zip(hist.edges, first.edges)):
+            raise ValueError("Only histograms with the same binning can be added!")
+
+    index, inverse = np.unique(np.concatenate([hist.index for hist in histograms]), return_inverse=True)
+    fill_value = sum(hist.fill_value for hist in histograms)
+    fill_variance = sum(hist.fill_variance for hist in histograms)
+    #every bin starts from the sum of the fill values, and each histogram that stores it swaps its own fill value for what it stores
+    values = fill_value + np.bincount(inverse, weights=np.concatenate([hist.values - hist.fill_value for hist in histograms]), minlength=len(index))
+    variances = fill_variance + np.bincount(inverse, weights=np.concatenate([hist.variances - hist.fill_variance for hist in histograms]), minlength=len(index))
+    return Sparse_histogram(index, values, variances, first.shape, first.edges, fill_value, fill_variance)
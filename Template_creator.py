@@ -1,23 +1,87 @@
 import Mass_interference_helper_methods as mihm
-from collections.abc import Iterable
-import matplotlib.pyplot as plt
+import Adaptive_binning_helper_methods
 import Template_helper_methods
-import mplhep as hep
-import pandas as pd
+import Binning_helper_methods
+import Sparse_helper_methods
+import MakeInputRoot_OnShell
+import DatacardMaker_OnShell
 import numpy as np
+import itertools
 import warnings
+import hashlib
 import shutil
-import uproot
-import tqdm
-import ROOT
+import contextlib
 import time
-import copy
+import glob
+import json
 import os
+#matplotlib and uproot are only imported once something is plotted or written, so that workers that only bin and scale stay light
 
-plt.style.use(hep.style.ROOT)
+_plt = None
+
+def _pyplot():
+    """Imports pyplot and applies the ROOT style of mplhep the first time something is plotted
+
+    Returns
+    -------
+    module
+        matplotlib.pyplot
+    """
+    global _plt
+    if _plt is None:
+        import mplhep as hep
+        import matplotlib.pyplot as plt
+        plt.style.use(hep.style.ROOT)
+        _plt = plt
+    return _plt
+
+class _Tracked_dict(dict):
+    def __init__(self, on_change, *args, **kwargs):
+        """A dictionary that calls on_change whenever it is altered, so that anything computed from its contents can be thrown away
+
+        Parameters
+        ----------
+        on_change : Callable[[], None]
+            What to call whenever the dictionary changes
+        """
+        super().__init__(*args, **kwargs)
+        self.on_change = on_change
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.on_change()
+    
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.on_change()
+    
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.on_change()
+    
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self.on_change()
+        return value
+    
+    def pop(self, *args):
+        value = super().pop(*args)
+        self.on_change()
+        return value
+    
+    def popitem(self):
+        value = super().popitem()
+        self.on_change()
+        return value
+    
+    def clear(self):
+        super().clear()
+        self.on_change()
 
 class Template_creator(object):
-    def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim):
+    MANIFEST_NAME = ".manifest.json" #the dot keeps it out of the way of the globs that clean the output folders
+    
+    def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler=None, bkg_weights=None, sample_dtype=None):
         """This serves as a parent class for all other templates made
 
         Parameters
@@ -28,6 +92,7 @@ class Template_creator(object):
             The filenames contained in all your outputs
         bkgs : list[list[float]]
             A list of background iterables. These can be lists of mass distriutions, lists of angle distributions, etc. bkgs is essentially a list of lists.
+            When streaming, these can also be Binning_helper_methods.HistogramAccumulator objects.
         bkgNames : list[str]
             A list of names for each background. This should be the same dimension as bkgs.
         bkg_areas : list[Union[float, int]]
@@ -36,6 +101,13 @@ class Template_creator(object):
             The lower limit of your attribute's range (i.e. if it was phi, lowerlim would be -pi)
         upperlim : float
             The upper limit of your attribute's range (i.e. if it was phi, upperlim would be pi)
+        profiler : Profiling_helper_methods.Stage_profiler, optional
+            If given, every stage (binning, scaling, writing, plotting and datacards) is timed and traced with it, by default None
+        bkg_weights : list[list[float]], optional
+            A list of per-event weights for each background (or None for an unweighted one), in the same order as bkgs, by default None
+        sample_dtype : numpy.dtype, optional
+            The dtype to store every sample and its weights as (i.e. numpy.float32 to halve their memory), by default None (which keeps samples as they come in).
+            Arrays and memory maps that already have it are never copied, see Binning_helper_methods.as_sample.
         """
         self.running_location = os.getcwd()
         if 'HexUtils' in self.running_location:
@@ -45,6 +117,8 @@ class Template_creator(object):
             warnings.warn("Not in an instance of HexUtils! This will lead to undefined behavior!")
         
         self.dimension = 0 #This attribute is set when creating a certain dimension of template
+        self.profiler = profiler #this is opt-in, and None means nothing is recorded
+        self.sample_dtype = sample_dtype #None keeps every sample in the dtype it came in
         
         
         self.output_directory = os.path.abspath(output_directory)
@@ -55,24 +129,559 @@ class Template_creator(object):
         self.lowerlim = lowerlim
         self.upperlim = upperlim
         self.discr_range = (0,1) #This is (0,1) for most templates, but (-1,1) for hypothesis interference templates
+        self.category = "" #the category the datacard is for (i.e. "Untagged"), which picks out the category-dependent systematics
+        self.scale_systematics = DatacardMaker_OnShell.SCALE_SYSTEMATICS #the lnN systematics written into the datacard, see DatacardMaker_OnShell.era_systematics
+        self.binning = None #This is the binning that scaled_signals and scaled_bkgs are made with, set by the template classes
         
-        self.signals = {} #this is a dictionary with values that look like (<raw_data>, <area desired>)
-        self.scaled_signals = {} #this is a dictionary that should contain scaled histograms of your raw data.
-        #so the values should look like (<counts>, <bins>)
-        self.signal_weights = {} #this is a dictionary that should hold the probabilities from MELA should you choose to use them
-        self.discr_signals = {} #this is a dictionary that should hold the discriminants that your signals are using
+        self._template_cache = {} #this memoizes every scaled template, and is emptied whenever signals or bkgs change
+        self._bin_indices = {} #this caches the bin index of every event, keyed by (<sample name>, <binning key>)
+        #so that each sample is only ever binned once per binning
+        
+        self.signals = _Tracked_dict(self.invalidate_templates) #this is a dictionary with values that look like (<raw_data>, <area desired>)
+        #the scaled histograms of your raw data are worked out from it lazily, see scaled_signals
+        self.signal_weights = _Tracked_dict(self.invalidate_templates) #this is a dictionary that holds per-event weights (i.e. generator weights or probabilities from MELA)
+        #signals with weights are histogrammed with them, and the sum of their weights squared becomes the variance of each bin
+        self.discr_signals = _Tracked_dict(self.invalidate_templates) #this is a dictionary that should hold the discriminants that your signals are using
         #both signal weights and discr_weights contain ITERABLES! Each value should be an iterable of values!!
         
         ################### The dictionaries below are the versions of the above dictionaries but for background ###########
-        self.bkgs = {}
-        self.scaled_bkgs = {}
-        self.bkg_weights = {}
-        self.discr_bkgs = {}
+        self.bkgs = _Tracked_dict(self.invalidate_templates)
+        self.bkg_weights = _Tracked_dict(self.invalidate_templates)
+        self.discr_bkgs = _Tracked_dict(self.invalidate_templates)
+        
+        self.templates = {} #this holds every histogram that goes into the output ROOT file, keyed by the name it is written under
+        #the values look like (<counts>, <bins>), and are what create_datacards uses when running in-process
+        self.template_variances = {} #this holds the variance of every bin of the templates above, which is written out as the bin errors
+        self._variance_cache = {} #the variances of the memoized scaled templates, under the same keys
         
         for name, bkg_sample, bkg_area in zip(bkgNames, bkgs, bkg_areas):
-            self.bkgs[name] = (bkg_sample, bkg_area) #preprocessing the background samples
+            self.bkgs[name] = (Binning_helper_methods.as_sample(bkg_sample, sample_dtype), bkg_area) #preprocessing the background samples
+        if bkg_weights is not None:
+            for name, weights in zip(bkgNames, bkg_weights):
+                if weights is not None:
+                    self.bkg_weights[name] = Binning_helper_methods.as_weights(weights, sample_dtype)
             
-    def create_datacards(self, verbose=False, clean=True):
+    def _as_binning(self, bins=None):
+        """Turns whatever describes a binning into a Binning_helper_methods.Binning
+
+        Parameters
+        ----------
+        bins : Union[int, array_like, Binning_helper_methods.Binning], optional
+            Either the number of bins you want over (lowerlim, upperlim), a list of the bin edges you want, or a Binning, by default None (which is self.binning)
+
+        Returns
+        -------
+        Binning_helper_methods.Binning
+            The binning
+
+        Raises
+        ------
+        ValueError
+            If no binning is given and this template has no binning of its own yet
+        """
+        if bins is None:
+            if self.binning is None:
+                raise ValueError("No binning was given, and no templates have been made yet to take one from!")
+            return self.binning
+        if isinstance(bins, Binning_helper_methods.Binning):
+            return bins
+        return Binning_helper_methods.Binning(bins, self.lowerlim, self.upperlim)
+    
+    def _stage(self, name, events=0, nbytes=0):
+        """Times a stage of the pipeline with self.profiler, if there is one
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+        events : int, optional
+            The number of events handled, by default 0
+        nbytes : int, optional
+            The number of bytes handled, by default 0
+
+        Returns
+        -------
+        ContextManager[dict]
+            A context manager that yields the record of this run of the stage
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext({"events": events, "bytes": nbytes})
+        return self.profiler.stage(name, events, nbytes)
+    
+    def invalidate_templates(self):
+        """Throws away every memoized scaled template. This is called whenever signals, bkgs or their weights change.
+        """
+        self._template_cache.clear()
+        self._variance_cache.clear()
+    
+    def _sample_and_area(self, name):
+        """Looks up a signal or background by name
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+
+        Returns
+        -------
+        tuple
+            (<raw_data>, <area desired>)
+        """
+        if name in self.bkgs:
+            return self.bkgs[name]
+        return self.signals[name]
+    
+    def _event_weights(self, name):
+        """Looks up the per-event weights of a signal or background by name
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+
+        Returns
+        -------
+        Union[numpy.ndarray, None]
+            The weights, or None if the sample is unweighted
+        """
+        if name in self.bkgs:
+            return self.bkg_weights.get(name)
+        return self.signal_weights.get(name)
+    
+    def _template_inputs(self, name):
+        """Everything besides the binning and the raw data that the scaled template of a sample depends on. This goes into the memoization key.
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+
+        Returns
+        -------
+        Hashable
+            By default, the area the sample is scaled to
+        """
+        return self._sample_and_area(name)[1]
+    
+    def _scale_template(self, name, binning):
+        """Computes the scaled template of a sample and its variances. Template classes that scale their samples differently override this.
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+        binning : Binning_helper_methods.Binning
+            The binning to use
+
+        Returns
+        -------
+        Tuple[Tuple[numpy.ndarray, ...], numpy.ndarray]
+            (counts, bins) a la a numpy histogram (or (counts, binsx, binsy) in 2D), and the variance of each bin
+        """
+        sample, area = self._sample_and_area(name)
+        hist, variances = self.histogram_with_variances(name, sample, binning, self._event_weights(name))
+        counts, variances = Template_helper_methods.scale_with_variances(hist[0], variances, area)
+        return (counts,) + hist[1:], variances
+    
+    def scaled_template(self, name, bins=None):
+        """Returns the scaled histogram of a signal or background. It is computed the first time it is asked for and memoized per (binning, range, area),
+        so plotting, writing and the datacards all share the same arrays. The arrays are read-only for that reason.
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+        bins : Union[int, array_like, Binning_helper_methods.Binning], optional
+            The binning to use, by default None (which is self.binning). The bin edges carry the range.
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, ...]
+            (counts, bins) a la a numpy histogram, or (counts, binsx, binsy) for 2D templates
+        """
+        binning = self._as_binning(bins)
+        key = (name, binning.key, self._template_inputs(name))
+        if key not in self._template_cache:
+            with self._stage("scale"):
+                hist, variances = self._scale_template(name, binning)
+            hist[0].setflags(write=False) #these are shared by everyone who asks, so no one may change them in place
+            variances.setflags(write=False)
+            self._template_cache[key] = hist
+            self._variance_cache[key] = variances
+        return self._template_cache[key]
+    
+    def scaled_variances(self, name, bins=None):
+        """Returns the variance of every bin of the scaled histogram of a signal or background, memoized alongside scaled_template
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+        bins : Union[int, array_like, Binning_helper_methods.Binning], optional
+            The binning to use, by default None (which is self.binning)
+
+        Returns
+        -------
+        numpy.ndarray
+            The variance of each bin (the sum of the weights squared, scaled along with the counts)
+        """
+        binning = self._as_binning(bins)
+        self.scaled_template(name, binning)
+        return self._variance_cache[(name, binning.key, self._template_inputs(name))]
+    
+    @property
+    def scaled_signals(self):
+        """The scaled histograms of every signal with the current binning, computed lazily and memoized
+
+        Returns
+        -------
+        dict[str, Tuple[numpy.ndarray, numpy.ndarray]]
+            (counts, bins) for every signal
+        """
+        return {name: self.scaled_template(name) for name in self.signals}
+    
+    @property
+    def scaled_bkgs(self):
+        """The scaled histograms of every background with the current binning, computed lazily and memoized
+
+        Returns
+        -------
+        dict[str, Tuple[numpy.ndarray, numpy.ndarray]]
+            (counts, bins) for every background
+        """
+        return {name: self.scaled_template(name) for name in self.bkgs}
+    
+    def histogram(self, name, sample, bins, weights=None):
+        """Histograms a sample using the shared bin-index engine in Binning_helper_methods.
+        The bin index of every event is cached, so histogramming the same sample with the same binning again only costs a numpy.bincount.
+
+        Parameters
+        ----------
+        name : str
+            The name of the sample, used as part of the cache key
+        sample : Union[array_like, Binning_helper_methods.HistogramAccumulator]
+            An iterable of values, or a histogram that was accumulated while streaming the sample
+        bins : Union[int, array_like, Binning_helper_methods.Binning]
+            Either the number of bins you want over (lowerlim, upperlim), a list of the bin edges you want, or a Binning
+        weights : array_like, optional
+            A weight for every event, by default None
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, ...]
+            (counts, bins) a la a numpy histogram, or (counts, binsx, binsy) for 2D templates
+
+        Raises
+        ------
+        ValueError
+            If an accumulated histogram was made with a different binning, or weights are given alongside one
+        """
+        bins = self._as_binning(bins)
+        
+        if isinstance(sample, Binning_helper_methods.HistogramAccumulator): #streamed samples arrive already binned
+            self._check_accumulator(name, sample, bins, weights)
+            return sample.histogram()
+        
+        with self._stage("bin", len(sample), getattr(sample, "nbytes", 0)):
+            return (bins.fill(self._bin_index(name, sample, bins), weights),) + bins.edges_per_axis
+    
+    def histogram_with_variances(self, name, sample, bins, weights=None):
+        """Histograms a sample like histogram does, filling the sum of weights squared of every bin in the same pass
+
+        Parameters
+        ----------
+        name : str
+            The name of the sample, used as part of the cache key
+        sample : Union[array_like, Binning_helper_methods.HistogramAccumulator]
+            An iterable of values, or a histogram that was accumulated while streaming the sample
+        bins : Union[int, array_like, Binning_helper_methods.Binning]
+            Either the number of bins you want over (lowerlim, upperlim), a list of the bin edges you want, or a Binning
+        weights : array_like, optional
+            A weight for every event, by default None (which gives Poisson variances)
+
+        Returns
+        -------
+        Tuple[Tuple[numpy.ndarray, ...], numpy.ndarray]
+            (sumw, bins) a la a numpy histogram (or (sumw, binsx, binsy) for 2D templates), and the sum of the weights squared in each bin
+
+        Raises
+        ------
+        ValueError
+            If an accumulated histogram was made with a different binning, or weights are given alongside one
+        """
+        bins = self._as_binning(bins)
+        
+        if isinstance(sample, Binning_helper_methods.HistogramAccumulator):
+            self._check_accumulator(name, sample, bins, weights)
+            return sample.histogram(), sample.variances()
+        
+        with self._stage("bin", len(sample), getattr(sample, "nbytes", 0)):
+            sumw, sumw2 = bins.fill_with_variances(self._bin_index(name, sample, bins), weights)
+            return (sumw,) + bins.edges_per_axis, sumw2
+    
+    @staticmethod
+    def _check_accumulator(name, accumulator, bins, weights):
+        """Makes sure an accumulated histogram can be used as it is
+
+        Parameters
+        ----------
+        name : str
+            The name of the sample
+        accumulator : Binning_helper_methods.HistogramAccumulator
+            The accumulated histogram
+        bins : Binning_helper_methods.Binning
+            The binning being asked for
+        weights : array_like
+            The weights being asked for
+
+        Raises
+        ------
+        ValueError
+            If the accumulated histogram was made with a different binning, or weights are given alongside it
+        """
+        if accumulator.binning.key != bins.key:
+            raise ValueError("The accumulated histogram for " + name + " was made with a different binning!")
+        if weights is not None:
+            raise ValueError("Weights must be given when filling the accumulator for " + name + ", not afterwards!")
+    
+    def _bin_index(self, name, sample, bins):
+        """Returns the bin index of every event in a sample, computing it only the first time a sample is binned with a binning
+
+        Parameters
+        ----------
+        name : str
+            The name of the sample, used as part of the cache key
+        sample : numpy.ndarray
+            The events
+        bins : Binning_helper_methods.Binning
+            The binning
+
+        Returns
+        -------
+        numpy.ndarray
+            The output of Binning.index
+        """
+        key = (name, bins.key)
+        if key not in self._bin_indices or self._bin_indices[key][0] is not sample: #a new sample under the same name needs rebinning
+            self._bin_indices[key] = (sample, bins.index(sample))
+        return self._bin_indices[key][1]
+    
+    def drop_events(self, bins=None):
+        """Switches to histogram-only mode: every sample is binned one last time and replaced by its histogram (a Binning_helper_methods.HistogramAccumulator),
+        and its events, weights, discriminant and cached bin indices are all let go of. Only the histograms are kept from then on,
+        so templates can still be made, scaled and written with this binning but not with any other one.
+        The events are only freed once nothing outside of this object holds on to them either.
+
+        Parameters
+        ----------
+        bins : Union[int, array_like, Binning_helper_methods.Binning], optional
+            The binning to keep the histograms in, by default None (which is self.binning)
+        """
+        binning = self._as_binning(bins)
+        for samples, weights, discriminants in ((self.signals, self.signal_weights, self.discr_signals), (self.bkgs, self.bkg_weights, self.discr_bkgs)):
+            for name, (sample, area) in list(samples.items()):
+                if isinstance(sample, Binning_helper_methods.HistogramAccumulator): #streamed samples never had any events to begin with
+                    continue
+                with self._stage("bin", len(sample), getattr(sample, "nbytes", 0)):
+                    accumulator = Binning_helper_methods.HistogramAccumulator.from_index(binning, self._bin_index(name, sample, binning), weights.get(name))
+                samples[name] = (accumulator, area)
+                weights.pop(name, None) #the weights are in the accumulator now
+                discriminants.pop(name, None)
+        self._bin_indices.clear()
+    
+    @property
+    def event_nbytes(self):
+        """The memory held by the events of every sample, along with their weights, discriminants and cached bin indices
+
+        Returns
+        -------
+        int
+            The number of bytes, which is 0 for memory-mapped arrays that are still on disk and small once drop_events has been called
+        """
+        arrays = [sample for sample, _ in itertools.chain(self.signals.values(), self.bkgs.values())]
+        arrays += list(itertools.chain(self.signal_weights.values(), self.bkg_weights.values(), self.discr_signals.values(), self.discr_bkgs.values()))
+        arrays += [cached[-1] for cached in self._bin_indices.values()]
+        return sum(self._in_memory_nbytes(array) for array in arrays)
+    
+    @staticmethod
+    def _in_memory_nbytes(array):
+        """The memory an array takes up outside of the files it is mapped from
+
+        Parameters
+        ----------
+        array : Union[array_like, Binning_helper_methods.HistogramAccumulator]
+            The array, or an accumulated histogram
+
+        Returns
+        -------
+        int
+            The number of bytes it holds, or 0 if it is a view of a memory map
+        """
+        if isinstance(array, Binning_helper_methods.HistogramAccumulator):
+            return array.counts.nbytes + array.sumw2.nbytes
+        array = np.asanyarray(array)
+        base = array
+        while base is not None:
+            if isinstance(base, np.memmap):
+                return 0
+            base = getattr(base, "base", None)
+        return array.nbytes
+    
+    def write_templates(self, output_directory=None, templates=None, variances=None):
+        """Writes every histogram in self.templates to the output ROOT file in one go. Histograms with variances are written with them as their bin errors.
+
+        Parameters
+        ----------
+        output_directory : str, optional
+            The directory to write the ROOT file in, by default None (which is self.output_directory)
+        templates : dict[str, Union[Tuple[numpy.ndarray, ...], Sparse_helper_methods.Sparse_histogram]], optional
+            The histograms to write instead of self.templates, by default None. Sparse histograms carry their own variances.
+        variances : dict[str, numpy.ndarray], optional
+            The variances of those histograms, by default None (which is self.template_variances when writing self.templates)
+        """
+        if output_directory is None:
+            output_directory = self.output_directory
+        if templates is None:
+            templates = self.templates
+            if variances is None:
+                variances = self.template_variances
+        if variances is None:
+            variances = {}
+        
+        import uproot
+        filename = os.path.join(output_directory, self.fname + ".root")
+        with self._stage("write") as record:
+            with uproot.recreate(filename) as f:
+                for name, hist in templates.items():
+                    hist_variances = variances.get(name)
+                    if isinstance(hist, Sparse_helper_methods.Sparse_histogram): #sparse templates are only made dense now
+                        counts, hist_variances = hist.to_dense()
+                        hist = (counts,) + hist.edges
+                    if hist_variances is not None and len(hist) == 2: #only 1D histograms are written with their variances
+                        f[name] = Template_helper_methods.to_TH1(*hist, hist_variances)
+                    else:
+                        f[name] = hist
+            record["bytes"] = os.path.getsize(filename)
+    
+    @staticmethod
+    def _clean_folder(folder):
+        """Removes all the files (but not the subdirectories) inside a folder
+
+        Parameters
+        ----------
+        folder : str
+            The folder you would like to wipe
+        """
+        for filename in glob.glob(folder + '*'):
+            if os.path.isfile(filename):
+                os.remove(filename)
+    
+    @staticmethod
+    def _hash(*parts):
+        """Hashes strings and arrays together
+
+        Parameters
+        ----------
+        *parts : Union[str, numpy.ndarray]
+            The things to hash
+
+        Returns
+        -------
+        str
+            The sha1 hex digest
+        """
+        digest = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, str):
+                digest.update(part.encode())
+            else:
+                part = np.ascontiguousarray(part)
+                digest.update(str(part.dtype).encode() + str(part.shape).encode())
+                digest.update(part.tobytes())
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def _manifest(self, templates, variances):
+        """Records everything the input ROOT file and datacard depend on: a content hash of each template (and its variances), the binning, the areas and the systematics
+
+        Parameters
+        ----------
+        templates : dict[str, Tuple[numpy.ndarray, numpy.ndarray]]
+            The histograms going into the input ROOT file
+        variances : dict[str, numpy.ndarray]
+            The variances of those histograms
+
+        Returns
+        -------
+        dict
+            The manifest, with the hash of every output's dependencies under "outputs"
+        """
+        bins = next(iter(templates.values()))[1]
+        manifest = {
+            "templates": {name: self._hash(counts, edges, *([variances[name]] if name in variances else [])) for name, (counts, edges) in templates.items()},
+            "binning": [float(edge) for edge in bins],
+            "areas": {name: float(np.sum(np.abs(counts))) for name, (counts, _) in templates.items()},
+            "systematics": self._hash(json.dumps(DatacardMaker_OnShell.systematics_configuration(self.scale_systematics, self.category))),
+        }
+        inputs = self._hash(json.dumps([manifest["templates"], manifest["binning"]])) #the order of the templates matters too
+        manifest["outputs"] = {
+            self.fname + ".input.root": inputs,
+            self.fname + ".onshell.txt": self._hash(inputs, manifest["systematics"])
+        }
+        return manifest
+    
+    @staticmethod
+    def _all_1D(templates):
+        """Whether every template is a 1D (counts, edges) pair, which is all that the input ROOT file and datacard can be built from in-process
+
+        Parameters
+        ----------
+        templates : dict
+            The histograms going into the input ROOT file
+
+        Returns
+        -------
+        bool
+            False if any template is 2D or sparse
+        """
+        return all(isinstance(template, tuple) and len(template) == 2 and np.ndim(template[0]) == 1 for template in templates.values())
+    
+    @staticmethod
+    def _read_manifest(filename):
+        """Reads a manifest left behind by a previous run
+
+        Parameters
+        ----------
+        filename : str
+            The manifest file
+
+        Returns
+        -------
+        dict
+            The manifest, or an empty one if there is no (readable) manifest
+        """
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    @staticmethod
+    def _write_manifest(filename, manifest):
+        """Writes a manifest, via a temporary file so that an interrupted write never leaves half a manifest behind
+
+        Parameters
+        ----------
+        filename : str
+            The manifest file
+        manifest : dict
+            The manifest
+        """
+        with open(filename + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(filename + ".tmp", filename)
+    
+    def create_datacards(self, verbose=False, clean=True, in_process=True, output_directory=None, templates=None, incremental=True, variances=None):
         """This function uses DatacardMaker_OnShell and MakeInputRoot_OnShell to generate the datacards and input for Higgs Combine
 
         Parameters
@@ -80,39 +689,125 @@ class Template_creator(object):
         verbose : bool, optional
             Whether you would like verbosity, by default False
         clean : bool, optional
-            Whether you would like to wipe your output folders before putting anything else in them, by default True
+            Whether you would like to wipe your output folders before putting anything else in them, by default True.
+            When running incrementally, only the stale files that this run does not produce are removed.
+        in_process : bool, optional
+            If true, the input ROOT file and datacard are built straight from self.templates without launching new Python interpreters, by default True.
+            If there are no templates in memory, or any of them is not a 1D (counts, edges) pair (i.e. 2D or sparse templates), this falls back to running the two scripts,
+            which only write the default systematics (so self.category and self.scale_systematics must be left as they are).
+        output_directory : str, optional
+            The directory holding the template ROOT file, by default None (which is self.output_directory)
+        templates : dict[str, Union[Tuple[numpy.ndarray, ...], Sparse_helper_methods.Sparse_histogram]], optional
+            The histograms in that ROOT file, by default None (which is self.templates)
+        incremental : bool, optional
+            If true (and running in-process), a manifest of what every output depends on is kept in the output folder,
+            and only the outputs whose dependencies changed since the last run are made again, by default True
+        variances : dict[str, numpy.ndarray], optional
+            The variances of those histograms, by default None (which is self.template_variances when using self.templates)
+
+        Returns
+        -------
+        list[str]
+            The outputs that were (re)made. Running the two scripts remakes everything.
+
+        Raises
+        ------
+        ValueError
+            If a category or non-default scale_systematics are set but the two scripts have to be run
+        RuntimeError
+            If either of the two scripts fails
         """
-        filename = self.output_directory + self.fname + ".root"
-        in_folder = self.output_directory + self.fname
+        with self._stage("datacard"):
+            return self._create_datacards(verbose, clean, in_process, output_directory, templates, incremental, variances)
+    
+    def _create_datacards(self, verbose, clean, in_process, output_directory, templates, incremental, variances):
+        """Does the work of create_datacards, which has the details
+        """
+        if output_directory is None:
+            output_directory = self.output_directory
+        if templates is None:
+            templates = self.templates
+            if variances is None:
+                variances = self.template_variances
+        if variances is None:
+            variances = {}
+        output_directory = os.path.join(output_directory, '') #makes sure there is a slash at the end
+        
+        filename = output_directory + self.fname + ".root"
+        in_folder = output_directory + self.fname
         out_folder = in_folder+"_out"
         
         in_folder += '/'
         out_folder += '/'
         
+        in_process = in_process and bool(templates) and self._all_1D(templates) #2D and sparse templates are only written out by the scripts
+        incremental = incremental and in_process
+        if not in_process and (self.category or list(self.scale_systematics) != DatacardMaker_OnShell.SCALE_SYSTEMATICS):
+            raise ValueError("DatacardMaker_OnShell.py only writes the default systematics, so a category or scale_systematics "
+                             "can only be used with 1D templates in memory and in_process=True!")
+        
         if not os.path.isdir(in_folder):
             os.mkdir(in_folder)
-        if clean:
-            os.system("rm " + in_folder + '*')
-        shutil.move(filename, in_folder)
+        if clean and not incremental:
+            self._clean_folder(in_folder)
+        shutil.move(filename, in_folder + self.fname + ".root")
         
         if not os.path.isdir(out_folder):
             os.mkdir(out_folder)
-        if clean:
-            os.system("rm " + out_folder + '*')  
+        if clean and not incremental:
+            self._clean_folder(out_folder)
+        
+        if in_process:
+            input_name = self.fname + ".input.root"
+            card_name = self.fname + ".onshell.txt"
+            
+            manifest_name = out_folder + self.MANIFEST_NAME
+            manifest = self._manifest(templates, variances)
+            previous = self._read_manifest(manifest_name).get("outputs", {}) if incremental else {}
+            if clean and incremental:
+                for folder, keep in ((in_folder, [self.fname + ".root"]), (out_folder, list(manifest["outputs"]))):
+                    for stale in glob.glob(folder + '*'):
+                        if os.path.isfile(stale) and os.path.basename(stale) not in keep:
+                            os.remove(stale)
+            
+            def changed(name): #whether an output needs to be made again
+                return previous.get(name) != manifest["outputs"][name] or not os.path.isfile(out_folder + name)
+            
+            remade = []
+            written = MakeInputRoot_OnShell.fake_data_templates(templates)
+            if changed(input_name):
+                MakeInputRoot_OnShell.Make_Template_With_Fake_Data_From_Arrays(out_folder + input_name, templates, verbose, variances)
+                remade.append(out_folder + input_name)
+            
+            if changed(card_name):
+                integrals = [(name, float(np.sum(counts))) for name, (counts, _) in written.items()]
+                DatacardMaker_OnShell.write_datacard(out_folder[:-1], input_name, 
+                                                     *DatacardMaker_OnShell.sort_histograms(integrals, verbose), verbose=verbose,
+                                                     scale_systematics=self.scale_systematics, category=self.category)
+                remade.append(out_folder + card_name)
+            
+            if incremental:
+                self._write_manifest(manifest_name, manifest)
+            elif os.path.isfile(manifest_name):
+                os.remove(manifest_name) #a manifest that was not kept up to date would be lying about the outputs
+            return remade
         
         runstr = "python3 MakeInputRoot_OnShell.py "
         runstr += in_folder + " " + out_folder
         if not verbose:
             runstr += " > /dev/null"
-        os.system(runstr)
+        if os.system(runstr):
+            raise RuntimeError("Making the input ROOT file failed: " + runstr)
         # print(runstr)
         
         runstr = "python3 DatacardMaker_OnShell.py "
         runstr += out_folder
         if not verbose:
             runstr += "> /dev/null"
-        os.system(runstr)
+        if os.system(runstr):
+            raise RuntimeError("Making the datacard failed: " + runstr)
         # print(runstr)
+        return [out_folder + self.fname + ".input.root", out_folder + self.fname + ".onshell.txt"]
     
     def scale_and_add_bkgs(self):
         """This is a placeholder for the same function in the 1D and 2D template cases
@@ -124,31 +819,25 @@ class Template_creator(object):
 
         Parameters
         ----------
-        nbins : int, optional
-            The number of plots you want, by default 40
-        """
-        bins = []
-        weights = []
-        labels = []
-        for bkg_name, (bkg, area) in self.bkgs.items():
-            if any(bins):
-                bkg, _ = np.histogram(bkg, bins=bins, range=(self.lowerlim, self.upperlim))
-            else:
-                bkg, bins = np.histogram(bkg, bins=nbins, range=(self.lowerlim, self.upperlim))
-            bkg = Template_helper_methods.scale(bkg, area)
-            labels.append(bkg_name)
-            weights.append(bkg)
-        
-        for sig_name, (sig, area) in self.signals.items():
-            sig, _ = np.histogram(sig, bins=bins, range=(self.lowerlim, self.upperlim))
-            sig = Template_helper_methods.scale(bkg, area)
-            plt.cla()
-            hep.histplot(weights + [sig], bins=bins, label=labels + [sig_name], stack=True, lw=3)
-            plt.legend()
-            plt.savefig(self.output_directory + sig_name + '_stack.png')
+        nbins : Union[int, array_like, Binning_helper_methods.Binning], optional
+            The number of bins you want, by default 40
+        """
+        plt = _pyplot()
+        import mplhep as hep
+        bins = self._as_binning(nbins)
+        labels = list(self.bkgs.keys())
+        weights = [self.scaled_template(bkg_name, bins)[0] for bkg_name in labels]
+        
+        for sig_name in self.signals:
+            sig, _ = self.scaled_template(sig_name, bins)
+            with self._stage("plot"):
+                plt.cla()
+                hep.histplot(weights + [sig], bins=bins.edges, label=labels + [sig_name], stack=True, lw=3)
+                plt.legend()
+                plt.savefig(self.output_directory + sig_name + '_stack.png')
         
 class Template_Creator_1D(Template_creator):
-    def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim):
+    def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler=None, bkg_weights=None, sample_dtype=None):
         """This initialization takes in all the same inputs as the parent class.
 
         Parameters
@@ -167,8 +856,15 @@ class Template_Creator_1D(Template_creator):
             The lower limit of your attribute's range (i.e. if it was phi, lowerlim would be -pi)
         upperlim : float
             The upper limit of your attribute's range (i.e. if it was phi, upperlim would be pi)
+        profiler : Profiling_helper_methods.Stage_profiler, optional
+            If given, every stage (binning, scaling, writing, plotting and datacards) is timed and traced with it, by default None
+        bkg_weights : list[list[float]], optional
+            A list of per-event weights for each background (or None for an unweighted one), in the same order as bkgs, by default None
+        sample_dtype : numpy.dtype, optional
+            The dtype to store every sample and its weights as (i.e. numpy.float32 to halve their memory), by default None (which keeps samples as they come in).
+            Arrays and memory maps that already have it are never copied, see Binning_helper_methods.as_sample.
         """
-        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim)
+        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler, bkg_weights, sample_dtype)
         self.dimension = 1 #resets the dimension to 1
         
     def scale_and_add_bkgs(self, bins=40, scaleTo=True):
@@ -177,7 +873,7 @@ class Template_Creator_1D(Template_creator):
 
         Parameters
         ----------
-        bins : int, optional
+        bins : Union[int, array_like, Binning_helper_methods.Binning], optional
             Either the number of bins you want, or a list of the bins you want, by default 40
         scaleTo : bool, optional
             If true, this function will scale the backgrounds before adding them, by default True
@@ -187,26 +883,92 @@ class Template_Creator_1D(Template_creator):
         Tuple[numpy.ndarray, numpy.ndarray]
             an overall histogram pair of (counts, bins) a la a numpy histogram
         """
-        names_samples_and_areas = list(self.bkgs.items())
-            
-        name, (sample, area) = names_samples_and_areas[0]
-        bkg_sample, bins = np.histogram(sample, range=(self.lowerlim, self.upperlim), bins=bins)
+        bins = self._as_binning(bins)
+        
         if scaleTo:
-            bkg_sample = Template_helper_methods.scale(bkg_sample, area)
-            self.scaled_bkgs[name] = (bkg_sample, bins)
-        overall = bkg_sample
+            self.binning = bins #scaled_bkgs follow the binning of the last scaling
         
-        for name, (sample, area) in names_samples_and_areas[1:]:
-            bkg_sample, _ = np.histogram(sample, range=(self.lowerlim, self.upperlim), bins=bins)
+        histograms = []
+        for name, (sample, area) in self.bkgs.items():
             if scaleTo:
-                bkg_sample = Template_helper_methods.scale(bkg_sample, area)
-                self.scaled_bkgs[name] = (bkg_sample, bins)
-            overall += bkg_sample
+                bkg_sample, _ = self.scaled_template(name, bins)
+            else:
+                bkg_sample, _ = self.histogram(name, sample, bins, self._event_weights(name))
+            histograms.append(bkg_sample)
+        
+        overall = np.zeros(bins.nbins, dtype=np.result_type(int, *histograms)) #counts stay integers only if every background is unweighted
+        for bkg_sample in histograms:
+            overall += bkg_sample #overall is its own array, so this does not alter the shared scaled backgrounds
         
-        return overall, bins
+        return overall, bins.edges
+    
+    def adaptive_binning(self, nbins=None, min_count=None):
+        """Finds a variable-width binning from the backgrounds, scaled to their areas and with their weights:
+        either nbins bins of equal background yield, or the finest bins that each hold a background yield of at least min_count.
+        The backgrounds are sorted once and the sort is memoized, so each binning tried after that costs O(nbins log n) and no histogramming.
+        The result can be given as the bins of scale_and_add_bkgs, scaled_template, stackPlot or the nbins of the template classes.
+
+        Parameters
+        ----------
+        nbins : int, optional
+            The number of bins of equal background yield you want, by default None
+        min_count : float, optional
+            The least background yield a bin can have, by default None
+
+        Returns
+        -------
+        Binning_helper_methods.Binning
+            The binning over (lowerlim, upperlim)
+
+        Raises
+        ------
+        ValueError
+            If not exactly one of nbins and min_count is given, or if a background was streamed or its events were dropped (use Adaptive_binning_helper_methods.Quantile_sketch for those)
+        """
+        if (nbins is None) == (min_count is None):
+            raise ValueError("Give either a number of bins or a minimum count per bin!")
+        
+        key = ("sorted bkgs", self.lowerlim, self.upperlim)
+        if key not in self._template_cache: #this is emptied whenever a background or its weights change
+            samples = [sample for sample, _ in self.bkgs.values()]
+            if any(isinstance(sample, Binning_helper_methods.HistogramAccumulator) for sample in samples):
+                raise ValueError("Streamed and histogram-only backgrounds are already binned! Find their binning with a Quantile_sketch before binning them instead.")
+            self._template_cache[key] = Adaptive_binning_helper_methods.Sorted_sample(samples, [area for _, area in self.bkgs.values()],
+                                                                                      [self.bkg_weights.get(name) for name in self.bkgs], self.lowerlim, self.upperlim)
+        distribution = self._template_cache[key]
+        
+        if nbins is not None:
+            edges = Adaptive_binning_helper_methods.equal_yield_edges(distribution, nbins, self.lowerlim, self.upperlim)
+        else:
+            edges = Adaptive_binning_helper_methods.min_count_edges(distribution, min_count, self.lowerlim, self.upperlim)
+        return Binning_helper_methods.Binning(edges, self.lowerlim, self.upperlim)
+    
+    def add_bkg_variances(self, bins=40, scaleTo=True):
+        """The variances that go with scale_and_add_bkgs: the variance of every bin of the backgrounds added together
+
+        Parameters
+        ----------
+        bins : Union[int, array_like, Binning_helper_methods.Binning], optional
+            Either the number of bins you want, or a list of the bins you want, by default 40
+        scaleTo : bool, optional
+            If true, these are the variances of the scaled backgrounds, by default True
+
+        Returns
+        -------
+        numpy.ndarray
+            The variance of each bin of the overall background
+        """
+        bins = self._as_binning(bins)
+        overall = np.zeros(bins.nbins, dtype=float)
+        for name, (sample, _) in self.bkgs.items():
+            if scaleTo:
+                overall += self.scaled_variances(name, bins)
+            else:
+                overall += self.histogram_with_variances(name, sample, bins, self._event_weights(name))[1]
+        return overall
 
 class Template_Creator_2D(Template_creator):
-    def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim):
+    def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler=None, bkg_weights=None, sample_dtype=None):
         """This initialization takes in all the same inputs as the parent class.
 
         Parameters
@@ -225,56 +987,200 @@ class Template_Creator_2D(Template_creator):
             The lower limit of your attribute's range (i.e. if it was phi, lowerlim would be -pi)
         upperlim : float
             The upper limit of your attribute's range (i.e. if it was phi, upperlim would be pi)
+        profiler : Profiling_helper_methods.Stage_profiler, optional
+            If given, every stage (binning, scaling, writing, plotting and datacards) is timed and traced with it, by default None
+        bkg_weights : list[list[float]], optional
+            A list of per-event weights for each background (or None for an unweighted one), in the same order as bkgs, by default None
+        sample_dtype : numpy.dtype, optional
+            The dtype to store every sample and its weights as (i.e. numpy.float32 to halve their memory), by default None (which keeps samples as they come in).
+            Arrays and memory maps that already have it are never copied, see Binning_helper_methods.as_sample.
         """
-        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim)
+        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler, bkg_weights, sample_dtype)
         self.dimension = 2   
         
-    def scale_and_add_bkgs(self, bins=40, scaleTo=True):
+    def _as_binning(self, bins=None):
+        """Turns whatever describes a 2D binning into a Binning_helper_methods.Binning_2D over (lowerlim, upperlim) along x and discr_range along y
+
+        Parameters
+        ----------
+        bins : Union[int, array_like, Binning_helper_methods.Binning_2D], optional
+            Anything numpy.histogram2d accepts as its bins, or a Binning_2D, by default None (which is self.binning)
+
+        Returns
+        -------
+        Binning_helper_methods.Binning_2D
+            The binning
+        """
+        if bins is None:
+            return super()._as_binning(bins)
+        if isinstance(bins, Binning_helper_methods.Binning_2D):
+            return bins
+        return Binning_helper_methods.Binning_2D.from_bins(bins, (self.lowerlim, self.upperlim), self.discr_range)
+    
+    def _discriminant(self, name):
+        """Looks up the discriminant of a signal or background by name
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+
+        Returns
+        -------
+        array_like
+            The discriminant of every event
+
+        Raises
+        ------
+        ValueError
+            If the sample has no discriminant
+        """
+        discriminants = self.discr_bkgs if name in self.bkgs else self.discr_signals
+        if name not in discriminants:
+            raise ValueError("No discriminant was given for " + name + "!")
+        return discriminants[name]
+    
+    def _bin_index(self, name, sample, bins):
+        """Returns the flattened 2D bin index of every event in a sample, computing it only the first time a sample and its discriminant are binned with a binning
+
+        Parameters
+        ----------
+        name : str
+            The name of the sample, used as part of the cache key
+        sample : numpy.ndarray
+            The events
+        bins : Binning_helper_methods.Binning_2D
+            The binning
+
+        Returns
+        -------
+        numpy.ndarray
+            The output of Binning_2D.index
+        """
+        discr = self._discriminant(name)
+        key = (name, bins.key)
+        cached = self._bin_indices.get(key)
+        if cached is None or cached[0] is not sample or cached[1] is not discr: #a new sample or discriminant needs rebinning
+            self._bin_indices[key] = (sample, discr, bins.index(sample, discr))
+        return self._bin_indices[key][2]
+    
+    def _stacked_bkgs(self, bins):
+        """Histograms every background and stacks them, so that they can be scaled and added all at once
+
+        Parameters
+        ----------
+        bins : Binning_helper_methods.Binning_2D
+            The binning to use
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+            The (backgrounds, binsx, binsy) counts, their variances, and the absolute area of each background
+        """
+        histograms = [self.histogram_with_variances(name, sample, bins, self._event_weights(name)) for name, (sample, _) in self.bkgs.items()]
+        counts = np.array([hist[0] for hist, _ in histograms], dtype=float)
+        variances = np.array([sumw2 for _, sumw2 in histograms], dtype=float)
+        return counts, variances, np.sum(np.abs(counts), axis=(1, 2))
+    
+    def sparse_template(self, name, bins=None, scaleTo=True):
+        """Returns the 2D histogram of a signal or background as a Sparse_helper_methods.Sparse_histogram. 
+        It is filled straight from the cached bin indices, so the dense array is never made, and is memoized alongside scaled_template.
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+        bins : Union[int, array_like, Binning_helper_methods.Binning_2D], optional
+            The binning to use, by default None (which is self.binning)
+        scaleTo : bool, optional
+            If true, the histogram is scaled to the area of the sample, by default True
+
+        Returns
+        -------
+        Sparse_helper_methods.Sparse_histogram
+            The histogram, with its variances
+        """
+        binning = self._as_binning(bins)
+        key = (name, binning.key, self._template_inputs(name), "sparse", scaleTo)
+        if key not in self._template_cache:
+            sample, area = self._sample_and_area(name)
+            if isinstance(sample, Binning_helper_methods.HistogramAccumulator): #histogram-only samples are already binned, see drop_events
+                self._check_accumulator(name, sample, binning, self._event_weights(name))
+                hist = Sparse_helper_methods.Sparse_histogram.from_dense(sample.counts, binning.edges_per_axis, sample.sumw2)
+            else:
+                with self._stage("bin", len(sample), getattr(sample, "nbytes", 0)):
+                    hist = Sparse_helper_methods.Sparse_histogram.from_index(self._bin_index(name, sample, binning), binning, self._event_weights(name))
+            if scaleTo:
+                with self._stage("scale"):
+                    hist = hist.scaled(area)
+            hist.values.setflags(write=False) #these are shared by everyone who asks, so no one may change them in place
+            hist.variances.setflags(write=False)
+            self._template_cache[key] = hist
+        return self._template_cache[key]
+    
+    def scale_and_add_bkgs(self, bins=40, scaleTo=True, sparse=False):
         """This is the 2-dimensional version of the function. 
         It serves to bin and scale the backgrounds given to their respective areas, then add them into one histogram.
+        Each background is binned along the mass and its discriminant (discr_bkgs) only once per binning, and they are all scaled and added in one go.
 
         Parameters
         ----------
-        bins : Union[int, array_like], optional
-            Either the number of bins you want, or a list of the bins you want, by default 40
+        bins : Union[int, array_like, Binning_helper_methods.Binning_2D], optional
+            Anything numpy.histogram2d accepts as its bins (i.e. the number of bins you want, or [mass bins, discriminant bins]), by default 40
         scaleTo : bool, optional
             If true, this function will scale the backgrounds before adding them, by default True
+        sparse : bool, optional
+            If true, the backgrounds are kept sparse throughout (see sparse_template), which is best for fine binnings, by default False
 
         Returns
         -------
-        Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
-            an overall histogram pair of (counts, binsx, binsy) a la a numpy histogram
+        Union[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray], Sparse_helper_methods.Sparse_histogram]
+            an overall histogram of (counts, binsx, binsy) a la a numpy 2D histogram, or a sparse histogram (with its variances) if sparse is true
         """
-        overall = np.ndarray((2,2))
-        keys_to_follow = list(self.bkgs.keys())
+        bins = self._as_binning(bins)
+        if scaleTo:
+            self.binning = bins #scaled_bkgs follow the binning of the last scaling
         
-        current_key = keys_to_follow[0]
-        sample, area = self.bkgs[current_key]
-        discr = self.discr_bkgs[current_key]
+        if sparse:
+            return Sparse_helper_methods.add([self.sparse_template(name, bins, scaleTo) for name in self.bkgs])
         
-        bkg_sample, binsx, binsy = np.histogram2d(sample, discr, bins, range=[(self.lowerlim, self.upperlim), self.discr_range])
+        counts, _, norms = self._stacked_bkgs(bins)
         if scaleTo:
-            bkg_sample = Template_creator.scale(bkg_sample, area)
-            self.scaled_bkgs[current_key] = (bkg_sample, binsx, binsy)
-        overall = bkg_sample
+            with self._stage("scale"):
+                factors = np.array([area for _, area in self.bkgs.values()], dtype=float)/norms
+                overall = np.tensordot(factors, counts, axes=1)
+        else:
+            overall = np.sum(counts, axis=0)
         
-        for current_key in keys_to_follow[1:]:
-            sample, area = self.bkgs[current_key]
-            discr = self.discr_bkgs[current_key]
-            
-            bkg_sample, _, _ = np.histogram2d(sample, discr, (binsx, binsy), range=[(self.lowerlim, self.upperlim), self.discr_range])
-            if scaleTo:
-                bkg_sample = Template_creator.scale(bkg_sample, area)
-                self.scaled_bkgs[current_key] = (bkg_sample, binsx, binsy)
-            overall += bkg_sample
-            
-        return overall, binsx, binsy 
+        return (overall,) + bins.edges_per_axis
+    
+    def add_bkg_variances(self, bins=40, scaleTo=True):
+        """The variances that go with scale_and_add_bkgs: the variance of every bin of the backgrounds added together
+
+        Parameters
+        ----------
+        bins : Union[int, array_like, Binning_helper_methods.Binning_2D], optional
+            Anything numpy.histogram2d accepts as its bins, by default 40
+        scaleTo : bool, optional
+            If true, these are the variances of the scaled backgrounds, by default True
+
+        Returns
+        -------
+        numpy.ndarray
+            The (binsx, binsy) variances of the overall background
+        """
+        bins = self._as_binning(bins)
+        _, variances, norms = self._stacked_bkgs(bins)
+        if not scaleTo:
+            return np.sum(variances, axis=0)
+        factors = np.array([area for _, area in self.bkgs.values()], dtype=float)/norms
+        return np.tensordot(factors**2, variances, axes=1)
 
 class Interf_Coupling_template_creator(Template_Creator_2D): #WIP
     def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim,
                  pure1_weights, pure2_weights, interf_weights, weight_of_generation_hypothesis, mass_iterable,
                  interf_name, pure1_name, pure2_name,
-                 bkg_pure1_weights, bkg_pure2_weights, bkg_interf_weights):
+                 bkg_pure1_weights, bkg_pure2_weights, bkg_interf_weights, profiler=None):
         """CURRENTLY A WORK IN PROGRESS. Designed to be a 2d template between different hypotheses
 
         Parameters
@@ -315,8 +1221,10 @@ class Interf_Coupling_template_creator(Template_Creator_2D): #WIP
             The weights of your background to your second pure sample's hypothesis
         bkg_interf_weights : list[float]
             The weights of your background to your interference sample's hypothesis
+        profiler : Profiling_helper_methods.Stage_profiler, optional
+            If given, every stage (binning, scaling, writing, plotting and datacards) is timed and traced with it, by default None
         """
-        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim)
+        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler)
         
         self.discr_range = (-1,1)
         
@@ -337,10 +1245,13 @@ class Interf_Coupling_template_creator(Template_Creator_2D): #WIP
         d_interference_bkg /= 2*np.sqrt(bkg_pure1_weights*bkg_pure2_weights)
         
 class Interf_Reso_template_creator_1D(Template_Creator_1D):
+    CROSS_SECTION_NAMES = ["CS_BW1", "CS_BW2", "CS_BW3", "CS_BW12_0_0", "CS_BW12_05_0", "CS_BW13_0_0", "CS_BW13_0_05", "CS_BW23_0_0", "CS_BW23_0_05"]
+    INTERFERENCE_PAIRS = [(0,1), (0,1), (0,2), (0,2), (1,2), (1,2)] #which pure samples each interference sample is made of
+    
     def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim,
                  BW1_0_0, BW2_0_0, BW3_0_0, BW12_0_0, BW12_05_0, BW13_0_0, BW13_0_05, BW23_0_0, BW23_0_05,
                  CS_BW1, CS_BW2, CS_BW3, CS_BW12_0_0, CS_BW12_05_0, CS_BW13_0_0, CS_BW13_0_05, CS_BW23_0_0, CS_BW23_0_05,
-                 nbins, area1, area2, area3):
+                 nbins, area1, area2, area3, profiler=None, weights=None, bkg_weights=None, sample_dtype=None):
         """Initializes the 1D template for mass interference
 
         Parameters
@@ -395,117 +1306,291 @@ class Interf_Reso_template_creator_1D(Template_Creator_1D):
             The cross section of the variable's name
         CS_BW23_0_05 : float
             The cross section of the variable's name
-        nbins : int
-            The cross section of the variable's name
+        nbins : Union[int, array_like]
+            The number of bins, or the bin edges (i.e. from Template_Creator_1D.adaptive_binning or Adaptive_binning_helper_methods)
         area1 : float
             The cross section of the variable's name
         area2 : float
             The cross section of the variable's name
         area3 : float
             The cross section of the variable's name
+        profiler : Profiling_helper_methods.Stage_profiler, optional
+            If given, every stage (binning, scaling, writing, plotting and datacards) is timed and traced with it, by default None
+        weights : list[list[float]], optional
+            A list of per-event weights for each of the nine samples above (or None for an unweighted one), in the same order, by default None
+        bkg_weights : list[list[float]], optional
+            A list of per-event weights for each background (or None for an unweighted one), in the same order as bkgs, by default None
+        sample_dtype : numpy.dtype, optional
+            The dtype to store every sample and its weights as (i.e. numpy.float32 to halve their memory), by default None (which keeps samples as they come in).
+            Arrays and memory maps that already have it are never copied, see Binning_helper_methods.as_sample.
         """
-        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim)
+        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler, bkg_weights, sample_dtype)
         string_forms = ["BW1", "BW2", "BW3", 
                         "BW1BW2_0_0", "BW1BW2_0.5_0", "BW1BW3_0_0", "BW1BW3_0_0.5", "BW2BW3_0_0", "BW2BW3_0_0.5"]
         #The 0.5 is for the physics model naming scheme
         
-        with uproot.recreate(self.output_directory + self.fname + ".root") as f:
-            
-            self.signals["BW1"] = (np.array(BW1_0_0), area1)
+        binning = Binning_helper_methods.Binning(nbins, lowerlim, upperlim) #every sample shares this binning
+        bins = binning.edges
+        self.binning = binning
+        
+        self.string_forms = string_forms
+        self.areas = (area1, area2, area3)
+        self.cross_sections = dict(zip(self.CROSS_SECTION_NAMES, [CS_BW1, CS_BW2, CS_BW3, CS_BW12_0_0, CS_BW12_05_0, CS_BW13_0_0, CS_BW13_0_05, CS_BW23_0_0, CS_BW23_0_05]))
+        
+        samples = [BW1_0_0, BW2_0_0, BW3_0_0, BW12_0_0, BW12_05_0, BW13_0_0, BW13_0_05, BW23_0_0, BW23_0_05]
+        sample_areas = [area1, area2, area3] + [np.sqrt(self.areas[first]*self.areas[second]) for first, second in self.INTERFERENCE_PAIRS]
+        for name, sample, area in zip(string_forms, samples, sample_areas):
+            self.signals[name] = (Binning_helper_methods.as_sample(sample, sample_dtype), area)
+        if weights is not None:
+            for name, sample_weights in zip(string_forms, weights):
+                if sample_weights is not None:
+                    self.signal_weights[name] = Binning_helper_methods.as_weights(sample_weights, sample_dtype)
+        
+        for name in string_forms[:3]:
+            if np.any(self.histogram(name, self.signals[name][0], binning)[0]): #checks if the array is nonzero at any point
+                self.templates["ggH_0PM_" + name] = self.scaled_template(name)
+                self.template_variances["ggH_0PM_" + name] = self.scaled_variances(name)
+        
+        for name in string_forms[3:]:
+            interference_term, _ = self.scaled_template(name)
+            variances = self.scaled_variances(name)
             
-            BW1_0_0, bins = np.histogram(BW1_0_0, bins=nbins, range=(lowerlim, upperlim))            
-            BW1_0_0 = Template_helper_methods.scale(BW1_0_0, CS_BW1)
-            if np.any(BW1_0_0): #checks if the array is nonzero at any point
-                temp = Template_helper_methods.scale(BW1_0_0, area1)
-                f["ggH_0PM_BW1"] = (temp, bins)
-                self.scaled_signals["BW1"] = (temp, bins)
+            pos = np.maximum(interference_term, 0) #splits the template up into positive and negative as you're supposed to
+            neg = -1*np.minimum(interference_term, 0)
             
-            self.signals["BW2_0_0"] = (np.array(BW2_0_0), area2)
-            BW2_0_0, _ = np.histogram(BW2_0_0, bins=bins, range=(lowerlim, upperlim))
-            BW2_0_0 = Template_helper_methods.scale(BW2_0_0, CS_BW2)
-            if np.any(BW2_0_0):
-                temp = Template_helper_methods.scale(BW2_0_0, area2)
-                f["ggH_0PM_BW2"] = (temp, bins)
-                self.scaled_signals["BW2"] = (temp, bins)
+            if np.any(pos):
+                self.templates["ggH_0PM_" + name + "_positive"] = (pos, bins)
+                self.template_variances["ggH_0PM_" + name + "_positive"] = np.where(interference_term > 0, variances, 0)
+            if np.any(neg):
+                self.templates["ggH_0PM_" + name + "_negative"] = (neg, bins)
+                self.template_variances["ggH_0PM_" + name + "_negative"] = np.where(interference_term < 0, variances, 0)
+
+        self.templates["bkg_ggzz"] = self.scale_and_add_bkgs(binning, scaleTo=True)
+        self.template_variances["bkg_ggzz"] = self.add_bkg_variances(binning)
+        self.write_templates()
+    
+    def _template_inputs(self, name):
+        """The interference templates also depend on the cross sections and on the pure samples they are made of, so those go into the memoization key too
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+
+        Returns
+        -------
+        Hashable
+            The area of the sample alongside every cross section
+        """
+        if name not in self.string_forms:
+            return super()._template_inputs(name)
+        return (self.signals[name][1], tuple(self.cross_sections.values()))
+    
+    def _cross_section_scaled(self, name, binning):
+        """Scales a signal sample to its cross section
+
+        Parameters
+        ----------
+        name : str
+            One of the string forms
+        binning : Binning_helper_methods.Binning
+            The binning to use
+
+        Returns
+        -------
+        Tuple[numpy.ndarray, numpy.ndarray]
+            The histogram counts scaled to the cross section of the sample, and their variances
+        """
+        (counts, _), variances = self.histogram_with_variances(name, self.signals[name][0], binning, self._event_weights(name))
+        return Template_helper_methods.scale_with_variances(counts, variances, self.cross_sections[self.CROSS_SECTION_NAMES[self.string_forms.index(name)]])
+    
+    def _scale_template(self, name, binning):
+        """Pure samples are scaled to their cross section and then their area.
+        Interference samples are scaled to their cross section, have the two pure samples they are made of taken away, and are then scaled to their area.
+
+        Parameters
+        ----------
+        name : str
+            The name of the signal or background
+        binning : Binning_helper_methods.Binning
+            The binning to use
+
+        Returns
+        -------
+        Tuple[Tuple[numpy.ndarray, numpy.ndarray], numpy.ndarray]
+            (counts, bins) a la a numpy histogram, and the variance of each bin
+        """
+        if name not in self.string_forms:
+            return super()._scale_template(name, binning)
+        
+        n = self.string_forms.index(name)
+        interference_term, variances = self._cross_section_scaled(name, binning)
+        if n >= 3:
+            first, second = self.INTERFERENCE_PAIRS[n - 3]
+            first_term, first_variances = self._cross_section_scaled(self.string_forms[first], binning)
+            second_term, second_variances = self._cross_section_scaled(self.string_forms[second], binning)
+            interference_term -= first_term + second_term
+            variances += first_variances + second_variances #the samples are independent, so their variances add
+        
+        counts, variances = Template_helper_methods.scale_with_variances(interference_term, variances, self.signals[name][1])
+        return (counts, binning.edges), variances
+        
+    def create_template_grid(self, points, output_directory=None, create_datacards=False):
+        """Emits a whole grid of template sets from the samples that were binned when this object was made, without binning a single event again.
+        Every point is a linear rescaling of the same histograms, so the whole grid is computed with a few matrix operations.
+        Each point is written to its own directory as <output_directory>/<point name>/<fname>.root
+
+        Parameters
+        ----------
+        points : list[dict]
+            The parameter points. Each point may set any of "area1", "area2", "area3", "bkg_areas" (a list in the order of the backgrounds, or a dict keyed by background name),
+            and any of the cross sections by their argument names (i.e. "CS_BW1" or "CS_BW12_05_0").
+            Anything a point does not set keeps the value this object was made with. A "name" sets the directory name of the point, otherwise it is point_<n>.
+        output_directory : str, optional
+            The directory to put every point's directory in, by default None (which is self.output_directory)
+        create_datacards : bool, optional
+            If true, the input ROOT file and datacard are made for every point as well, by default False
+
+        Returns
+        -------
+        dict[str, dict[str, Tuple[numpy.ndarray, numpy.ndarray]]]
+            The templates of every point, keyed by the name of the point
+        """
+        if output_directory is None:
+            output_directory = self.output_directory
+        bins = self.binning.edges
+        bkg_names = list(self.bkgs.keys())
+        
+        histograms = [self.histogram_with_variances(name, self.signals[name][0], self.binning, self._event_weights(name)) for name in self.string_forms]
+        counts = np.array([sumw for (sumw, _), _ in histograms], dtype=float)
+        norms = np.sum(np.abs(counts), axis=1, keepdims=True)
+        shapes = counts/norms #each sample scaled to an area of 1
+        shape_variances = np.array([sumw2 for _, sumw2 in histograms], dtype=float)/norms**2
+        
+        bkg_histograms = [self.histogram_with_variances(name, sample, self.binning, self._event_weights(name)) for name, (sample, _) in self.bkgs.items()]
+        bkg_counts = np.array([sumw for (sumw, _), _ in bkg_histograms], dtype=float)
+        bkg_norms = np.sum(np.abs(bkg_counts), axis=1, keepdims=True)
+        bkg_shapes = bkg_counts/bkg_norms
+        bkg_shape_variances = np.array([sumw2 for _, sumw2 in bkg_histograms], dtype=float)/bkg_norms**2
+        
+        areas = np.array([[point.get("area" + str(n + 1), self.areas[n]) for n in range(3)] for point in points], dtype=float)
+        cross_sections = np.array([[point.get(name, self.cross_sections[name]) for name in self.CROSS_SECTION_NAMES] for point in points], dtype=float)
+        bkg_areas = np.empty((len(points), len(bkg_names)), dtype=float)
+        for p, point in enumerate(points):
+            point_bkg_areas = point.get("bkg_areas", [area for _, area in self.bkgs.values()])
+            if isinstance(point_bkg_areas, dict):
+                point_bkg_areas = [point_bkg_areas.get(name, self.bkgs[name][1]) for name in bkg_names]
+            bkg_areas[p] = point_bkg_areas
+        
+        with self._stage("scale"):
+            pures = areas[:, :, np.newaxis]*shapes[np.newaxis, :3] #(points, 3, bins)
+            pure_variances = areas[:, :, np.newaxis]**2*shape_variances[np.newaxis, :3]
             
-            self.signals["BW3"] = (np.array(BW3_0_0), area3)
-            BW3_0_0, _ = np.histogram(BW3_0_0, bins=bins, range=(lowerlim, upperlim))
-            BW3_0_0 = Template_helper_methods.scale(BW3_0_0, CS_BW3)
-            if np.any(BW3_0_0):
-                temp = Template_helper_methods.scale(BW3_0_0, area3)
-                f["ggH_0PM_BW3"] = (temp, bins)
-                self.scaled_signals["BW3"] = (temp, bins)
+            #each interference template is its sample minus the two pure samples it is made of, all scaled to their cross sections
+            selection = np.zeros((len(points), len(self.INTERFERENCE_PAIRS), len(self.string_forms)))
+            interf_areas = np.empty((len(points), len(self.INTERFERENCE_PAIRS)))
+            for m, (first, second) in enumerate(self.INTERFERENCE_PAIRS):
+                selection[:, m, m + 3] = cross_sections[:, m + 3]
+                selection[:, m, first] = -cross_sections[:, first]
+                selection[:, m, second] = -cross_sections[:, second]
+                interf_areas[:, m] = np.sqrt(areas[:, first]*areas[:, second])
+            interferences = np.einsum('pmk,kn->pmn', selection, shapes) #(points, 6, bins)
+            interference_variances = np.einsum('pmk,kn->pmn', selection**2, shape_variances) #the samples are independent, so their variances add
+            factors = interf_areas/np.sum(np.abs(interferences), axis=2)
+            interferences *= factors[:, :, np.newaxis]
+            interference_variances *= factors[:, :, np.newaxis]**2
+            positives = np.maximum(interferences, 0)
+            negatives = -np.minimum(interferences, 0)
             
-            interfList = [BW12_0_0, BW12_05_0, BW13_0_0, BW13_0_05, BW23_0_0, BW23_0_05] #list of all the interference terms
-            interfCSList = [CS_BW12_0_0, CS_BW12_05_0, CS_BW13_0_0, CS_BW13_0_05, CS_BW23_0_0, CS_BW23_0_05]
-            for n, interference_term in enumerate(interfList):
-                
-                interference_term, _ = np.histogram(interference_term, bins=bins, range=(lowerlim, upperlim))
-                interference_term = Template_helper_methods.scale(interference_term, interfCSList[n])
-                
-                interf_area = 0
-                
-                if "12" in string_forms[n + 3]:
-                    interf_area = np.sqrt(area1*area2)
-                    self.signals[string_forms[n+3]] = (np.array(interference_term), interf_area)
-                    
-                    interference_term -= BW1_0_0 + BW2_0_0
-                elif "13" in string_forms[n + 3]:
-                    interf_area = np.sqrt(area1*area3)
-                    self.signals[string_forms[n+3]] = (np.array(interference_term), interf_area)
-                    
-                    interference_term -= BW1_0_0 + BW3_0_0
-                else:
-                    interf_area = np.sqrt(area2*area3)
-                    self.signals[string_forms[n+3]] = (np.array(interference_term), interf_area)
-                    
-                    interference_term -= BW2_0_0 + BW3_0_0
-                
-                interference_term = Template_helper_methods.scale(interference_term, interf_area)
-                self.scaled_signals[string_forms[n+3]] = (interference_term, bins)
-                
-                
-                pos = np.maximum(interference_term.copy(),0) #splits the template up into positive and negative as you're supposed to
-                neg = -1*np.minimum(interference_term.copy(),0)
-                
-                if np.any(pos):
-                    f["ggH_0PM_" + string_forms[n+3] + "_positive"] = (pos, bins)
-                if np.any(neg):
-                    f["ggH_0PM_" + string_forms[n+3] + "_negative"] = (neg, bins)
-
-            f["bkg_ggzz"] = self.scale_and_add_bkgs(bins, scaleTo=True)
+            overall_bkgs = bkg_areas @ bkg_shapes #(points, bins)
+            overall_bkg_variances = bkg_areas**2 @ bkg_shape_variances
+        
+        grid = {}
+        for p, point in enumerate(points):
+            name = str(point.get("name", "point_" + str(p)))
+            templates = {}
+            variances = {}
+            for n in range(3):
+                if np.any(counts[n]):
+                    templates["ggH_0PM_" + self.string_forms[n]] = (pures[p, n], bins)
+                    variances["ggH_0PM_" + self.string_forms[n]] = pure_variances[p, n]
+            for m in range(len(self.INTERFERENCE_PAIRS)):
+                if np.any(positives[p, m]):
+                    templates["ggH_0PM_" + self.string_forms[m + 3] + "_positive"] = (positives[p, m], bins)
+                    variances["ggH_0PM_" + self.string_forms[m + 3] + "_positive"] = np.where(interferences[p, m] > 0, interference_variances[p, m], 0)
+                if np.any(negatives[p, m]):
+                    templates["ggH_0PM_" + self.string_forms[m + 3] + "_negative"] = (negatives[p, m], bins)
+                    variances["ggH_0PM_" + self.string_forms[m + 3] + "_negative"] = np.where(interferences[p, m] < 0, interference_variances[p, m], 0)
+            templates["bkg_ggzz"] = (overall_bkgs[p], bins)
+            variances["bkg_ggzz"] = overall_bkg_variances[p]
             
-    def plot_overall_interference(self):
-        """This plots all the different combinations of the three phases
-        """
-        # print(self.scaled_signals)
-        pures = ([key for key in self.scaled_signals.keys() if ("1BW" not in key and "1BW" not in key and "2BW" not in key)], 
-                 [value for key, value in self.scaled_signals.items() if ("1BW" not in key and "1BW" not in key and "2BW" not in key)])
-        for interf12 in tqdm.tqdm(["BW1BW2_0_0", "BW1BW2_0.5_0"], desc="Top Level of interference loop"):
-            for interf13 in tqdm.tqdm(["BW1BW3_0_0", "BW1BW3_0_0.5"], leave=False, desc="Second Level of interference loop"):
-                for interf23 in tqdm.tqdm(["BW2BW3_0_0", "BW2BW3_0_0.5"], leave=False, desc="Bottom Level of interference loop"):
-                    names, terms = copy.deepcopy(pures)
-                    names += [interf12, interf13, interf23]
-                    # print(names)
-                    terms += [self.scaled_signals[interf12], self.scaled_signals[interf13], self.scaled_signals[interf23]]
-
-                    mihm.plot_overall_interference(terms, names, 
-                                                   self.output_directory, interf12+"_"+interf13+"_"+interf23+"_"+self.fname)
+            point_directory = os.path.join(output_directory, name, '')
+            os.makedirs(point_directory, exist_ok=True)
+            self.write_templates(point_directory, templates, variances)
+            if create_datacards:
+                self.create_datacards(output_directory=point_directory, templates=templates, variances=variances)
+            grid[name] = templates
+        
+        return grid
+    
+    def interference_combinations(self):
+        """Lists every combination of the three phases as the names of the terms that go into it
+
+        Returns
+        -------
+        list[list[str]]
+            The three pure samples followed by one interference sample for each pair, for every combination of phases
+        """
+        pure_names = [name for name in self.string_forms if ("1BW" not in name and "2BW" not in name)]
+        return [pure_names + list(interferences) for interferences in 
+                itertools.product(["BW1BW2_0_0", "BW1BW2_0.5_0"], ["BW1BW3_0_0", "BW1BW3_0_0.5"], ["BW2BW3_0_0", "BW2BW3_0_0.5"])]
+    
+    def overall_interferences(self):
+        """Computes the overall distribution of every combination of the three phases in one go, without plotting anything
+
+        Returns
+        -------
+        Tuple[list[list[str]], numpy.ndarray, numpy.ndarray]
+            The combinations (as in interference_combinations), the (n_combinations, nbins) array of their overall counts, and the bins
+        """
+        combinations = self.interference_combinations()
+        terms = [self.scaled_template(name) for name in self.string_forms]
+        overall, bins = mihm.overall_interferences(terms, self.string_forms, combinations)
+        return combinations, overall, bins
+    
+    def plot_overall_interference(self, formats=("png", "pdf"), jobs=None):
+        """This plots all the different combinations of the three phases. The combinations are drawn in parallel across a pool of processes.
+
+        Parameters
+        ----------
+        formats : Iterable[str], optional
+            The file formats to save each plot as, by default ("png", "pdf")
+        jobs : int, optional
+            The number of processes to draw with, by default None (which uses one per CPU). 1 draws everything in this process.
+        """
+        plots = []
+        for names in self.interference_combinations():
+            terms = [self.scaled_template(name) for name in names] #the templates are read-only, so every plot can share them without copying
+            plots.append((terms, names, "_".join(names[3:])+"_"+self.fname))
+        
+        with self._stage("plot"):
+            mihm.plot_overall_interferences(plots, self.output_directory, formats, jobs)
 
 class Significance_Hypothesis_template_creator_1D(Template_Creator_1D):
     def __init__(self, output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim,
-                 signal1, signal1_name, signal2, signal2_name, signal_area, nbins):
-        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim)
-
-        with uproot.recreate(self.output_directory + self.fname + ".root") as f:
-            self.signals[signal1_name] = signal1
-            signal1, bins = np.histogram(signal1, bins=nbins, range=(lowerlim, upperlim))
-            signal1 = Template_helper_methods.scale(signal1, signal_area)
-            f["ggH_0PM"] = (signal1, bins)
-            
-            self.signals[signal2_name] = signal2
-            signal2, _ = np.histogram(signal2, bins=bins, range=(lowerlim, upperlim))
-            signal2 = Template_helper_methods.scale(signal2, signal_area)
-            f["ggH_0M"] = (signal2, bins)
-            
-            f["bkg_ggzz"] = self.scale_and_add_bkgs(bins, scaleTo=True)
\ No newline at end of file
+                 signal1, signal1_name, signal2, signal2_name, signal_area, nbins, profiler=None, bkg_weights=None, sample_dtype=None):
+        super().__init__(output_directory, fname, bkgs, bkgNames, bkg_areas, lowerlim, upperlim, profiler, bkg_weights, sample_dtype)
+
+        self.binning = Binning_helper_methods.Binning(nbins, lowerlim, upperlim)
+        
+        self.signals[signal1_name] = (Binning_helper_methods.as_sample(signal1, sample_dtype), signal_area)
+        self.templates["ggH_0PM"] = self.scaled_template(signal1_name)
+        self.template_variances["ggH_0PM"] = self.scaled_variances(signal1_name)
+        
+        self.signals[signal2_name] = (Binning_helper_methods.as_sample(signal2, sample_dtype), signal_area)
+        self.templates["ggH_0M"] = self.scaled_template(signal2_name)
+        self.template_variances["ggH_0M"] = self.scaled_variances(signal2_name)
+        
+        self.templates["bkg_ggzz"] = self.scale_and_add_bkgs(self.binning, scaleTo=True)
+        self.template_variances["bkg_ggzz"] = self.add_bkg_variances(self.binning)
+        self.write_templates()
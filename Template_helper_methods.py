@@ -1,8 +1,9 @@
 import os
-import ROOT
 import shutil
-import uproot
 import numpy as np
+import Sparse_helper_methods
+import Binning_helper_methods
+#uproot is only imported by the functions that read or write files, so that the numerical functions here stay light to import
 
 
 def scale(counts, scaleto):
@@ -27,7 +28,47 @@ def scale(counts, scaleto):
     
     return signs*counts*scaleto/np.sum(counts)
 
-def extract_branches_from_TTree(ROOT_file, *args):
+def scale_with_variances(counts, variances, scaleto):
+    """Scales a histogram a la scale, and its per-bin variances along with it. The area it is scaled by is treated as exact.
+
+    Parameters
+    ----------
+    counts : list[Union[int, float]]
+        A list of bin counts
+    variances : list[float]
+        The variance (sum of weights squared) of each bin
+    scaleto : float
+        The absolute area to scale to
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        The scaled histogram counts and their variances
+    """
+    factor = scaleto/np.sum(np.abs(np.asarray(counts, dtype=float)))
+    return scale(counts, scaleto), np.asarray(variances, dtype=float)*factor**2
+
+def extract_branches_from_TTree(ROOT_file, *args, cache=None):
+    """Reads whole branches out of the first TTree in a ROOT file
+
+    Parameters
+    ----------
+    ROOT_file : str
+        The ROOT file to read from
+    *args : str
+        The names of the branches you want
+    cache : Branch_cache.Branch_cache, optional
+        A cache to map the branches from (and store them in), by default None
+
+    Returns
+    -------
+    list[numpy.ndarray]
+        Each branch, in the order they were asked for
+    """
+    if cache is not None:
+        return cache.load(ROOT_file, *args)
+    
+    import uproot
     with uproot.open(ROOT_file) as f:
         f = f[f.keys()[0]]
         branches_as_numpy_arrays = []
@@ -36,6 +77,67 @@ def extract_branches_from_TTree(ROOT_file, *args):
             
         return branches_as_numpy_arrays
 
+def iterate_branches_from_TTree(ROOT_file, *args, step_size="100 MB", cache=None):
+    """Streams branches out of the first TTree in a ROOT file in bounded-size chunks, so that peak memory is set by the chunk size rather than the sample size
+
+    Parameters
+    ----------
+    ROOT_file : str
+        The ROOT file to read from
+    *args : str
+        The names of the branches you want
+    step_size : Union[int, str], optional
+        The size of each chunk, either as a number of entries or as a memory size, by default "100 MB"
+    cache : Branch_cache.Branch_cache, optional
+        A cache to map the branches from (and write them through to), by default None
+
+    Yields
+    ------
+    list[numpy.ndarray]
+        One chunk of each branch, in the order they were asked for
+    """
+    if cache is not None:
+        yield from cache.iterate(ROOT_file, *args, step_size=step_size)
+        return
+    
+    import uproot
+    with uproot.open(ROOT_file) as f:
+        f = f[f.keys()[0]]
+        for chunk in f.iterate(list(args), step_size=step_size, library='np'):
+            yield [chunk[branch] for branch in args]
+
+def accumulate_branch_from_TTree(ROOT_file, branch, binning, step_size="100 MB", weight_branch=None, cache=None):
+    """Histograms a branch chunk by chunk without ever loading the whole branch into memory
+
+    Parameters
+    ----------
+    ROOT_file : str
+        The ROOT file to read from
+    branch : str
+        The branch to histogram
+    binning : Binning_helper_methods.Binning
+        The binning to use. This should be the binning you give to the template class.
+    step_size : Union[int, str], optional
+        The size of each chunk, either as a number of entries or as a memory size, by default "100 MB"
+    weight_branch : str, optional
+        A branch holding per-event weights, by default None
+    cache : Branch_cache.Branch_cache, optional
+        A cache to map the branches from (and write them through to), by default None
+
+    Returns
+    -------
+    Binning_helper_methods.HistogramAccumulator
+        The accumulated histogram, which can be handed to the template classes in place of the raw events
+    """
+    accumulator = Binning_helper_methods.HistogramAccumulator(binning)
+    if weight_branch is None:
+        for (chunk,) in iterate_branches_from_TTree(ROOT_file, branch, step_size=step_size, cache=cache):
+            accumulator.fill(chunk)
+    else:
+        for chunk, weights in iterate_branches_from_TTree(ROOT_file, branch, weight_branch, step_size=step_size, cache=cache):
+            accumulator.fill(chunk, weights)
+    return accumulator
+
 def name_correctly(interf_probability):
     parsing_list = interf_probability.split('_')
     named_str = "ggH_"
@@ -45,8 +147,136 @@ def name_correctly(interf_probability):
             named_str += parsing_list[n+1]
     return named_str
 
-def Unroll_2D_OnShell(directory, fname):
-    """Code written by Jeffrey Davis of happy hour cocktail fame to unroll a 2 dimensional histogram
+def to_TH1(counts, bins, variances, title="", flow=False):
+    """Turns a numpy histogram and its per-bin variances into a ROOT TH1 that uproot can write, so that the bin errors survive.
+    float32 counts give a TH1F, anything else gives a TH1D.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The bin counts
+    bins : numpy.ndarray
+        The bin edges
+    variances : numpy.ndarray
+        The variance (error squared) of each bin
+    title : str, optional
+        The title of the histogram, by default ""
+    flow : bool, optional
+        If true, counts and variances already include the underflow and overflow bins at either end, by default False
+
+    Returns
+    -------
+    uproot.Model
+        A TH1F/TH1D that can be assigned to a key of a file opened with uproot.recreate
+    """
+    import uproot
+    counts = np.asarray(counts)
+    bins = np.asarray(bins, dtype=float)
+    variances = np.asarray(variances, dtype=float)
+    
+    data = np.zeros(len(bins) + 1, dtype=np.float32 if counts.dtype == np.float32 else float) #ROOT stores the underflow and overflow too
+    sumw2 = np.zeros(len(bins) + 1, dtype=float)
+    if flow:
+        data[:] = counts
+        sumw2[:] = variances
+    else:
+        data[1:-1] = counts
+        sumw2[1:-1] = variances
+    counts = data[1:-1]
+    
+    widths = np.diff(bins)
+    fXbins = None if np.allclose(widths, widths[0]) else bins #only variable binnings need the edges written out
+    xaxis = uproot.writing.identify.to_TAxis("xaxis", "", len(bins) - 1, bins[0], bins[-1], fXbins)
+    
+    centers = (bins[1:] + bins[:-1])/2
+    sumw = float(np.sum(counts, dtype=float))
+    return uproot.writing.identify.to_TH1x(None, title, data, sumw, sumw, float(np.sum(sumw2[1:-1])),
+                                           float(np.sum(counts*centers)), float(np.sum(counts*centers**2)), sumw2, xaxis)
+
+def _unrolled_names(temp_name, has_negative):
+    """Works out what the positive and negative parts of an unrolled histogram should be called
+
+    Parameters
+    ----------
+    temp_name : str
+        The name of the 2D histogram
+    has_negative : bool
+        Whether the 2D histogram has any negative bins
+
+    Returns
+    -------
+    tuple[str, str]
+        The names of the positive and negative parts
+    """
+    tpname = temp_name
+    tnname = temp_name
+    
+    if (has_negative and ( "bkg" in tnname or "Data" in tnname  or "0PH" in tnname or "0PM" in tnname or "L1" in tnname or "0M" in tnname)):
+        pass
+    elif (has_negative or not ( "bkg" in tnname or "Data" in tnname  or "0PH" in tnname or "0PM" in tnname or "L1" in tnname or "0M" in tnname) ):
+        if "up" in tpname or "dn" in tpname :
+            tpnm = tpname.split("_")
+            tpnm.insert(2,"positive")
+            tpname = "_".join(tpnm)
+        else :
+            tpname = tpname+"_positive"
+        
+        if "up" in tnname or "dn" in tnname :
+            tnnm = tnname.split("_")
+            tnnm.insert(2,"negative")
+            tnname = "_".join(tnnm)
+        else :
+            tnname = tnname+"_negative"
+    else:
+        tnname = tnname.replace("0Xff_","0Mff_")
+        tpname = tpname.replace("0Xff_","0Mff_")
+    
+    if "data" in  tnname or "Data" in tnname :
+        tnname = "data_obs"
+        tpname = "data_obs"
+    
+    return tpname, tnname
+
+def unroll_2D(counts, name):
+    """Unrolls the counts of a 2D histogram into its positive and negative 1D parts.
+    Empty background bins are given 10% of the average bin content, and negative bins go into the negative part.
+
+    Parameters
+    ----------
+    counts : Union[numpy.ndarray, Sparse_helper_methods.Sparse_histogram]
+        The 2D array of counts, indexed as [x, y] a la numpy.histogram2d, or a sparse 2D histogram (which is unrolled sparsely and only made dense here at the end)
+    name : str
+        The name of the histogram
+
+    Returns
+    -------
+    list[tuple[str, numpy.ndarray, numpy.ndarray]]
+        (name, counts, variances) for each of the positive and negative parts that are worth writing
+    """
+    if isinstance(counts, Sparse_helper_methods.Sparse_histogram):
+        return [(unrolled_name, *hist.to_dense()) for unrolled_name, hist in counts.unroll(name)]
+    
+    cont = np.asarray(counts, dtype=float).T.ravel() #the unrolled index runs over x first, then y
+    
+    has_negative = bool(np.any(cont < 0))
+    if "bkg" in name:
+        cont = np.where(cont == 0, 0.1*np.sum(cont)/cont.size, cont) #put small values in empty background bins
+    
+    pos = np.where(cont < 0, 0, cont).astype(np.float32)
+    neg = np.where(cont < 0, -cont, 0).astype(np.float32)
+    
+    tpname, tnname = _unrolled_names(name, has_negative)
+    
+    unrolled = []
+    if np.sum(pos) > 0:
+        unrolled.append((tpname, pos, pos.astype(float)))
+    if np.sum(neg) > 0:
+        unrolled.append((tnname, neg, neg.astype(float)**2))
+    return unrolled
+
+def Unroll_2D_OnShell(directory, fname, keys=None):
+    """Unrolls every 2 dimensional histogram in a file into 1 dimensional ones. 
+    Originally written by Jeffrey Davis of happy hour cocktail fame with PyROOT, now done with numpy arrays.
 
     Parameters
     ----------
@@ -54,130 +284,24 @@ def Unroll_2D_OnShell(directory, fname):
         The directory that you are inputting and outputting from
     fname : str
         The filename of what you are unrolling
+    keys : list[str], optional
+        The names of the histograms to unroll, by default None (which unrolls every TH2 in the file)
     """
+    import uproot
     if directory[-1] != '/':
         directory += '/'
     fname = fname.split('.')[0]
-        
-    histfile = ROOT.TFile.Open(directory+fname+'.root', "READ")
-    fout = ROOT.TFile(directory+fname+'_unrolled.root',"RECREATE")
-    fout.cd()
     
-    for keyname in ['ggH_0PM', 'ggH_0M', 'bkg_ggzz']:
-        hist = histfile.Get(keyname)
-        
-        xbins = hist.GetNbinsX()
-        ybins = hist.GetNbinsY()
-
-        temp_pos = ROOT.TH1F("temp_pos","",xbins*ybins,0,xbins*ybins)
-        temp_neg = ROOT.TH1F("temp_neg","dif",xbins*ybins,0,xbins*ybins)
-        #Unroll Hists
-        indk = 0
-        has_negative = False 
-        for y in range (1,ybins+1):
-            for x in range (1,xbins+1):
-                binx_c = hist.GetXaxis().GetBinCenter(x)
-                biny_c = hist.GetYaxis().GetBinCenter(y)
-                ibin =  hist.FindBin(binx_c,biny_c)
-                cont  = hist.GetBinContent(ibin)
-                #put small values in empty background bins
-                if cont == 0 : 
-                    if "bkg" in hist.GetName():
-                        intt = hist.Integral()
-                        nb = ybins*xbins
-                        contt = 0.1*intt*1.0/nb
-                        # print ("found empty bin",contt)
-                        hist.SetBinContent(ibin,contt)
-                        # print (cont)
-                if cont  < 0 :
-                    has_negative = True
-                    
-        for y in range (1,ybins+1):
-            for x in range (1,xbins+1):
-                binx_c = hist.GetXaxis().GetBinCenter(x)
-                biny_c = hist.GetYaxis().GetBinCenter(y)
-                ibin =  hist.FindBin(binx_c,biny_c)
-                cont  = hist.GetBinContent(ibin)
-                if cont  < 0 :
-                    temp_neg.Fill(indk,-1*cont)
-                else :
-                    temp_pos.Fill(indk,cont)
-                    temp_pos.SetBinError(indk, np.sqrt(cont))
-                indk = indk +1
-
-        temp_name = hist.GetName()
-        
-        tpname = temp_name
-        tnname = temp_name
-
-        if (has_negative and ( "bkg" in tnname or "Data" in tnname  or "0PH" in tnname or "0PM" in tnname or "L1" in tnname or "0M" in tnname)):
-            for y in range (1,ybins+1):
-                for x in range (1,xbins+1):
-                    binx_c = hist.GetXaxis().GetBinCenter(x)
-                    biny_c = hist.GetYaxis().GetBinCenter(y)
-                    ibin =  hist.FindBin(binx_c,biny_c)
-                    cont  = hist.GetBinContent(ibin)
-
-                #put small values in negtative background bins
-                #Also put 0 in negative signal bins
-                if cont  < 0 :
-                    hist.SetBinContent(ibin,0)
-                    print ("found negative bin",cont)
-                    cont = 0
-                if cont == 0 :
-                    if "bkg" in hist.GetName():
-                        intt = hist.Integral()
-                        nb = ybins*xbins
-                        contt = 0.1*intt*1.0/nb
-                        print ("found empty bin",contt)
-                        hist.SetBinContent(ibin,contt)
-                        print (cont)
-            
-            temp_neg.SetName(tnname)
-            temp_pos.SetName(tpname)
-
-        elif (has_negative or not ( "bkg" in tnname or "Data" in tnname  or "0PH" in tnname or "0PM" in tnname or "L1" in tnname or "0M" in tnname) ):
-
-            if "up" in tpname or "dn" in tpname :
-                tpnm = tpname.split("_")
-                tpnm.insert(2,"positive")
-                tpname= tpnm[0]
-                for ist in range(1,len(tpnm)):
-                    tpname = tpname+"_"+tpnm[ist] 
-            else :     
-                tpname = tpname+"_positive"
-
-
-            if "up" in tnname or "dn" in tnname :
-                tnnm = tnname.split("_")
-                tnnm.insert(2,"negative")
-                tnname= tnnm[0]
-                for ist in range(1,len(tnnm)):
-                    tnname = tnname+"_"+tnnm[ist]  
-            else :     
-                tnname = tnname+"_negative"
-
-                
-            temp_neg.SetName(tnname)
-            temp_pos.SetName(tpname)
-
-        else:
-        
-            tnname = tnname.replace("0Xff_","0Mff_")
-            tpname = tpname.replace("0Xff_","0Mff_")   
-            
-            temp_neg.SetName(tnname)
-            temp_pos.SetName(tpname)
-        if "data" in  tnname or "Data" in tnname : 
-            
-            temp_neg.SetName("data_obs")
-            temp_pos.SetName("data_obs")
-        
-        
-        
-        if temp_pos.Integral() > 0:
-            temp_pos.Write()
-        if temp_neg.Integral() > 0:
-            temp_neg.Write()
-            
-        print('Dumped Histogram into '+directory + fname+'_unrolled.root')
\ No newline at end of file
+    unrolled = []
+    with uproot.open(directory+fname+'.root') as histfile:
+        if keys is None:
+            keys = list(dict.fromkeys(histfile.keys(cycle=False, filter_classname="TH2*")))
+        for keyname in keys:
+            unrolled += unroll_2D(histfile[keyname].values(flow=False), keyname)
+    
+    with uproot.recreate(directory+fname+'_unrolled.root') as fout:
+        for name, counts, variances in unrolled:
+            nb = len(counts)
+            fout[name] = to_TH1(counts, np.arange(nb + 1, dtype=float), variances)
+    
+    print('Dumped Histogram into '+directory + fname+'_unrolled.root')
@@ -0,0 +1,171 @@
+import os
+import sys
+import shutil
+import uproot
+import warnings
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import Template_creator
+import DatacardMaker_OnShell
+import MakeInputRoot_OnShell
+import Binning_helper_methods
+import Template_helper_methods
+import Benchmark_helper_methods as bhm
+
+STAGES = ["import", "binning", "binning_2D", "scale", "scale_and_add_bkgs", "write_templates", "unroll_2D", "make_input_root", "datacard"]
+IMPORT_MODULES = ["Binning_helper_methods", "Template_helper_methods", "Mass_interference_helper_methods", "Template_creator"] #the modules worker processes import
+
+
+def make_creator(work_directory, bkgs, lowerlim, upperlim):
+    """Makes a bare 1D template creator around some backgrounds
+
+    Parameters
+    ----------
+    work_directory : str
+        The directory it should output to
+    bkgs : list[numpy.ndarray]
+        The background samples
+    lowerlim : float
+        The lower limit of the range
+    upperlim : float
+        The upper limit of the range
+
+    Returns
+    -------
+    Template_creator.Template_Creator_1D
+        The template creator
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") #the benchmarks are not run from inside HexUtils, and that's fine
+        return Template_creator.Template_Creator_1D(work_directory, "Benchmark", bkgs,
+                                                   ["bkg" + str(n) for n in range(len(bkgs))], [100]*len(bkgs), lowerlim, upperlim)
+
+def benchmark(events, nbins, work_directory, stages=STAGES, repeat=3, n_bkgs=2, n_templates=20, lowerlim=6, upperlim=9, seed=0):
+    """Runs every stage of the template workflow on its own with synthetic samples of a given size
+
+    Parameters
+    ----------
+    events : int
+        The number of events in each sample
+    nbins : int
+        The number of bins to use
+    work_directory : str
+        A scratch directory for the files the stages read and write
+    stages : list[str], optional
+        The stages to run, by default all of STAGES
+    repeat : int, optional
+        How many times each stage is timed, by default 3
+    n_bkgs : int, optional
+        The number of flat backgrounds, by default 2
+    n_templates : int, optional
+        The number of histograms in the template ROOT file, by default 20
+    lowerlim : float, optional
+        The lower limit of the mass range, by default 6
+    upperlim : float, optional
+        The upper limit of the mass range, by default 9
+    seed : int, optional
+        The seed for the synthetic samples, by default 0
+
+    Returns
+    -------
+    list[dict]
+        The timings of each stage, a la Benchmark_helper_methods.time_stage
+    """
+    rng = np.random.default_rng(seed)
+    binning = Binning_helper_methods.Binning(nbins, lowerlim, upperlim)
+    work_directory = os.path.join(work_directory, '')
+
+    signal = bhm.three_resonance_spectrum(events, lowerlim, upperlim, rng=rng)
+    bkgs = [bhm.flat_background(events, lowerlim, upperlim, rng) for _ in range(n_bkgs)]
+    counts, _ = binning.histogram(signal)
+
+    #a template file a la Interf_Reso_template_creator_1D, with a few signal, interference and background histograms
+    templates = {}
+    for n in range(n_templates):
+        name = "ggH_0PM_BW" + str(n) if n % 3 else "bkg_" + str(n)
+        templates[name] = (Template_helper_methods.scale(np.roll(counts, n), 10), binning.edges)
+
+    results = []
+    info = {"nbins": nbins}
+
+    if "binning" in stages:
+        results.append(bhm.time_stage("binning", binning.histogram, lambda: signal, repeat, events, **info))
+
+    if "binning_2D" in stages:
+        binning_2D = Binning_helper_methods.Binning_2D(binning, Binning_helper_methods.Binning(nbins, 0, 1))
+        discriminant = rng.uniform(0, 1, len(signal))
+        results.append(bhm.time_stage("binning_2D", binning_2D.histogram, lambda: (signal, discriminant), repeat, events, nbins_2D=binning_2D.nbins))
+
+    if "scale" in stages:
+        results.append(bhm.time_stage("scale", Template_helper_methods.scale, lambda: (counts, 10), repeat, 0, **info))
+
+    if "scale_and_add_bkgs" in stages:
+        results.append(bhm.time_stage("scale_and_add_bkgs", lambda creator: creator.scale_and_add_bkgs(binning),
+                                      lambda: make_creator(work_directory, bkgs, lowerlim, upperlim), repeat, n_bkgs*events, n_bkgs=n_bkgs, **info))
+
+    creator = make_creator(work_directory, bkgs, lowerlim, upperlim)
+    creator.templates = templates
+    if "write_templates" in stages:
+        results.append(bhm.time_stage("write_templates", creator.write_templates, repeat=repeat, n_templates=n_templates, **info))
+    elif "make_input_root" in stages or "datacard" in stages:
+        creator.write_templates() #the later stages read this file
+
+    if "unroll_2D" in stages:
+        ybinning = Binning_helper_methods.Binning(nbins, 0, 1)
+        discriminant = rng.uniform(0, 1, len(signal))
+        counts_2D = Binning_helper_methods.Binning_2D(binning, ybinning).histogram(signal, discriminant)[0]
+        with uproot.recreate(work_directory + "Benchmark_2D.root") as f:
+            for n in range(n_templates):
+                name = "ggH_0PM_BW" + str(n) if n % 3 else "bkg_" + str(n)
+                f[name] = (np.roll(counts_2D, n, axis=0).astype(float)*(-1 if n % 5 == 4 else 1), binning.edges, ybinning.edges)
+        results.append(bhm.time_stage("unroll_2D", Template_helper_methods.Unroll_2D_OnShell, lambda: (work_directory, "Benchmark_2D"),
+                                      repeat, n_templates=n_templates, nbins_2D=nbins*nbins))
+
+    if "make_input_root" in stages:
+        results.append(bhm.time_stage("make_input_root", MakeInputRoot_OnShell.Make_Template_With_Fake_Data,
+                                      lambda: (work_directory + "Benchmark.input.root", [work_directory + "Benchmark.root"], False),
+                                      repeat, n_templates=n_templates, **info))
+
+    if "datacard" in stages:
+        if not os.path.isfile(work_directory + "Benchmark.input.root"):
+            MakeInputRoot_OnShell.Make_Template_With_Fake_Data(work_directory + "Benchmark.input.root", [work_directory + "Benchmark.root"], False)
+        results.append(bhm.time_stage("datacard", DatacardMaker_OnShell.make_datacard, lambda: (work_directory + "Benchmark.input.root", work_directory),
+                                      repeat, n_templates=n_templates, **info))
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times every stage of the template workflow with synthetic Breit-Wigner samples")
+    parser.add_argument('-e', '--events', nargs='+', default=[100_000, 1_000_000], type=lambda x: int(float(x)),
+                        help="The number of events in each sample. Give several (i.e. 1e5 1e6 1e7 1e8) to measure scaling")
+    parser.add_argument('-n', '--nbins', nargs='+', default=[40], type=int,
+                        help="The number of bins to use. Give several to measure scaling with the binning")
+    parser.add_argument('-r', '--repeat', default=3, type=int,
+                        help="How many times each stage is timed")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES,
+                        help="The stages to time")
+    parser.add_argument('--bkgs', default=2, type=int,
+                        help="The number of flat backgrounds")
+    parser.add_argument('--templates', default=20, type=int,
+                        help="The number of histograms in the template file")
+    parser.add_argument('--seed', default=0, type=int,
+                        help="The seed for the synthetic samples")
+    parser.add_argument('-o', '--output', default="-",
+                        help="The JSON file to write the results to (- prints them)")
+    args = parser.parse_args()
+
+    work_directory = tempfile.mkdtemp(prefix="template_benchmark_")
+    try:
+        results = []
+        if "import" in args.stages: #this does not depend on the number of events or bins
+            results += [bhm.time_import(module, args.repeat) for module in IMPORT_MODULES]
+        with contextlib.redirect_stdout(sys.stderr): #keeps stdout clean for the report
+            for events in args.events:
+                for nbins in args.nbins:
+                    results += benchmark(events, nbins, work_directory, args.stages, args.repeat, args.bkgs, args.templates, seed=args.seed)
+    finally:
+        shutil.rmtree(work_directory)
+
+    bhm.write_report(args.output, results, **vars(args))
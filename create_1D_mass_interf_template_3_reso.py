@@ -2,9 +2,16 @@ import re
 import tqdm
 import uproot
 import argparse
+import contextlib
 import numpy as np
 import mplhep as hep
+import Branch_cache
 import Template_creator
+import concurrent.futures
+import Binning_helper_methods
+import Profiling_helper_methods
+import Adaptive_binning_helper_methods
+import Template_helper_methods
 import matplotlib.pyplot as plt
 
 def place_that_list(filename):
@@ -43,14 +50,112 @@ def place_that_list(filename):
             insertionList[5] = filename
     else:
         print("whoops!")
+
+def load_sample(filename, binning=None, step_size="100 MB", cache=None):
+    """Loads the M4L branch of a sample
+
+    Parameters
+    ----------
+    filename : str
+        The ROOT file holding the sample
+    binning : Binning_helper_methods.Binning, optional
+        If given, the sample is streamed in chunks and histogrammed with this binning instead of being read whole, by default None
+    step_size : Union[int, str], optional
+        The size of each chunk when streaming, by default "100 MB"
+    cache : Branch_cache.Branch_cache, optional
+        A cache to map M4L from instead of decompressing the file, by default None
+
+    Returns
+    -------
+    Union[numpy.ndarray, Binning_helper_methods.HistogramAccumulator]
+        Either every M4L value, or the histogram accumulated while streaming
+    """
+    if binning is not None:
+        return Template_helper_methods.accumulate_branch_from_TTree(filename, "M4L", binning, step_size, cache=cache)
+    if cache is not None:
+        return Template_helper_methods.extract_branches_from_TTree(filename, "M4L", cache=cache)[0]
+    
+    with uproot.open(filename) as dataFile:
+        dataFile = dataFile[dataFile.keys()[0]]
+        return dataFile["M4L"].array(library="np")
+
+def load_samples(filenames, binning=None, step_size="100 MB", jobs=1, executor="thread", cache=None):
+    """Loads many samples at once through a pool of workers, since reading and decompressing each file is independent of the others
+
+    Parameters
+    ----------
+    filenames : list[str]
+        The ROOT files holding the samples
+    binning : Binning_helper_methods.Binning, optional
+        If given, each sample is streamed and histogrammed with this binning, by default None
+    step_size : Union[int, str], optional
+        The size of each chunk when streaming, by default "100 MB"
+    jobs : int, optional
+        The number of workers to load with, by default 1 (which loads everything serially)
+    executor : str, optional
+        Either "thread" or "process", by default "thread"
+    cache : Branch_cache.Branch_cache, optional
+        A cache to map M4L from instead of decompressing the files, by default None
+
+    Returns
+    -------
+    dict[str, Union[numpy.ndarray, Binning_helper_methods.HistogramAccumulator]]
+        The sample for each filename, in the same order as filenames
+    """
+    if jobs <= 1:
+        return {filename: load_sample(filename, binning, step_size, cache) for filename in tqdm.tqdm(filenames)}
+    
+    if executor == "process":
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    else:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    
+    with pool:
+        futures = {filename: pool.submit(load_sample, filename, binning, step_size, cache) for filename in filenames}
+        for _ in tqdm.tqdm(concurrent.futures.as_completed(futures.values()), total=len(futures)):
+            pass #this just keeps the progress bar ticking as files finish
+        return {filename: future.result() for filename, future in futures.items()}
+
+def bin_edges(distribution, binning, nbins, min_count, lowerlim, upperlim):
+    """Finds variable-width bin edges from the yield of the backgrounds
+
+    Parameters
+    ----------
+    distribution : Union[Adaptive_binning_helper_methods.Sorted_sample, Adaptive_binning_helper_methods.Quantile_sketch]
+        The backgrounds, scaled to their areas and put together
+    binning : str
+        Either "equal_yield" (nbins bins of equal background yield) or "min_count" (the finest bins holding at least min_count each)
+    nbins : int
+        The number of bins for "equal_yield"
+    min_count : float
+        The least yield a bin can have for "min_count"
+    lowerlim : float
+        The lower limit of the range
+    upperlim : float
+        The upper limit of the range
+
+    Returns
+    -------
+    numpy.ndarray
+        The bin edges
+    """
+    if binning == "equal_yield":
+        return Adaptive_binning_helper_methods.equal_yield_edges(distribution, nbins, lowerlim, upperlim)
+    return Adaptive_binning_helper_methods.min_count_edges(distribution, min_count, lowerlim, upperlim)
         
 if __name__ == "__main__":
     plt.style.use(hep.style.ROOT)
 
     parser = argparse.ArgumentParser()
     # parser.add_argument('filename')
-    parser.add_argument('-n', '--nbins', default=40,
+    parser.add_argument('-n', '--nbins', default=40, type=int,
                         help="The number of bins you want")
+    parser.add_argument('--binning', default='uniform', choices=['uniform', 'equal_yield', 'min_count'],
+                        help="Either nbins bins of equal width, nbins bins of equal background yield, or the finest bins holding a background yield of at least --minCount")
+    parser.add_argument('--minCount', default=10, type=float,
+                        help="The least background yield a bin can have with --binning min_count")
+    parser.add_argument('--sketchBins', default=16384, type=int,
+                        help="The number of fine bins the backgrounds are sketched with to find an adaptive binning when streaming")
     parser.add_argument('-o', '--outFolder', default='./',
                         help="The directory you'd like to output to")
     parser.add_argument('-c', '--crossSection', required=True,
@@ -61,6 +166,30 @@ if __name__ == "__main__":
                         help="The areas for each background")
     parser.add_argument('-a', '--areas', nargs=3, type=float,
                         help="The areas for the three signals")
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help="Stream the samples in chunks and histogram them on the fly instead of loading them into memory")
+    parser.add_argument('--stepSize', default="100 MB",
+                        help="The chunk size when streaming, either a number of entries or a size like '100 MB'")
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+                        help="The number of workers to load the samples with")
+    parser.add_argument('--executor', default='thread', choices=['thread', 'process'],
+                        help="Whether the workers loading the samples are threads or processes")
+    parser.add_argument('--float32', action='store_true',
+                        help="Store the samples as float32 instead of the dtype they are read as, which halves the memory of float64 branches")
+    parser.add_argument('--histogramOnly', action='store_true',
+                        help="Free the events of every sample once the templates are made, keeping only their histograms")
+    parser.add_argument('--cacheDir', default=None,
+                        help="A directory to cache the extracted M4L branches in, so that repeat runs can map them instead of decompressing the files")
+    parser.add_argument('--cacheSize', default=20, type=float,
+                        help="The most space the cache may take up, in GB")
+    parser.add_argument('--plotFormats', nargs='+', default=['png', 'pdf'],
+                        help="The file formats to save the interference plots as")
+    parser.add_argument('--plotJobs', default=None, type=int,
+                        help="The number of processes to draw the interference plots with (defaults to one per CPU)")
+    parser.add_argument('--profile', default=None,
+                        help="A JSON file to write the time, memory and throughput of every stage to")
+    parser.add_argument('--cProfile', action='store_true',
+                        help="Also run everything under cProfile, and dump the statistics next to the --profile report")
     args = parser.parse_args()
     
     """
@@ -74,20 +203,45 @@ if __name__ == "__main__":
         raise argparse.ArgumentError("Background argument and bkgArea arguments should be of the same length!")
 
     coupling_hunter = re.compile(r'\w+_ghzpzp(\d)_?\S+')
+    
+    lowerlim, upperlim = 6, 9
+    step_size = int(args.stepSize) if args.stepSize.isdigit() else args.stepSize
+    cache = Branch_cache.Branch_cache(args.cacheDir, int(args.cacheSize*1e9)) if args.cacheDir else None
+    profiler = Profiling_helper_methods.Stage_profiler(cprofile=args.cProfile) if args.profile else None
+    
+    bins = args.nbins
+    if args.stream and args.binning != 'uniform': #the backgrounds are streamed once into a fine histogram to find the edges they are then streamed with
+        sketches = load_samples(args.backgrounds, Binning_helper_methods.Binning(args.sketchBins, lowerlim, upperlim), step_size, args.jobs, args.executor, cache)
+        distribution = Adaptive_binning_helper_methods.Quantile_sketch.combine(
+            [Adaptive_binning_helper_methods.Quantile_sketch(*sketch.histogram()) for sketch in sketches.values()], args.bkgAreas)
+        bins = bin_edges(distribution, args.binning, args.nbins, args.minCount, lowerlim, upperlim)
+    binning = Binning_helper_methods.Binning(bins, lowerlim, upperlim) if args.stream else None
 
     data_samples = {}
     cross_section_samples = {}
     bkg_samples = {}
+    sample_files = []
     with open(args.crossSection) as f:
         f.readline()
-        for line in tqdm.tqdm(f):
+        for line in f:
             line = line.strip().split(',')
-            with uproot.open(line[0]) as dataFile:
-                dataFile = dataFile[dataFile.keys()[0]]
-                sample = dataFile["M4L"].array(library="np")
-                
-                data_samples[line[0].split('/')[-1]] = sample
-                cross_section_samples[line[0].split('/')[-1]] = float(line[1])
+            sample_files.append(line[0])
+            cross_section_samples[line[0].split('/')[-1]] = float(line[1])
+    
+    #every signal and background file is loaded at once
+    with (profiler.stage("load") if profiler else contextlib.nullcontext({"events": 0, "bytes": 0})) as record:
+        loaded_samples = load_samples(sample_files + args.backgrounds, binning, step_size, args.jobs, args.executor, cache)
+        for sample in loaded_samples.values():
+            record["events"] += sample.entries if isinstance(sample, Binning_helper_methods.HistogramAccumulator) else len(sample)
+            record["bytes"] += getattr(sample, "nbytes", 0)
+    
+    if not args.stream and args.binning != 'uniform': #every background is sorted once, and the edges are read off of that
+        distribution = Adaptive_binning_helper_methods.Sorted_sample([loaded_samples[bkg] for bkg in args.backgrounds], args.bkgAreas, 
+                                                                     lowerlim=lowerlim, upperlim=upperlim)
+        bins = bin_edges(distribution, args.binning, args.nbins, args.minCount, lowerlim, upperlim)
+    
+    for filename in sample_files:
+        data_samples[filename.split('/')[-1]] = loaded_samples[filename]
     
     insertionList = [None]*len(data_samples)
     
@@ -95,18 +249,23 @@ if __name__ == "__main__":
         place_that_list(sampleName)
     
     for bkg in args.backgrounds:
-        with uproot.open(bkg) as dataFile:
-            dataFile = dataFile[dataFile.keys()[0]]
-            sample = dataFile["M4L"].array(library="np")
-            bkg_samples[bkg.split('/')[-1].split('.')[0].split('_')[0]] = sample
+        bkg_samples[bkg.split('/')[-1].split('.')[0].split('_')[0]] = loaded_samples[bkg]
     
     
     
     Three_BW_Creation = Template_creator.Interf_Reso_template_creator_1D(args.outFolder, "Mass_Template",
-                                                     bkg_samples.values(), bkg_samples.keys(), args.bkgAreas, 6, 9,
+                                                     bkg_samples.values(), bkg_samples.keys(), args.bkgAreas, lowerlim, upperlim,
                                                      *list(map(data_samples.get,insertionList)),
                                                      *list(map(cross_section_samples.get, insertionList)),
-                                                     args.nbins, *args.areas)
+                                                     bins, *args.areas, profiler=profiler, sample_dtype=np.float32 if args.float32 else None)
+    if args.histogramOnly: #everything after this only needs the histograms, so the events can go
+        Three_BW_Creation.drop_events()
+        loaded_samples.clear()
+        data_samples.clear()
+        bkg_samples.clear()
     Three_BW_Creation.create_datacards()
-    Three_BW_Creation.stackPlot()
-    Three_BW_Creation.plot_overall_interference()
\ No newline at end of file
+    Three_BW_Creation.stackPlot(bins)
+    Three_BW_Creation.plot_overall_interference(args.plotFormats, args.plotJobs)
+    
+    if profiler:
+        profiler.write_report(args.profile)
\ No newline at end of file
@@ -0,0 +1,103 @@
+import json
+import tqdm
+import argparse
+import numpy as np
+import Branch_cache
+import concurrent.futures
+import Batch_helper_methods
+import Template_helper_methods
+
+def load_branches(filenames, branches, jobs=1, cache=None):
+    """Loads some branches from many files at once through a pool of threads. Each file is read once, however many samples it holds.
+
+    Parameters
+    ----------
+    filenames : list[str]
+        The ROOT files to read
+    branches : list[str]
+        The branches to read from every file
+    jobs : int, optional
+        The number of threads to load with, by default 1 (which loads everything serially)
+    cache : Branch_cache.Branch_cache, optional
+        A cache to map the branches from instead of decompressing the files, by default None
+
+    Returns
+    -------
+    dict[str, list[numpy.ndarray]]
+        The branches of each file, in the order they were asked for
+    """
+    filenames = list(dict.fromkeys(filenames))
+    if jobs <= 1:
+        return {filename: Template_helper_methods.extract_branches_from_TTree(filename, *branches, cache=cache) for filename in tqdm.tqdm(filenames)}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {filename: pool.submit(Template_helper_methods.extract_branches_from_TTree, filename, *branches, cache=cache) for filename in filenames}
+        for _ in tqdm.tqdm(concurrent.futures.as_completed(futures.values()), total=len(futures)):
+            pass #this just keeps the progress bar ticking as files finish
+        return {filename: future.result() for filename, future in futures.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Makes the templates and datacards of every (category, era) channel in one run")
+    parser.add_argument('config',
+                        help="A JSON file listing the samples of each era, see below")
+    parser.add_argument('-n', '--nbins', default=40, type=int,
+                        help="The number of bins you want")
+    parser.add_argument('-o', '--outFolder', default='./',
+                        help="The directory you'd like to output to")
+    parser.add_argument('--fname', default="Mass_Template",
+                        help="The name every channel's outputs start with")
+    parser.add_argument('--lowerlim', default=6, type=float,
+                        help="The lower limit of the range")
+    parser.add_argument('--upperlim', default=9, type=float,
+                        help="The upper limit of the range")
+    parser.add_argument('--branch', default="M4L",
+                        help="The branch to make templates of")
+    parser.add_argument('--categoryBranch', default="category",
+                        help="The branch holding the category number of every event (its place in --categories)")
+    parser.add_argument('--weightBranch', default=None,
+                        help="A branch holding per-event weights, if there is one")
+    parser.add_argument('--categories', nargs='+', default=Batch_helper_methods.CATEGORIES,
+                        help="The categories, in the order the category branch numbers them")
+    parser.add_argument('-j', '--jobs', default=None, type=int,
+                        help="The number of workers to make the channels with (defaults to one per CPU)")
+    parser.add_argument('--executor', default='process', choices=['thread', 'process'],
+                        help="Whether the workers making the channels are threads or processes")
+    parser.add_argument('--loadJobs', default=1, type=int,
+                        help="The number of threads to load the samples with")
+    parser.add_argument('--float32', action='store_true',
+                        help="Store the samples as float32, which halves the memory of float64 branches")
+    parser.add_argument('--cacheDir', default=None,
+                        help="A directory to cache the extracted branches in, so that repeat runs can map them instead of decompressing the files")
+    parser.add_argument('--cacheSize', default=20, type=float,
+                        help="The most space the cache may take up, in GB")
+    args = parser.parse_args()
+
+    """
+    Config files should be arranged as follows:
+    {"<era>": {"signals": {"<name>": {"file": <ROOT file>, "area": <yield>}, ...}, "bkgs": {"<name>": {"file": <ROOT file>, "area": <yield>}, ...}}, ...}
+    Every era gets one channel per category, and a file used by several samples or eras is only read once.
+    """
+    with open(args.config) as f:
+        config = json.load(f)
+
+    cache = Branch_cache.Branch_cache(args.cacheDir, int(args.cacheSize*1e9)) if args.cacheDir else None
+    branches = [args.branch, args.categoryBranch] + ([args.weightBranch] if args.weightBranch else [])
+    filenames = [sample["file"] for era in config.values() for kind in ("signals", "bkgs") for sample in era.get(kind, {}).values()]
+    loaded = load_branches(filenames, branches, args.loadJobs, cache)
+
+    producer = Batch_helper_methods.Batch_producer(args.outFolder, args.fname, args.lowerlim, args.upperlim, args.nbins, args.categories,
+                                                   np.float32 if args.float32 else None)
+    indices = {} #every file is split into its categories once, and the index is shared by each of its branches
+    for era, samples in config.items():
+        for kind in ("signals", "bkgs"):
+            for name, sample in samples.get(kind, {}).items():
+                values, category, *weights = loaded[sample["file"]]
+                if sample["file"] not in indices:
+                    indices[sample["file"]] = Batch_helper_methods.Category_index(category, len(args.categories))
+                producer.add_sample(era, name, values, indices[sample["file"]], sample["area"], weights[0] if weights else None, bkg=kind == "bkgs")
+    del loaded, indices #the producer holds every sample split into its categories now
+
+    datacards = producer.produce(args.jobs, args.executor)
+    for (category, era), card in datacards.items():
+        print(category, era, card)
+    print(Batch_helper_methods.combine_cards_command(datacards, args.outFolder.rstrip('/') + "/" + args.fname + "_combined.txt"))
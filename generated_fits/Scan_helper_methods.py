@@ -0,0 +1,278 @@
+import os
+import glob
+import json
+import warnings
+import numpy as np
+import concurrent.futures
+#Everything here works on plain numpy arrays, one entry per scan point, so that thousands of split-job outputs can be merged and summarized at once
+
+LEVELS = {"68": 1.0, "95": 3.841458820694124} #2*deltaNLL at the edge of the 68% and 95% intervals of a single parameter
+
+
+def find_scan_files(paths, pattern="higgsCombine*.root"):
+    """Expands directories into the Combine outputs inside of them, so that a scan split across many jobs can be given as the directory it was written to
+
+    Parameters
+    ----------
+    paths : list[str]
+        ROOT files and/or directories
+    pattern : str, optional
+        What the Combine outputs in a directory look like, by default "higgsCombine*.root"
+
+    Returns
+    -------
+    list[str]
+        Every file, sorted within each directory
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames += sorted(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+        else:
+            filenames.append(path)
+    return filenames
+
+def read_scan(filename, branches):
+    """Reads only the branches that are needed from the limit tree of one Combine output
+
+    Parameters
+    ----------
+    filename : str
+        The higgsCombine*.root file
+    branches : list[str]
+        The parameters that were scanned
+
+    Returns
+    -------
+    Union[dict[str, numpy.ndarray], None]
+        Each parameter and deltaNLL, or None if the file is unreadable, has no limit tree or is missing a branch (i.e. the job failed)
+    """
+    import uproot #imported here so that the arrays can be summarized without it
+    try:
+        with uproot.open(filename) as f:
+            if "limit" not in f:
+                warnings.warn(filename + " has no limit tree, and is skipped!")
+                return None
+            wanted = list(branches) + ["deltaNLL"]
+            scan = f["limit"].arrays(wanted, library='np')
+    except uproot.KeyInFileError as error: #a KeyError, raised by some versions of uproot when a branch is not in the tree
+        warnings.warn(filename + " is missing a branch (" + str(error) + "), and is skipped!")
+        return None
+    except (OSError, ValueError) as error:
+        warnings.warn(filename + " could not be read (" + str(error) + "), and is skipped!")
+        return None
+    missing = [branch for branch in wanted if branch not in scan] #others leave the branch out of what they return
+    if missing:
+        warnings.warn(filename + " is missing " + ", ".join(missing) + ", and is skipped!")
+        return None
+    return scan
+
+def read_scans(filenames, branches, jobs=None):
+    """Reads many Combine outputs through a pool of threads and puts them together
+
+    Parameters
+    ----------
+    filenames : list[str]
+        The higgsCombine*.root files
+    branches : list[str]
+        The parameters that were scanned
+    jobs : int, optional
+        The number of threads to read with, by default None (which uses one per CPU). 1 reads everything serially.
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray, int]
+        The (points, parameters) values of the parameters, the deltaNLL of every point, and the number of files that could be read
+    """
+    if jobs is None:
+        jobs = min(len(filenames), os.cpu_count() or 1)
+    if jobs <= 1:
+        scans = [read_scan(filename, branches) for filename in filenames]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            scans = list(pool.map(read_scan, filenames, [branches]*len(filenames)))
+
+    scans = [scan for scan in scans if scan is not None]
+    if not scans:
+        return np.empty((0, len(branches))), np.empty(0), 0
+    points = np.column_stack([np.concatenate([scan[branch] for scan in scans]).astype(float) for branch in branches])
+    deltaNLL = np.concatenate([scan["deltaNLL"] for scan in scans]).astype(float)
+    return points, deltaNLL, len(scans)
+
+def deduplicate(points, deltaNLL):
+    """Merges the points that appear more than once (i.e. the best fit every split job writes), keeping the lowest deltaNLL of each.
+    Points whose fit failed (a non-finite deltaNLL) are dropped.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        The (points, parameters) values of the parameters
+    deltaNLL : numpy.ndarray
+        The deltaNLL of every point
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        The unique points sorted by their parameters (the first one slowest), and their deltaNLL
+    """
+    finite = np.isfinite(deltaNLL) & np.all(np.isfinite(points), axis=1)
+    points, deltaNLL = points[finite], deltaNLL[finite]
+    if not len(deltaNLL):
+        return points, deltaNLL
+
+    order = np.lexsort((deltaNLL,) + tuple(points[:, k] for k in reversed(range(points.shape[1])))) #each point's lowest deltaNLL comes first
+    points, deltaNLL = points[order], deltaNLL[order]
+    first = np.ones(len(deltaNLL), dtype=bool)
+    first[1:] = np.any(points[1:] != points[:-1], axis=1)
+    return points[first], deltaNLL[first]
+
+def profile(values, q):
+    """Profiles 2*deltaNLL along one parameter: the lowest value over every other parameter at each value of this one
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        The value of the parameter at every point
+    q : numpy.ndarray
+        2*deltaNLL at every point
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        The distinct values of the parameter in increasing order, and the profiled 2*deltaNLL at each
+    """
+    order = np.argsort(values, kind='stable')
+    values, q = values[order], q[order]
+    starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+    return values[starts], np.minimum.reduceat(q, starts)
+
+def crossings(x, q, level):
+    """Finds where a scan crosses a level, interpolating linearly between neighbouring points
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        The values of the parameter, in increasing order
+    q : numpy.ndarray
+        2*deltaNLL at each value
+    level : float
+        The level (i.e. 1 for 68%)
+
+    Returns
+    -------
+    numpy.ndarray
+        The value of the parameter at every crossing, in increasing order
+    """
+    above = q > level
+    crossed = np.flatnonzero(above[1:] != above[:-1]) #the crossing is between point n and point n + 1
+    x0, x1, q0, q1 = x[crossed], x[crossed + 1], q[crossed], q[crossed + 1]
+    return x0 + (level - q0)*(x1 - x0)/(q1 - q0)
+
+def interval(x, q, level):
+    """Finds the interval around the best fit where a scan stays below a level
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        The values of the parameter, in increasing order
+    q : numpy.ndarray
+        2*deltaNLL at each value
+    level : float
+        The level (i.e. 1 for 68%)
+
+    Returns
+    -------
+    Tuple[float, float]
+        The crossings on either side of the best fit, or NaN on a side where the scan never crosses the level
+    """
+    best = x[np.argmin(q)]
+    points = crossings(x, q, level)
+    below, above = points[points <= best], points[points >= best]
+    return (float(below[-1]) if len(below) else np.nan, float(above[0]) if len(above) else np.nan)
+
+def summarize(points, deltaNLL, branches, levels=LEVELS):
+    """Works out the best fit and the intervals of every parameter of a (deduplicated) scan.
+    2*deltaNLL is measured from the lowest point of the scan, in case a split job found a lower minimum than the best fit.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        The (points, parameters) values of the parameters, a la deduplicate
+    deltaNLL : numpy.ndarray
+        The deltaNLL of every point
+    branches : list[str]
+        The name of every parameter
+    levels : dict[str, float], optional
+        The 2*deltaNLL of every interval, by default LEVELS (68% and 95%)
+
+    Returns
+    -------
+    dict
+        The best fit point, and for every parameter its best fit value along with the crossings and interval at each level
+    """
+    q = 2*(deltaNLL - np.min(deltaNLL))
+    best = np.argmin(q)
+    summary = {"points": int(len(q)), "best_fit": {branch: float(points[best, k]) for k, branch in enumerate(branches)}, "parameters": {}}
+    for k, branch in enumerate(branches):
+        x, profiled = profile(points[:, k], q)
+        summary["parameters"][branch] = {
+            "best_fit": float(points[best, k]),
+            "crossings": {name: crossings(x, profiled, level).tolist() for name, level in levels.items()},
+            "intervals": {name: [None if np.isnan(edge) else edge for edge in interval(x, profiled, level)] for name, level in levels.items()}, #open ends are null
+        }
+    return summary
+
+def write_summary(filename, summary, points=None, deltaNLL=None, branches=None):
+    """Writes a summary out as JSON, and the merged scan alongside it if it is given
+
+    Parameters
+    ----------
+    filename : str
+        The JSON file to write, or "-" to print it
+    summary : dict
+        The output of summarize or aggregate
+    points : numpy.ndarray, optional
+        The unique points, which are written to <filename without .json>.npz along with their deltaNLL, by default None
+    deltaNLL : numpy.ndarray, optional
+        The deltaNLL of every point, by default None
+    branches : list[str], optional
+        The name of every parameter, used as the names of the arrays in the .npz file, by default None
+    """
+    if filename == "-":
+        print(json.dumps(summary, indent=1))
+        return
+    with open(filename, "w") as f:
+        json.dump(summary, f, indent=1)
+    if points is not None:
+        np.savez_compressed(os.path.splitext(filename)[0] + ".npz", deltaNLL=deltaNLL, **{branch: points[:, k] for k, branch in enumerate(branches)})
+
+def aggregate(paths, branches, jobs=None, levels=LEVELS):
+    """Merges a scan split across many Combine outputs and summarizes it
+
+    Parameters
+    ----------
+    paths : list[str]
+        The higgsCombine*.root files and/or the directories holding them
+    branches : list[str]
+        The parameters that were scanned
+    jobs : int, optional
+        The number of threads to read with, by default None (which uses one per CPU)
+    levels : dict[str, float], optional
+        The 2*deltaNLL of every interval, by default LEVELS (68% and 95%)
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray, dict]
+        The unique points, their deltaNLL, and the summary (a la summarize, along with how many files, entries, failed points and duplicates there were)
+    """
+    filenames = find_scan_files(paths)
+    points, deltaNLL, read = read_scans(filenames, branches, jobs)
+    entries = len(deltaNLL)
+    failed = int(np.sum(~np.isfinite(deltaNLL) | ~np.all(np.isfinite(points), axis=1)))
+    points, deltaNLL = deduplicate(points, deltaNLL)
+    if not len(deltaNLL):
+        raise ValueError("None of the " + str(len(filenames)) + " files have any points with a finite deltaNLL!")
+
+    summary = {"files": len(filenames), "files_read": read, "entries": entries, "failed_points": failed, "duplicates": entries - failed - len(deltaNLL)}
+    summary.update(summarize(points, deltaNLL, branches, levels))
+    return points, deltaNLL, summary
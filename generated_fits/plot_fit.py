@@ -1,9 +1,8 @@
-import uproot
-import matplotlib.pyplot as plt
-import mplhep as hep
-import pandas as pd
 import argparse
-import contextlib
+import numpy as np
+import mplhep as hep
+import matplotlib.pyplot as plt
+import Scan_helper_methods
 
 plt.style.use(hep.style.ROOT)
 import matplotlib as mpl
@@ -13,28 +12,53 @@ mpl.rcParams['lines.linewidth'] = 2
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('files', nargs='+')
+    parser.add_argument('files', nargs='+',
+                        help="The higgsCombine*.root files to plot, or directories holding them")
     parser.add_argument('-b', '--branches', nargs='+', default=['RF'])
+    parser.add_argument('-m', '--merge', action='store_true',
+                        help="Treat every file as part of one scan split across jobs, and plot it as a single curve")
+    parser.add_argument('-j', '--jobs', default=None, type=int,
+                        help="The number of threads to read the files with (defaults to one per CPU)")
+    parser.add_argument('-s', '--summary', default=None,
+                        help="A JSON file to write the best fit and 68%%/95%% intervals of each scan to (- prints it). The merged scan is written next to it as .npz")
     args = parser.parse_args()
     
+    if args.merge: #thousands of split-job outputs become one deduplicated scan
+        points, deltaNLL, summary = Scan_helper_methods.aggregate(args.files, args.branches, args.jobs)
+        scans = {"merged": (points, deltaNLL)}
+        if args.summary:
+            Scan_helper_methods.write_summary(args.summary, summary, points, deltaNLL, args.branches)
+    else:
+        files = Scan_helper_methods.find_scan_files(args.files)
+        scans = {}
+        summaries = {}
+        for name in files:
+            points, deltaNLL, read = Scan_helper_methods.read_scans([name], args.branches, 1)
+            if not read:
+                continue
+            scans[name] = (points, deltaNLL) #every file is plotted as it is, only the summary uses the deduplicated scan
+            unique_points, unique_deltaNLL = Scan_helper_methods.deduplicate(points, deltaNLL)
+            if len(unique_deltaNLL):
+                summaries[name] = Scan_helper_methods.summarize(unique_points, unique_deltaNLL, args.branches)
+        if args.summary:
+            Scan_helper_methods.write_summary(args.summary, summaries)
     
-    with contextlib.ExitStack() as stack: #ExitStack takes in a bunch of things and closes them after so you don't have to!
-        files = [
-            stack.enter_context(uproot.open(fname)) for fname in args.files
-        ]
-        
-        file_data = [file['limit'].arrays(args.branches + ['deltaNLL'], library='pd') for file in files]
-        
-        for element in args.branches:
-            plt.cla()
-            for data, name in zip(file_data, args.files):
-                data.sort_values(element, inplace=True, ignore_index=True)
-                plt.plot(data[element], 2*data['deltaNLL'], lw=2, label=name)
-                
-            plt.gca().axhline(color='black', lw=2)
-            plt.gca().axvline(color='black', lw=2)
-            plt.grid(True)
-            plt.ylabel(r'$2\times\Delta NLL$')
-            plt.xlabel(element)
-            plt.legend(loc='upper right')
-            plt.savefig(element + '.png')
+    for k, element in enumerate(args.branches):
+        plt.cla()
+        for name, (points, deltaNLL) in scans.items():
+            if args.merge:
+                x, q = Scan_helper_methods.profile(points[:, k], 2*(deltaNLL - np.min(deltaNLL))) #each scan is only sorted once per branch
+            else: #the raw 2*deltaNLL of every point, sorted along the branch
+                order = np.argsort(points[:, k], kind='stable')
+                x, q = points[order, k], 2*deltaNLL[order]
+            plt.plot(x, q, lw=2, label=name)
+            
+        plt.gca().axhline(color='black', lw=2)
+        plt.gca().axvline(color='black', lw=2)
+        for level in Scan_helper_methods.LEVELS.values():
+            plt.gca().axhline(level, color='grey', lw=1, ls='--')
+        plt.grid(True)
+        plt.ylabel(r'$2\times\Delta NLL$')
+        plt.xlabel(element)
+        plt.legend(loc='upper right')
+        plt.savefig(element + '.png')
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) #the modules live at the top of the repository
+sys.path.insert(0, os.path.join(ROOT, "generated_fits")) #and the fitting ones next to the scripts that use them
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import Binning_helper_methods
+import Adaptive_binning_helper_methods
+
+AREAS = [100, 50]
+
+
+def backgrounds():
+    rng = np.random.default_rng(4)
+    return [rng.exponential(1.5, 20000) + 6, rng.uniform(5, 10, 5000)]
+
+
+def binned_yields(samples, edges):
+    binning = Binning_helper_methods.Binning(edges, 6, 9)
+    return sum(area*binning.histogram(sample)[0]/np.sum((sample >= 6) & (sample <= 9)) for sample, area in zip(samples, AREAS))
+
+
+def test_equal_yield_edges_split_the_yield_evenly():
+    samples = backgrounds()
+    sorted_sample = Adaptive_binning_helper_methods.Sorted_sample(samples, AREAS, lowerlim=6, upperlim=9)
+    edges = Adaptive_binning_helper_methods.equal_yield_edges(sorted_sample, 10, 6, 9)
+    assert len(edges) == 11 and edges[0] == 6 and edges[-1] == 9 and np.all(np.diff(edges) > 0)
+    yields = binned_yields(samples, edges)
+    assert np.isclose(yields.sum(), sum(AREAS))
+    assert np.allclose(yields, sum(AREAS)/10, rtol=0.01)
+
+
+@pytest.mark.parametrize("min_count", [0.5, 3, 20, 149, 151])
+def test_min_count_edges_give_every_bin_enough_yield(min_count):
+    samples = backgrounds()
+    sorted_sample = Adaptive_binning_helper_methods.Sorted_sample(samples, AREAS, lowerlim=6, upperlim=9)
+    edges = Adaptive_binning_helper_methods.min_count_edges(sorted_sample, min_count, 6, 9)
+    assert edges[0] == 6 and edges[-1] == 9
+    yields = binned_yields(samples, edges)
+    assert len(yields) == 1 or yields.min() >= min_count*(1 - 1e-9)
+    assert len(yields) == 1 or np.sum(yields < 2*min_count) >= len(yields) - 1 #every bin but the last is as fine as it can be
+
+
+def test_tied_values_are_never_split():
+    tied = Adaptive_binning_helper_methods.Sorted_sample([np.repeat([6.5, 7, 7.5, 8], 100)], lowerlim=6, upperlim=9)
+    assert len(Adaptive_binning_helper_methods.equal_yield_edges(tied, 8, 6, 9)) - 1 <= 4
+    edges = Adaptive_binning_helper_methods.min_count_edges(tied, 50, 6, 9)
+    assert np.all(Binning_helper_methods.Binning(edges, 6, 9).histogram(np.repeat([6.5, 7, 7.5, 8], 100))[0] >= 50)
@@ -0,0 +1,18 @@
+import Addsyst_functions
+
+PROCESSES = ["offggH_0PM", "bkg_ggzz", "offqqH_g4", "back_qqZZ"]
+
+
+def test_add_pythiascale_is_unchanged():
+    for category, expected in (("Untagged", "CMS_pythia_scale ? 1.0075/0.9934 0.9921/1.0306 0.9985/1.0007"),
+                               ("VBFtagged", "CMS_pythia_scale ? 0.8755/1.1328 1.0082/0.9680 1.0258/0.9603"),
+                               ("", "CMS_pythia_scale ?")):
+        lines = []
+        Addsyst_functions.add_pythiascale(lines, PROCESSES, category)
+        assert lines == [expected]
+
+
+def test_pythia_scale_lnN_has_an_entry_for_every_process():
+    lines = []
+    Addsyst_functions.add_systematics(lines, PROCESSES, ["CMS_pythia_scale_lnN"], "VBFtagged")
+    assert lines == ["CMS_pythia_scale lnN 0.8755/1.1328 - 1.0082/0.9680 1.0258/0.9603"]
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+import Batch_helper_methods
+
+
+def test_category_index_rejects_codes_that_are_not_whole_numbers():
+    assert np.array_equal(Batch_helper_methods.Category_index([0., 2., 1., 5.], 3).counts, [1, 1, 1])
+    for codes in ([0, 1.5], [0, np.nan], ["0", "1"]):
+        with pytest.raises(ValueError):
+            Batch_helper_methods.Category_index(codes, 3)
+
+
+def test_empty_channels_are_skipped(tmp_path):
+    producer = Batch_helper_methods.Batch_producer(str(tmp_path), "Mass_Template", 6, 9, bins=5, categories=["Untagged", "VBFtagged"])
+    producer.add_sample("2018", "ggzz", np.array([7.0, 7.5, 20.0]), [0, 0, 1], 10, bkg=True) #VBFtagged only has an event out of range
+    assert producer.channels() == [("Untagged", "2018"), ("VBFtagged", "2018")]
+
+    with pytest.warns(UserWarning):
+        outputs = producer.produce(jobs=1, create_datacards=False)
+    assert list(outputs) == [("Untagged", "2018")]
+    assert not (tmp_path / "Mass_Template_VBFtagged_2018").exists()
+    assert "VBFtagged" not in Batch_helper_methods.combine_cards_command(outputs)
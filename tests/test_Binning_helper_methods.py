@@ -0,0 +1,18 @@
+import numpy as np
+import Binning_helper_methods
+
+
+def test_float32_samples_are_binned_against_float64_edges():
+    sample = np.array([-np.pi, 0.5, np.pi], dtype=np.float32) #both ends round outwards, past the float64 range
+    binning = Binning_helper_methods.Binning(4, -np.pi, np.pi)
+    counts, edges = binning.histogram(sample)
+    assert edges.dtype == np.float64
+    assert np.array_equal(counts, np.histogram(sample.astype(np.float64), 4, (-np.pi, np.pi))[0])
+    assert np.array_equal(counts, [0, 0, 1, 0])
+
+
+def test_float32_samples_inside_the_range_match_numpy():
+    sample = np.linspace(6, 9, 1001, dtype=np.float32)
+    binning = Binning_helper_methods.Binning(40, 6, 9)
+    assert np.array_equal(binning.histogram(sample)[0], np.histogram(sample.astype(np.float64), 40, (6, 9))[0])
+    assert np.array_equal(binning.histogram(Binning_helper_methods.as_sample(sample.astype(np.float64), np.float32))[0], binning.histogram(sample)[0])
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import Branch_cache
+
+
+def test_clear_leaves_temporary_files_being_written(tmp_path):
+    cache = Branch_cache.Branch_cache(str(tmp_path / "cache"))
+    source = tmp_path / "source.root"
+    source.write_bytes(b"")
+    cache.put(str(source), "M4L", np.arange(10.0))
+
+    path = cache._path(str(source), "M4L")
+    writing = path + ".0.tmp.npy"
+    abandoned = path + ".1.tmp.npy"
+    np.save(writing, np.arange(3.0))
+    np.save(abandoned, np.arange(3.0))
+    old = os.path.getmtime(abandoned) - 2*cache.STALE_SECONDS
+    os.utime(abandoned, (old, old))
+
+    cache.clear()
+    assert cache.entries() == [] and cache.get(str(source), "M4L") is None
+    assert os.path.exists(writing) and not os.path.exists(abandoned)
+
+
+def test_changing_the_ROOT_file_invalidates_its_entries(tmp_path):
+    import uproot
+    source = str(tmp_path / "source.root")
+    with uproot.recreate(source) as f:
+        f["tree"] = {"M4L": np.arange(5.0), "w": np.ones(5)}
+    cache = Branch_cache.Branch_cache(str(tmp_path / "cache"))
+
+    M4L, = cache.load(source, "M4L")
+    assert np.array_equal(M4L, np.arange(5.0)) and isinstance(cache.get(source, "M4L"), np.memmap)
+    assert cache.get(source, "w") is None
+
+    with uproot.recreate(source) as f:
+        f["tree"] = {"M4L": np.arange(7.0), "w": np.ones(7)}
+    os.utime(source, ns=(0, os.stat(source).st_mtime_ns + 10**9)) #in case the rewrite lands in the same tick
+    assert cache.get(source, "M4L") is None
+    assert np.array_equal(cache.load(source, "M4L")[0], np.arange(7.0))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    sources = []
+    for n in range(3):
+        sources.append(str(tmp_path / ("source" + str(n) + ".root")))
+        with open(sources[-1], "w") as f:
+            f.write(str(n))
+    array = np.zeros(1000)
+    entry_size = 128 + array.nbytes #the .npy header and the data
+    cache = Branch_cache.Branch_cache(str(tmp_path / "cache"), max_bytes=2*entry_size)
+
+    cache.put(sources[0], "M4L", array)
+    cache.put(sources[1], "M4L", array)
+    os.utime(cache._path(sources[0], "M4L"), (1, 1))
+    os.utime(cache._path(sources[1], "M4L"), (2, 2))
+    cache.get(sources[0], "M4L") #this makes source1 the least recently used
+    cache.put(sources[2], "M4L", array)
+
+    assert cache.get(sources[1], "M4L") is None
+    assert cache.get(sources[0], "M4L") is not None and cache.get(sources[2], "M4L") is not None
+    assert cache.size() <= cache.max_bytes
@@ -0,0 +1,24 @@
+import DatacardMaker_OnShell
+
+
+def read_card(output_dir, category, scale_systematics):
+    card = DatacardMaker_OnShell.write_datacard(str(output_dir), "Mass_Template.input.root", ["offggH_0PM", "bkg_ggzz"], [1.5, 2.5], 4, [], [],
+                                                verbose=False, scale_systematics=scale_systematics, category=category)
+    with open(card) as f:
+        return f.read().splitlines()
+
+
+def test_category_is_not_taken_from_the_filename(tmp_path):
+    lines = read_card(tmp_path, "VBFtagged", ["CMS_pythia_tune"])
+    assert "CMS_pythia_tune lnN 1.0105/0.9967 -" in lines
+    assert "bin Mass_Template" in lines
+    assert (tmp_path / "Mass_Template.onshell.txt").exists()
+
+
+def test_channel_systematics_cover_every_process(tmp_path):
+    systematics = DatacardMaker_OnShell.channel_systematics("2017", "Untagged")
+    assert "lumi_13TeV_2017" in systematics and "lumi_13TeV" not in systematics
+    lines = read_card(tmp_path, "Untagged", systematics)
+    assert "CMS_pythia_tune lnN 0.9985/1.0032 -" in lines
+    assert "CMS_pythia_scale lnN 1.0075/0.9934 -" in lines
+    assert DatacardMaker_OnShell.channel_systematics("2017") == DatacardMaker_OnShell.era_systematics("2017")
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import uproot
+import Scan_helper_methods
+
+
+def write_scan(filename, **branches):
+    with uproot.recreate(str(filename)) as f:
+        f["limit"] = {branch: np.asarray(values, dtype=np.float32) for branch, values in branches.items()}
+
+
+def test_aggregate_skips_failed_jobs(tmp_path):
+    write_scan(tmp_path / "good.root", RF=[0, 0.5, 1], deltaNLL=[0, 0.5, 2])
+    write_scan(tmp_path / "missing_branch.root", deltaNLL=[0, 1])
+    with uproot.recreate(str(tmp_path / "no_limit.root")) as f:
+        f["other"] = {"RF": np.zeros(2)}
+
+    with pytest.warns(UserWarning):
+        points, deltaNLL, summary = Scan_helper_methods.aggregate([str(tmp_path / name) for name in ("good.root", "missing_branch.root", "no_limit.root")], ["RF"], jobs=1)
+    assert summary["files"] == 3 and summary["files_read"] == 1
+    assert np.array_equal(points[:, 0], [0, 0.5, 1])
+    assert np.array_equal(deltaNLL, [0, 0.5, 2])
+
+
+def test_deduplicate_keeps_the_lowest_deltaNLL_of_each_point():
+    points = np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 0.0], [0.0, 0.0], [0.5, np.nan], [0.0, 1.0]])
+    deltaNLL = np.array([0.4, 2.0, 0.1, 0.0, 0.3, np.inf])
+    unique_points, unique_deltaNLL = Scan_helper_methods.deduplicate(points, deltaNLL)
+    assert np.array_equal(unique_points, [[0.0, 0.0], [0.0, 1.0], [1.0, 0.0]])
+    assert np.array_equal(unique_deltaNLL, [0.0, 2.0, 0.1])
+
+
+def test_interval_of_a_parabola():
+    x = np.linspace(-3, 3, 601)
+    q = (x - 0.5)**2 #2*deltaNLL of a measurement of 0.5 with an uncertainty of 1
+    assert np.allclose(Scan_helper_methods.interval(x, q, Scan_helper_methods.LEVELS["68"]), (-0.5, 1.5), atol=1e-4)
+    assert np.allclose(Scan_helper_methods.interval(x, q, Scan_helper_methods.LEVELS["95"]), (0.5 - 1.96, 0.5 + 1.96), atol=1e-3)
+    lower, upper = Scan_helper_methods.interval(x, q, 9)
+    assert np.isclose(lower, -2.5, atol=1e-3) and np.isnan(upper) #the scan stops before it gets to 9 on the right
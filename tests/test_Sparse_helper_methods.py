@@ -0,0 +1,28 @@
+import numpy as np
+import Binning_helper_methods
+import Sparse_helper_methods
+import Template_helper_methods
+
+
+def test_sparse_add_and_unroll_match_dense():
+    rng = np.random.default_rng(3)
+    binning = Binning_helper_methods.Binning_2D(Binning_helper_methods.Binning(60, 6, 9), Binning_helper_methods.Binning(40, 0, 1))
+    x, y, weights = rng.normal(7.5, 0.3, 2000), rng.beta(2, 5, 2000), rng.normal(0.3, 1, 2000) #some bins come out negative
+    index = binning.index(x, y)
+    weighted = Sparse_helper_methods.Sparse_histogram.from_index(index, binning, weights)
+    counts, variances = binning.fill_with_variances(index, weights)
+    assert np.allclose(weighted.to_dense()[0], counts) and np.allclose(weighted.to_dense()[1], variances)
+
+    x2, y2 = rng.uniform(6, 9, 300), rng.uniform(0, 1, 300)
+    unweighted = Sparse_helper_methods.Sparse_histogram.from_index(binning.index(x2, y2), binning).scaled(3)
+    total = Sparse_helper_methods.add([weighted.scaled(7), unweighted])
+    dense_total = Template_helper_methods.scale(counts, 7) + Template_helper_methods.scale(binning.histogram(x2, y2)[0], 3)
+    assert np.allclose(total.to_dense()[0], dense_total)
+
+    for name in ("bkg_ggzz", "ggH_0PM", "ggH_0PM_BW1BW2"):
+        sparse = Template_helper_methods.unroll_2D(total, name)
+        dense = Template_helper_methods.unroll_2D(total.to_dense()[0], name)
+        assert [part[0] for part in sparse] == [part[0] for part in dense]
+        for (_, sparse_counts, sparse_variances), (_, dense_counts, dense_variances) in zip(sparse, dense):
+            assert sparse_counts.dtype == dense_counts.dtype and np.allclose(sparse_counts, dense_counts, rtol=1e-6), name
+            assert np.allclose(sparse_variances, dense_variances, rtol=1e-5), name
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import Template_creator
+import Binning_helper_methods
+import Sparse_helper_methods
+
+
+def test_unscaled_bkgs_keep_weighted_accumulators(tmp_path):
+    binning = Binning_helper_methods.Binning(10, 6, 9)
+    x = np.linspace(6, 9, 101)[:-1]
+    weighted = Binning_helper_methods.HistogramAccumulator(binning)
+    weighted.fill(x, np.full(len(x), 0.5))
+
+    creator = Template_creator.Template_Creator_1D(str(tmp_path), "bkgs", [weighted, x], ["weighted", "unweighted"], [1, 1], 6, 9)
+    overall, edges = creator.scale_and_add_bkgs(binning, scaleTo=False)
+    assert np.allclose(overall, np.histogram(x, edges)[0]*1.5)
+
+
+def test_unscaled_unweighted_bkgs_stay_integers(tmp_path):
+    x = np.linspace(6, 9, 101)[:-1]
+    creator = Template_creator.Template_Creator_1D(str(tmp_path), "bkgs", [x, x], ["a", "b"], [1, 1], 6, 9)
+    overall, edges = creator.scale_and_add_bkgs(10, scaleTo=False)
+    assert overall.dtype.kind == "i"
+    assert np.array_equal(overall, 2*np.histogram(x, edges)[0])
+
+
+def test_only_1D_templates_are_made_into_datacards_in_process():
+    edges = np.linspace(6, 9, 4)
+    counts_2D = np.ones((3, 2))
+    assert Template_creator.Template_creator._all_1D({"bkg_a": (np.ones(3), edges), "bkg_b": (np.zeros(3), edges)})
+    assert not Template_creator.Template_creator._all_1D({"bkg_a": (np.ones(3), edges), "bkg_b": (counts_2D, edges, np.linspace(0, 1, 3))})
+    assert not Template_creator.Template_creator._all_1D({"bkg_a": Sparse_helper_methods.Sparse_histogram.from_dense(counts_2D, (edges, np.linspace(0, 1, 3)))})
+
+
+def test_scripts_are_not_run_with_systematics_they_ignore(tmp_path):
+    x = np.linspace(6, 9, 101)[:-1]
+    creator = Template_creator.Template_Creator_1D(str(tmp_path), "bkgs", [x], ["bkg_a"], [1], 6, 9)
+    creator.category = "Untagged"
+    creator.templates = {"bkg_a": Sparse_helper_methods.Sparse_histogram.from_dense(np.ones((3, 2)), (np.linspace(6, 9, 4), np.linspace(0, 1, 3)))}
+    with pytest.raises(ValueError):
+        creator.create_datacards()
+
+
+def test_failed_scripts_are_not_reported_as_remade(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) #the scripts are not here, so running them fails
+    x = np.linspace(6, 9, 101)[:-1]
+    creator = Template_creator.Template_Creator_1D(str(tmp_path), "bkgs", [x], ["bkg_a"], [1], 6, 9)
+    (tmp_path / "bkgs.root").write_bytes(b"")
+    with pytest.raises(RuntimeError):
+        creator.create_datacards()
+
+
+def interference_creator(output_directory, bkg_areas, cross_sections, areas, seed=1):
+    rng = np.random.default_rng(seed)
+    def breit_wigner(mass, n):
+        return rng.standard_cauchy(n)*0.3 + mass
+    signals = [breit_wigner(7, 2000), breit_wigner(7.5, 2000), breit_wigner(8, 2000)]
+    signals += [np.concatenate([breit_wigner(7, 1000), breit_wigner(7.5, 1000)]) for _ in range(6)]
+    bkgs = [rng.uniform(6, 9, 4000), rng.uniform(6, 9, 1000)]
+    return Template_creator.Interf_Reso_template_creator_1D(str(output_directory), "T", bkgs, ["ggzz", "qqzz"], bkg_areas, 6, 9,
+                                                            *signals, *cross_sections, 20, *areas)
+
+
+def test_template_grid_matches_freshly_built_creators(tmp_path):
+    cross_sections = [1.0, 1.2, 0.8, 2.1, 1.9, 1.7, 1.6, 2.2, 2.0]
+    creator = interference_creator(tmp_path / "grid", [100, 50], cross_sections, [10, 20, 30])
+    grid = creator.create_template_grid([{}, {"name": "moved", "area1": 5, "bkg_areas": {"qqzz": 7}, "CS_BW12_0_0": 3.0}])
+
+    assert list(grid["point_0"]) == list(creator.templates)
+    for name, (counts, _) in creator.templates.items():
+        assert np.allclose(grid["point_0"][name][0], counts), name
+
+    fresh = interference_creator(tmp_path / "fresh", [100, 7], cross_sections[:3] + [3.0] + cross_sections[4:], [5, 20, 30])
+    assert list(grid["moved"]) == list(fresh.templates)
+    for name, (counts, _) in fresh.templates.items():
+        assert np.allclose(grid["moved"][name][0], counts), name
+    assert (tmp_path / "grid" / "moved" / "T.root").exists()
+
+
+def test_datacards_are_only_remade_when_their_inputs_change(tmp_path):
+    x = np.linspace(6, 9, 101)[:-1]
+    creator = Template_creator.Template_Creator_1D(str(tmp_path), "T", [x], ["bkg_a"], [10], 6, 9)
+    creator.templates["bkg_a"] = creator.scaled_template("bkg_a", 10)
+    out_folder = str(tmp_path / "T_out") + "/"
+
+    def run():
+        creator.write_templates()
+        return creator.create_datacards()
+
+    assert run() == [out_folder + "T.input.root", out_folder + "T.onshell.txt"]
+    assert run() == []
+    creator.scale_systematics = creator.scale_systematics + ["EWcorr_qqZZ"]
+    assert run() == [out_folder + "T.onshell.txt"]
+    with open(out_folder + "T.onshell.txt") as f:
+        assert "EWcorr_qqZZ lnN" in f.read()
+    creator.templates["bkg_a"] = creator.scaled_template("bkg_a", 5)
+    assert run() == [out_folder + "T.input.root", out_folder + "T.onshell.txt"]